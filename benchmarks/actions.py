@@ -0,0 +1,81 @@
+"""
+Action canonicalizer benchmark.
+Runs a corpus of typical democracy votes through `parse_action`, both with a cold cache (every input new)
+and a warm one (the same few inputs repeated, as happens when a channel votes together).
+
+Run from the repository root with `python -m benchmarks.actions [count]`.
+"""
+
+import sys
+import time
+import random
+
+from modules.actions import ActionCanonicalizer
+
+VOTES = [
+    "n",
+    "N",
+    "north",
+    "go north",
+    "Go North",
+    "walk north",
+    "s",
+    "south",
+    "e",
+    "east",
+    "w",
+    "west",
+    "ne",
+    "sw",
+    "up",
+    "u",
+    "down",
+    "x lamp",
+    "examine lamp",
+    "X  Lamp",
+    "look",
+    "l",
+    "look at lamp",
+    "l lamp",
+    "i",
+    "inv",
+    "inventory",
+    "z",
+    "wait",
+    "take lamp",
+    "get lamp",
+    "open door",
+    "open the door",
+    "ENTER",
+    "[enter]",
+    "<space>",
+    "save",
+    "restore",
+    "read leaflet",
+]
+
+
+def bench(actions, votes):
+    start = time.perf_counter()
+
+    for vote in votes:
+        actions.parse(vote)
+
+    return len(votes) / (time.perf_counter() - start)
+
+
+def main(count):
+    votes = [random.choice(VOTES) for _ in range(count)]
+    unique = ["{} {}".format(random.choice(VOTES), x) for x in range(count)]
+
+    actions = ActionCanonicalizer()
+    print("cold (all unique) {:>12,.0f} actions/s".format(bench(actions, unique)))
+
+    actions = ActionCanonicalizer()
+    print("warm (typical)    {:>12,.0f} actions/s".format(bench(actions, votes)))
+    print("distinct actions  {:>12}".format(len({actions.parse(x) for x in VOTES})))
+    print("cache             {}".format(actions.parse.cache_info()))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
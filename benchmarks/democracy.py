@@ -0,0 +1,109 @@
+"""
+Democracy mode load test.
+Casts thousands of votes into a single voting window of a `GameChannel`, with a fake channel that only counts
+what would have been sent to Discord, and reports votes/s plus the number of outbound messages and edits.
+
+Run from the repository root with `python -m benchmarks.democracy [voters] [actions]`.
+"""
+
+from types import SimpleNamespace
+from datetime import datetime
+
+import sys
+import tempfile
+import time
+import random
+import asyncio
+
+import modules.game_channel as game_channel
+from modules.game_channel import GameChannel, InputMode
+from modules.game import Game
+from modules.input_queue import QueuePolicy
+from modules.timer_wheel import TimerWheel
+from modules.perm_cache import PermissionCache
+from modules.transcripts import TranscriptWriter
+
+ACTIONS = [
+    "north",
+    "n",
+    "go north",
+    "s",
+    "take lamp",
+    "open door",
+    "x mailbox",
+    "look",
+    "l",
+    "i",
+    "wait",
+]
+
+
+class FakeMessage:
+    def __init__(self, counter):
+        self.counter = counter
+
+    async def edit(self, **kwargs):
+        self.counter["edits"] += 1
+
+
+class FakeChannel:
+    id = 1
+
+    def __init__(self):
+        self.counter = {"sends": 0, "edits": 0}
+
+    async def send(self, *args, **kwargs):
+        self.counter["sends"] += 1
+        return FakeMessage(self.counter)
+
+
+async def run(voters, actions, window):
+    channel = FakeChannel()
+    msg = SimpleNamespace(
+        created_at=datetime.utcnow(), author=SimpleNamespace(id=0), channel=channel
+    )
+    xyzzy = SimpleNamespace(
+        perms=PermissionCache(),
+        input_queue_size=10,
+        input_queue_policy=QueuePolicy.REJECT,
+        timers=TimerWheel(tick=0.05),
+        recap_size=32 * 1024,
+        transcripts=TranscriptWriter(tempfile.mkdtemp()),
+    )
+    chan = GameChannel(msg, Game("bench", {"path": "bench.z5"}), xyzzy)
+    chan.mode = InputMode.DEMOCRACY
+    pool = ACTIONS + ["take thing {}".format(x) for x in range(actions - len(ACTIONS))]
+    votes = [
+        (SimpleNamespace(author=SimpleNamespace(id=x)), random.choice(pool))
+        for x in range(voters)
+    ]
+
+    start = time.perf_counter()
+
+    for i, (vote, action) in enumerate(votes):
+        await chan.handle_input(vote, action)
+
+        # Spread the votes out over the window so the tally gets a chance to be edited.
+        if i % max(1, voters // 100) == 0:
+            await asyncio.sleep(window / 100)
+
+    elapsed = time.perf_counter() - start - window
+    chan.stop_timers()
+
+    print(
+        "{:,} votes over {} actions: {:,.0f} votes/s (excluding sleeps), {} messages sent, {} edits".format(
+            voters,
+            len(chan.votes.counts),
+            voters / max(elapsed, 1e-9),
+            channel.counter["sends"],
+            channel.counter["edits"],
+        )
+    )
+    print(chan.votes.render(5))
+
+
+if __name__ == "__main__":
+    game_channel.TALLY_INTERVAL = 0.1
+    voters = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    actions = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    asyncio.run(run(voters, actions, 1))
@@ -0,0 +1,126 @@
+"""
+Dispatch micro-benchmark.
+Pushes mock messages through `Xyzzy.on_message` and reports messages/s for each kind of traffic.
+Needs the same environment as running the bot itself (disnake, aiohttp, dfrotz in PATH), but never connects to Discord.
+
+Run from the repository root with `python -m benchmarks.dispatch [count]`.
+"""
+
+from types import SimpleNamespace
+from datetime import datetime
+
+import os
+import re
+import sys
+import tempfile
+import time
+import asyncio
+import disnake as discord
+
+from modules.block_index import BlockIndex
+from modules.command_sys import Command, Holder
+from modules.command_stats import CommandStats
+from modules.perm_cache import PermissionCache
+from modules.rate_limit import DEFAULT_LIMITS, RateLimiter
+from modules.store import Store
+from modules.timer_wheel import TimerWheel
+from xyzzy import Xyzzy
+
+BOT_ID = 171288238659600384
+
+
+class BenchXyzzy(Xyzzy):
+    # Shadow the client properties so the benchmark can fill them in without a gateway connection.
+    user = None
+
+
+class FakeSession:
+    playing = True
+    last = None
+
+    async def handle_input(self, msg, input):
+        pass
+
+
+class FakeSessions(dict):
+    def touch(self, chan, when):
+        chan.last = when
+
+
+async def noop(cls, ctx):
+    ctx.args
+
+
+async def send(*args, **kwargs):
+    pass
+
+
+def make_bot():
+    bot = BenchXyzzy.__new__(BenchXyzzy)
+    bot.user = SimpleNamespace(id=BOT_ID)
+    bot.prefix = re.compile(rf"^<@!?{BOT_ID}>(.*)")
+    bot.perms = PermissionCache()
+    store = Store(os.path.join(tempfile.mkdtemp(), "bench.db"))
+    store.put("blocked_users", "1", [str(x) for x in range(1000)])
+    bot.blocked_users = BlockIndex(store.namespace("blocked_users"))
+    bot.sessions = FakeSessions({10: FakeSession()})
+    # Limits high enough to never drop anything, so the buckets are still checked for every message.
+    limits = {opt: "1000000000/1" for opt in DEFAULT_LIMITS}
+    bot.command_limits = RateLimiter("command", limits)
+    bot.input_limits = RateLimiter("input", limits)
+    bot.timers = TimerWheel()
+    bot.commands = Holder(bot)
+    bot.command_stats = CommandStats(bot)
+    bot.commands.middleware.append(bot.command_stats)
+    bot.commands.commands["play"] = Command(noop, name="play")
+
+    return bot
+
+
+def make_message(content, channel_id=10):
+    me = SimpleNamespace(top_role=SimpleNamespace(colour=discord.Colour.default()))
+    guild = SimpleNamespace(id=1, name="Bench", me=me)
+    channel = SimpleNamespace(
+        id=channel_id,
+        guild=guild,
+        send=send,
+        permissions_for=lambda member: discord.Permissions.all(),
+    )
+
+    return SimpleNamespace(
+        author=SimpleNamespace(id=5000, bot=False, name="bench", send=send),
+        reference=None,
+        guild=guild,
+        channel=channel,
+        content=content,
+        created_at=datetime.utcnow(),
+    )
+
+
+CASES = {
+    "chatter": make_message("just talking about zork"),
+    "game input": make_message("<@{}> >open mailbox".format(BOT_ID)),
+    "command": make_message('<@{}> play "Zork I"'.format(BOT_ID)),
+    "unknown command": make_message("<@!{}> xyzzy plugh".format(BOT_ID)),
+}
+
+
+async def bench(bot, msg, count):
+    start = time.perf_counter()
+
+    for _ in range(count):
+        await bot.on_message(msg)
+
+    return count / (time.perf_counter() - start)
+
+
+async def main(count):
+    bot = make_bot()
+
+    for name, msg in CASES.items():
+        await bench(bot, msg, count // 10)  # warm up
+        print("{:<16} {:>12,.0f} msg/s".format(name, await bench(bot, msg, count)))
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000))
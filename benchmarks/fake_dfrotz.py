@@ -0,0 +1,41 @@
+"""
+Stand-in for dfrotz, for load tests. Prints a banner, then answers every line of input after a delay,
+with a set amount of text, until it gets "quit". Command line arguments are ignored, just like a real game's flags would be.
+
+FAKE_DFROTZ_OUTPUT sets how many bytes of text each turn prints (default 400),
+and FAKE_DFROTZ_DELAY how many seconds each turn takes (default 0.01).
+"""
+
+import os
+import sys
+import time
+
+OUTPUT = int(os.environ.get("FAKE_DFROTZ_OUTPUT", 400))
+DELAY = float(os.environ.get("FAKE_DFROTZ_DELAY", 0.01))
+LINE = "It is pitch black. You are likely to be eaten by a grue. "
+
+
+def text(size):
+    body = (LINE * (size // len(LINE) + 1))[:size]
+    # Wrap like an 80 column screen would.
+    return "\n".join(body[i : i + 79] for i in range(0, len(body), 79))
+
+
+def main():
+    out = sys.stdout
+    out.write("Fake Interpreter\nA load test in one act.\n\n>")
+    out.flush()
+
+    for line in sys.stdin:
+        line = line.strip()
+
+        if line == "quit":
+            break
+
+        time.sleep(DELAY)
+        out.write("{}\n{}\n\n>".format(line, text(OUTPUT)))
+        out.flush()
+
+
+if __name__ == "__main__":
+    main()
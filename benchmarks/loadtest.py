@@ -0,0 +1,469 @@
+"""
+End-to-end load test.
+Starts a real `Xyzzy` in a scratch directory, with a stand-in for Discord's REST API (fake channels that count requests
+and take a set time to answer) and `benchmarks/fake_dfrotz.py` standing in for the interpreter.
+Sessions are started with real `play` messages through `on_message`, ramped up to the number asked for,
+and each one then plays in a loop: send input, wait for the game's output to reach the fake channel, think, repeat.
+
+Reports event loop lag, CPU and RSS (the bot's, and per session including the interpreters),
+input-to-output latency percentiles, and outbound requests per second.
+Results are written as JSON, and `--compare` shows how a run differs from an earlier one.
+
+The harness deliberately stays in-process: Discord is faked at the channel and message objects, not with a local
+REST or gateway server. It measures the bot's own work per message and per turn, and how many requests it makes,
+but not the library's HTTP and websocket overhead, its rate limit buckets, or how the bot copes with 429s,
+which are only simulated as a fixed `--latency` per request.
+
+Run from the repository root with `python -m benchmarks.loadtest --sessions 100`.
+"""
+
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from types import SimpleNamespace
+
+import io
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import resource
+import tempfile
+import disnake as discord
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BOT_ID = 171288238659600384
+GAME = "Load Test"
+
+
+class FakeDiscord:
+    """Stands in for the REST API: every send or edit is a request, which takes `latency` seconds."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.requests = 0
+        self.times = []
+        # Channel ID -> future resolved by the next game output sent there.
+        self.waiting = {}
+        self.guild = SimpleNamespace(
+            id=1,
+            name="Load Test",
+            me=SimpleNamespace(
+                top_role=SimpleNamespace(colour=discord.Colour.default())
+            ),
+        )
+
+    async def request(self, channel_id=None, embed=None):
+        self.requests += 1
+        self.times.append(time.monotonic())
+        await asyncio.sleep(self.latency)
+
+        # Game output is the only thing sent as an embed.
+        future = self.waiting.pop(channel_id, None) if embed else None
+
+        if future and not future.done():
+            future.set_result(time.monotonic())
+
+        return FakeMessage(self)
+
+
+class FakeMessage:
+    def __init__(self, discord):
+        self.discord = discord
+
+    async def edit(self, **kwargs):
+        await self.discord.request()
+
+
+class FakeChannel:
+    def __init__(self, discord, id):
+        self.discord = discord
+        self.id = id
+        self.name = "load-{}".format(id)
+        self.guild = discord.guild
+
+    def permissions_for(self, member):
+        return discord.Permissions.all()
+
+    async def send(self, content=None, *, embed=None, **kwargs):
+        return await self.discord.request(self.id, embed)
+
+
+def message(channel, content, author_id):
+    author = SimpleNamespace(
+        id=author_id, bot=False, name="load", mention="<@{}>".format(author_id)
+    )
+
+    return SimpleNamespace(
+        author=author,
+        reference=None,
+        guild=channel.guild,
+        channel=channel,
+        content=content,
+        attachments=[],
+        mentions=[],
+        channel_mentions=[],
+        created_at=discord.utils.utcnow(),
+    )
+
+
+def percentiles(values, points=(50, 90, 99)):
+    if not values:
+        return {}
+
+    values = sorted(values)
+    out = {
+        "p{}".format(p): values[min(len(values) - 1, len(values) * p // 100)]
+        for p in points
+    }
+    out["max"] = values[-1]
+    out["mean"] = sum(values) / len(values)
+    return out
+
+
+def rss_kib(pid="self"):
+    """Resident set size of a process from /proc, in KiB, or 0 if it can't be read."""
+    try:
+        with open("/proc/{}/status".format(pid)) as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+
+    return 0
+
+
+async def lag_sampler(samples, interval=0.05):
+    """Measures how late the event loop wakes up from a short sleep."""
+    loop = asyncio.get_running_loop()
+
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(loop.time() - start - interval)
+
+
+def setup(args):
+    """Makes a scratch directory for the bot to run in, and puts the fake interpreter in PATH."""
+    work = tempfile.mkdtemp(prefix="xyzzy-load-")
+    bin_dir = os.path.join(work, "bin")
+    os.makedirs(bin_dir)
+
+    with open(os.path.join(bin_dir, "dfrotz"), "w") as f:
+        f.write(
+            '#!/bin/sh\nexec {} {} "$@"\n'.format(
+                sys.executable, os.path.join(ROOT, "benchmarks", "fake_dfrotz.py")
+            )
+        )
+
+    os.chmod(os.path.join(bin_dir, "dfrotz"), 0o755)
+    open(os.path.join(work, "load.z5"), "w").close()
+
+    with open(os.path.join(work, "games.json"), "w") as f:
+        json.dump({GAME: {"path": os.path.join(work, "load.z5")}}, f)
+
+    with open(os.path.join(work, "options.cfg"), "w") as f:
+        f.write("[Config]\ntoken = load-test\nidle_timeout = 0\n")
+
+        # Nothing should get dropped by the rate limiter.
+        for kind in ("command", "input"):
+            for scope in ("user", "channel", "guild"):
+                f.write("{}_limit_{} = 0\n".format(kind, scope))
+
+    os.environ["PATH"] = bin_dir + os.pathsep + os.environ["PATH"]
+    os.environ["FAKE_DFROTZ_OUTPUT"] = str(args.output)
+    os.environ["FAKE_DFROTZ_DELAY"] = str(args.delay)
+    os.chdir(work)
+    sys.path.insert(0, ROOT)
+
+    return work
+
+
+async def player(bot, fake, channel, author_id, args, latencies, stop):
+    """One session: starts a game, then keeps sending input and waiting for the answer."""
+    loop = asyncio.get_running_loop()
+    fake.waiting[channel.id] = loop.create_future()
+    await bot.on_message(
+        message(channel, "<@{}> play {}".format(BOT_ID, GAME), author_id)
+    )
+    await fake.waiting[channel.id]
+
+    turn = 0
+
+    while not stop.is_set():
+        await asyncio.sleep(random.uniform(0, args.think * 2))
+
+        future = fake.waiting[channel.id] = loop.create_future()
+        start = time.monotonic()
+        await bot.on_message(
+            message(channel, "<@{}> >go {}".format(BOT_ID, turn), author_id)
+        )
+
+        try:
+            end = await asyncio.wait_for(future, args.timeout)
+            latencies.append(end - start)
+        except asyncio.TimeoutError:
+            latencies.append(float("inf"))
+
+        turn += 1
+
+
+async def run(args):
+    from xyzzy import Xyzzy
+
+    class LoadXyzzy(Xyzzy):
+        # Shadow the client properties so they can be filled in without a gateway connection.
+        user = None
+
+        async def change_presence(self, **kwargs):
+            await fake.request()
+
+    fake = FakeDiscord(args.latency)
+    noise = io.StringIO()
+
+    with redirect_stdout(noise):
+        bot = LoadXyzzy()
+
+    bot.user = SimpleNamespace(id=BOT_ID, name="xyzzy", mention="<@{}>".format(BOT_ID))
+    bot.prefix = re.compile(rf"^<@!?{BOT_ID}>(.*)")
+    bot.home_channel = None
+    bot.commands.load_module("commands.main")
+
+    lag = []
+    latencies = []
+    stop = asyncio.Event()
+    sampler = asyncio.ensure_future(lag_sampler(lag))
+    rss_start = rss_kib()
+    cpu_start = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.monotonic()
+    players = []
+
+    with redirect_stdout(noise):
+        for i in range(args.sessions):
+            channel = FakeChannel(fake, 1000 + i)
+            players.append(
+                asyncio.ensure_future(
+                    player(bot, fake, channel, 5000 + i, args, latencies, stop)
+                )
+            )
+            await asyncio.sleep(args.ramp / args.sessions)
+
+        ramped = time.monotonic()
+        requests_ramped = fake.requests
+        await asyncio.sleep(args.duration)
+
+        # Measure the interpreters while they're all still running.
+        children_rss = sum(
+            rss_kib(x.engine.process.pid) for x in bot.sessions if x.engine.process
+        )
+        rss_end = rss_kib()
+        # What the bot thinks its sessions cost, to check against what was measured.
+        estimated_heap = (
+            sum(bot.sessions.memory_of(x).heap for x in bot.sessions) / 1024
+        )
+        cpu_end = resource.getrusage(resource.RUSAGE_SELF)
+        sessions = len(bot.sessions)
+        end = time.monotonic()
+
+        stop.set()
+        await asyncio.wait(players, timeout=args.timeout)
+
+        for task in players:
+            task.cancel()
+
+        sampler.cancel()
+        await bot.sessions.shutdown()
+        bot.transcripts.close()
+        bot.store.close()
+        await bot.session.close()
+
+    cpu = (cpu_end.ru_utime + cpu_end.ru_stime) - (
+        cpu_start.ru_utime + cpu_start.ru_stime
+    )
+    steady = [x for x in fake.times if ramped <= x <= end]
+    per_second = {}
+
+    for x in steady:
+        per_second[int(x - ramped)] = per_second.get(int(x - ramped), 0) + 1
+
+    return {
+        "config": vars(args),
+        "sessions": sessions,
+        "turns": len(latencies),
+        "timeouts": sum(1 for x in latencies if x == float("inf")),
+        "elapsed": end - start,
+        "event_loop_lag": percentiles(lag),
+        "latency": percentiles([x for x in latencies if x != float("inf")]),
+        "cpu": {
+            "seconds": cpu,
+            "percent": cpu / (end - start) * 100,
+            "percent_per_session": cpu / (end - start) * 100 / max(1, sessions),
+        },
+        "rss_kib": {
+            "bot_start": rss_start,
+            "bot_end": rss_end,
+            "bot_per_session": (rss_end - rss_start) / max(1, sessions),
+            "interpreters": children_rss,
+            "total_per_session": ((rss_end - rss_start) + children_rss)
+            / max(1, sessions),
+            "estimated_heap_per_session": estimated_heap / max(1, sessions),
+        },
+        "requests": {
+            "total": fake.requests,
+            "during_ramp": requests_ramped,
+            "per_second": len(steady) / max(end - ramped, 1e-9),
+            "peak_per_second": max(per_second.values(), default=0),
+        },
+    }
+
+
+def report(results, previous=None):
+    def row(name, value, key=None, unit="", scale=1):
+        line = "{:<32} {:>12.3f}{}".format(name, value * scale, unit)
+
+        if previous and key:
+            old = previous
+
+            for part in key.split("."):
+                old = old.get(part, {}) if isinstance(old, dict) else {}
+
+            if isinstance(old, (int, float)) and old:
+                line += "  ({:+.1f}% vs previous)".format((value - old) / old * 100)
+
+        print(line)
+
+    print(
+        "{} sessions, {} turns, {} timed out".format(
+            results["sessions"], results["turns"], results["timeouts"]
+        )
+    )
+
+    for point in ("p50", "p90", "p99", "max"):
+        if point in results["latency"]:
+            row(
+                "latency " + point,
+                results["latency"][point],
+                "latency." + point,
+                "ms",
+                1000,
+            )
+
+    for point in ("p50", "p99", "max"):
+        if point in results["event_loop_lag"]:
+            row(
+                "event loop lag " + point,
+                results["event_loop_lag"][point],
+                "event_loop_lag." + point,
+                "ms",
+                1000,
+            )
+
+    row("cpu", results["cpu"]["percent"], "cpu.percent", "%")
+    row(
+        "cpu per session",
+        results["cpu"]["percent_per_session"],
+        "cpu.percent_per_session",
+        "%",
+    )
+    row(
+        "bot rss per session",
+        results["rss_kib"]["bot_per_session"],
+        "rss_kib.bot_per_session",
+        "KiB",
+    )
+    row(
+        "estimated heap per session",
+        results["rss_kib"]["estimated_heap_per_session"],
+        "rss_kib.estimated_heap_per_session",
+        "KiB",
+    )
+    row(
+        "total rss per session",
+        results["rss_kib"]["total_per_session"],
+        "rss_kib.total_per_session",
+        "KiB",
+    )
+    row("requests/s", results["requests"]["per_second"], "requests.per_second")
+    row(
+        "peak requests/s",
+        results["requests"]["peak_per_second"],
+        "requests.peak_per_second",
+    )
+
+
+def main():
+    parser = ArgumentParser(
+        description="Load tests the bot against a fake Discord and a fake interpreter."
+    )
+    parser.add_argument(
+        "--sessions", type=int, default=50, help="concurrent sessions to ramp up to"
+    )
+    parser.add_argument(
+        "--ramp", type=float, default=10, help="seconds to spend starting sessions"
+    )
+    parser.add_argument(
+        "--duration", type=float, default=30, help="seconds to run at full load"
+    )
+    parser.add_argument(
+        "--think",
+        type=float,
+        default=1,
+        help="mean seconds a player waits between turns",
+    )
+    parser.add_argument(
+        "--output", type=int, default=400, help="bytes the interpreter prints per turn"
+    )
+    parser.add_argument(
+        "--delay",
+        type=float,
+        default=0.01,
+        help="seconds the interpreter takes per turn",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.05,
+        help="seconds each fake REST request takes",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=30,
+        help="most seconds to wait for a turn's output",
+    )
+    parser.add_argument(
+        "--json", default="loadtest.json", help="where to write the results"
+    )
+    parser.add_argument(
+        "--compare", help="results of an earlier run to compare against"
+    )
+    args = parser.parse_args()
+
+    out = os.path.abspath(args.json)
+    previous = None
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+
+    work = setup(args)
+
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(work, ignore_errors=True)
+
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+
+    report(results, previous)
+    print("\nResults written to {}".format(out))
+
+
+if __name__ == "__main__":
+    main()
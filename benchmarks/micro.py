@@ -0,0 +1,471 @@
+"""
+Micro-benchmarks for the pure, hot functions: action canonicalizing, game output parsing, command context and argument parsing,
+message splitting, the game search in `play`, and Quetzal/z-code header parsing.
+Each one runs over a fixture corpus and reports calls/s, plus the peak bytes allocated by a single call (measured with tracemalloc).
+
+Results are compared against `micro_baseline.json`, and anything more than --tolerance slower, or allocating that much more,
+is flagged as a regression (and the exit code is 1). Baselines are only meaningful on the machine that made them,
+so refresh the file with --save after pulling, before measuring a change.
+Allocations come out the same on every run, but timings on a busy machine can easily wander by 20%.
+Text fixtures live in `benchmarks/fixtures/`. Stories and saves are built on the fly with real header layouts,
+since no game files can be shipped.
+
+Run from the repository root with `python -m benchmarks.micro [--only NAME] [--save] [--tolerance 0.3]`.
+"""
+
+from argparse import ArgumentParser
+from datetime import datetime
+from io import BytesIO
+from types import SimpleNamespace
+
+import gc
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import struct
+import asyncio
+import tempfile
+import tracemalloc
+import warnings
+import disnake as discord
+
+with warnings.catch_warnings():
+    # quetzal_parser uses the deprecated `chunk` module.
+    warnings.simplefilter("ignore", DeprecationWarning)
+    from modules import quetzal_parser
+
+from benchmarks.actions import VOTES
+from modules.actions import ActionCanonicalizer, parse_action
+from modules.command_sys import ArgumentParseError, Context, Envelope
+from modules.game import Game, find_games
+from modules.game_channel import GameChannel
+from modules.input_queue import QueuePolicy
+from modules.perm_cache import PermissionCache
+from modules.timer_wheel import TimerWheel
+from modules.transcripts import TranscriptWriter
+
+BOT_ID = 171288238659600384
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+BASELINE = os.path.join(os.path.dirname(__file__), "micro_baseline.json")
+# Bytes of allocation a benchmark may grow by before it counts, so tiny ones aren't flagged over noise.
+ALLOC_SLACK = 256
+# Timed runs per benchmark, of which the fastest is kept.
+REPEAT = 9
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """
+    Registers a benchmark. The decorated function sets it up (given a stand-in bot and a scratch directory)
+    and returns the function to call and a list of argument tuples to cycle through.
+    """
+
+    def decorator(setup):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return decorator
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def chat_lines():
+    return [
+        x.replace("<@bot>", "<@{}>".format(BOT_ID)).replace(
+            "<@!bot>", "<@!{}>".format(BOT_ID)
+        )
+        for x in fixture("chat.txt").splitlines()
+        if x and not x.startswith("#")
+    ]
+
+
+def turns():
+    """The fixture transcript split into what dfrotz prints for each turn, as raw bytes."""
+    text = fixture("transcript.txt")
+
+    return [
+        (turn if i == 0 else ">" + turn).encode("latin-1", "replace")
+        for i, turn in enumerate(text.split("\n>"))
+    ]
+
+
+def story(version, release, serial, size, seed):
+    """A z-code story file with a real header (and checksum) and random code and data behind it."""
+    rand = random.Random(seed)
+    data = bytearray(rand.randbytes(size))
+    header = bytearray(0x40)
+    header[0] = version
+    struct.pack_into(">H", header, 0x02, release)
+    struct.pack_into(">H", header, 0x04, 0xC000)  # high memory
+    struct.pack_into(">H", header, 0x06, 0xC001)  # initial PC
+    struct.pack_into(">H", header, 0x08, 0x3000)  # dictionary
+    struct.pack_into(">H", header, 0x0A, 0x0400)  # object table
+    struct.pack_into(">H", header, 0x0C, 0x2000)  # globals
+    struct.pack_into(">H", header, 0x0E, 0x8000)  # static memory
+    header[0x12:0x18] = serial.encode("ascii")
+    # File length, in units that depend on the version.
+    struct.pack_into(
+        ">H", header, 0x1A, size // (2 if version <= 3 else 4 if version <= 5 else 8)
+    )
+    data[:0x40] = header
+    struct.pack_into(">H", data, 0x1C, sum(data[0x40:]) & 0xFFFF)
+
+    return bytes(data)
+
+
+def chunk(name, data):
+    return (
+        name + struct.pack(">I", len(data)) + data + (b"\0" if len(data) % 2 else b"")
+    )
+
+
+def save(story_data, seed):
+    """A Quetzal save for `story_data`: IFhd, then compressed memory and stack chunks like a real interpreter writes."""
+    rand = random.Random(seed)
+    ifhd = (
+        story_data[2:4] + story_data[0x12:0x18] + story_data[0x1C:0x1E] + b"\0\x12\x34"
+    )
+    # Compressed memory is mostly runs of zeroes (unchanged bytes) broken by changed ones.
+    cmem = bytearray()
+
+    for _ in range(rand.randint(300, 900)):
+        cmem += bytes([0, rand.randint(0, 255)]) + rand.randbytes(rand.randint(1, 6))
+
+    stks = rand.randbytes(rand.randint(64, 512))
+    body = b"IFZS" + chunk(b"IFhd", ifhd) + chunk(b"CMem", bytes(cmem))
+    body += chunk(b"Stks", stks) + chunk(b"ANNO", b"Saved by xyzzy's benchmarks")
+
+    return b"FORM" + struct.pack(">I", len(body)) + body
+
+
+class FakeChannel:
+    id = 1
+    name = "bench"
+    guild = SimpleNamespace(
+        id=1,
+        me=SimpleNamespace(top_role=SimpleNamespace(colour=discord.Colour.default())),
+    )
+
+    def permissions_for(self, member):
+        return discord.Permissions.all()
+
+    async def send(self, *args, **kwargs):
+        pass
+
+
+def fake_xyzzy(scratch):
+    os.makedirs(os.path.join(scratch, "transcripts"))
+
+    return SimpleNamespace(
+        user=SimpleNamespace(id=BOT_ID),
+        prefix=re.compile(rf"^<@!?{BOT_ID}>(.*)"),
+        perms=PermissionCache(),
+        input_queue_size=10,
+        input_queue_policy=QueuePolicy.REJECT,
+        timers=TimerWheel(),
+        recap_size=32 * 1024,
+        transcripts=TranscriptWriter(os.path.join(scratch, "transcripts")),
+    )
+
+
+def fake_message(content):
+    return SimpleNamespace(
+        content=content,
+        reference=None,
+        channel=FakeChannel(),
+        author=SimpleNamespace(id=5000, bot=False),
+        created_at=datetime.utcnow(),
+    )
+
+
+@benchmark("parse_action (cached)")
+def bench_parse_action(xyzzy, scratch):
+    return parse_action, [(x,) for x in VOTES]
+
+
+@benchmark("parse_action (uncached)")
+def bench_parse_action_cold(xyzzy, scratch):
+    # `_parse` is what the cache wraps, so every call does the full normalise and lookup.
+    return ActionCanonicalizer({"climb tree": "up"})._parse, [(x,) for x in VOTES]
+
+
+@benchmark("game output")
+def bench_output(xyzzy, scratch):
+    msg = SimpleNamespace(
+        created_at=datetime.utcnow(),
+        author=SimpleNamespace(id=0),
+        channel=FakeChannel(),
+    )
+    chan = GameChannel(msg, Game("bench", {"path": "bench.z5"}), xyzzy)
+    chan.engine.save_path = os.path.join(scratch, "saves")
+    chan.engine.first_time = False
+    chan.engine.indent = 1
+
+    return chan.engine._output, [(x,) for x in turns()]
+
+
+@benchmark("Context + args")
+def bench_context(xyzzy, scratch):
+
+    def parse(msg):
+        envelope = Envelope.parse(msg, xyzzy)
+
+        if envelope is None:
+            return
+
+        ctx = Context(msg, xyzzy, envelope)
+
+        try:
+            return ctx.args
+        except ArgumentParseError:
+            return
+
+    return parse, [(fake_message(x),) for x in chat_lines()]
+
+
+@benchmark("Context.send")
+def bench_send(xyzzy, scratch):
+    text = fixture("transcript.txt")
+    ctx = Context(fake_message("<@{}> play".format(BOT_ID)), xyzzy)
+    contents = [
+        "```diff\n-Please provide a game to play.\n```",
+        "@here the game has ended",
+        text[:2500],
+        text[:6000],
+        "```\n{}\n```".format(text[:1800]),
+        "```\n{}\n```".format(text[:4500]),
+        "```accesslog\n{}\n```".format(text[:9000]),
+        "**Recap**\n```\n{}\n```".format(text[:3000]),
+    ]
+
+    return ctx.send, [(x,) for x in contents]
+
+
+@benchmark("play search")
+def bench_search(xyzzy, scratch):
+    with open(os.path.join(FIXTURES, "games.json")) as f:
+        games = {x: Game(x, y) for x, y in json.load(f).items()}
+
+    queries = [
+        "zork",
+        "Zork I",
+        "zork i",
+        "hitchhiker",
+        "the",
+        "Curses!",
+        "lost pig",
+        "spider and web",
+        "a",
+        "sherbet",
+        "no such game",
+        "905",
+    ]
+
+    return find_games, [(games, x) for x in queries]
+
+
+@benchmark("parse_quetzal")
+def bench_quetzal(xyzzy, scratch):
+    saves = [
+        save(story(5, 88, "840726", 92 * 1024, 1), 1),
+        save(story(5, 15, "861010", 128 * 1024, 2), 2),
+        save(story(8, 3, "240611", 480 * 1024, 3), 3),
+    ]
+
+    return lambda data: quetzal_parser.parse_quetzal(BytesIO(data)), [
+        (x,) for x in saves
+    ]
+
+
+@benchmark("parse_zcode")
+def bench_zcode(xyzzy, scratch):
+    paths = []
+
+    for i, (version, size) in enumerate(
+        [(3, 92 * 1024), (5, 128 * 1024), (8, 480 * 1024)]
+    ):
+        path = os.path.join(scratch, "story{}.z{}".format(i, version))
+
+        with open(path, "wb") as f:
+            f.write(story(version, i + 1, "9{:05}".format(i), size, i))
+
+        paths.append(path)
+
+    return quetzal_parser.parse_zcode, [(x,) for x in paths]
+
+
+async def timed(fn, cases, loops):
+    count = len(cases)
+    is_async = asyncio.iscoroutinefunction(fn)
+    # Like timeit, keep the collector out of it, or whichever benchmark happens to trigger it pays for everyone's garbage.
+    gc.collect()
+    gc.disable()
+
+    try:
+        start = time.perf_counter()
+
+        if is_async:
+            for i in range(loops):
+                await fn(*cases[i % count])
+        else:
+            for i in range(loops):
+                fn(*cases[i % count])
+
+        return time.perf_counter() - start
+    finally:
+        gc.enable()
+
+
+async def allocated(fn, cases, settle):
+    """
+    Mean peak bytes allocated while making one call, over every case.
+    `settle` is called before each one, to let the transcript thread catch up so its work isn't counted against the wrong call.
+    """
+    is_async = asyncio.iscoroutinefunction(fn)
+    total = 0
+
+    tracemalloc.start()
+
+    try:
+        for args in cases:
+            settle()
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+            if is_async:
+                await fn(*args)
+            else:
+                fn(*args)
+
+            total += tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+
+    return total / len(cases)
+
+
+async def measure(fn, cases, seconds, settle):
+    """Returns the best calls/s over a few runs of at least `seconds` / REPEAT each, and bytes allocated per call."""
+    loops = len(cases)
+
+    # Warm up, which also fills any caches the way a running bot would have.
+    await timed(fn, cases, loops)
+
+    while await timed(fn, cases, loops) < seconds / REPEAT:
+        loops *= 2
+
+    best = min([await timed(fn, cases, loops) for _ in range(REPEAT)])
+
+    return loops / best, await allocated(fn, cases, settle)
+
+
+async def run(names, seconds, scratch):
+    xyzzy = fake_xyzzy(scratch)
+    results = {}
+
+    try:
+        for name in names:
+            fn, cases = BENCHMARKS[name](xyzzy, scratch)
+            ops, alloc = await measure(fn, cases, seconds, xyzzy.transcripts.flush)
+            results[name] = {"ops": round(ops, 1), "alloc": round(alloc)}
+    finally:
+        xyzzy.transcripts.close()
+
+    return results
+
+
+def main():
+    parser = ArgumentParser(description="Micro-benchmarks for xyzzy's hot functions.")
+    parser.add_argument(
+        "--only", help="only run benchmarks with this text in their name"
+    )
+    parser.add_argument(
+        "--seconds",
+        type=float,
+        default=1,
+        help="rough time to spend timing each benchmark (default: 1)",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.3,
+        help="fraction slower or larger than the baseline that counts as a regression (default: 0.3)",
+    )
+    parser.add_argument(
+        "--baseline", default=BASELINE, help="baseline file to compare against"
+    )
+    parser.add_argument(
+        "--save", action="store_true", help="write the results as the new baseline"
+    )
+    args = parser.parse_args()
+
+    names = [x for x in BENCHMARKS if not args.only or args.only.lower() in x.lower()]
+
+    if not names:
+        sys.exit('No benchmarks matching "{}".'.format(args.only))
+
+    baseline = {}
+
+    if os.path.isfile(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    scratch = tempfile.mkdtemp(prefix="xyzzy-micro-")
+
+    try:
+        results = asyncio.run(run(names, args.seconds, scratch))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    regressions = 0
+    print(
+        "{:<26} {:>14} {:>12} {:>12}  {}".format(
+            "benchmark", "calls/s", "vs baseline", "B/call", ""
+        )
+    )
+
+    for name, result in results.items():
+        base = baseline.get(name)
+        change = ""
+        flags = []
+
+        if base:
+            change = "{:+.1%}".format(result["ops"] / base["ops"] - 1)
+
+            if result["ops"] < base["ops"] * (1 - args.tolerance):
+                flags.append("SLOWER")
+
+            if result["alloc"] > base["alloc"] * (1 + args.tolerance) + ALLOC_SLACK:
+                flags.append("ALLOCATES MORE ({:,} B)".format(base["alloc"]))
+
+        regressions += bool(flags)
+        print(
+            "{:<26} {:>14,.0f} {:>12} {:>12,}  {}".format(
+                name, result["ops"], change, result["alloc"], " ".join(flags)
+            )
+        )
+
+    if args.save:
+        baseline.update(results)
+
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=4, sort_keys=True)
+            f.write("\n")
+
+        print("\nSaved baseline to {}.".format(args.baseline))
+    elif regressions:
+        print("\n{} regression(s) against {}.".format(regressions, args.baseline))
+
+    sys.exit(1 if regressions and not args.save else 0)
+
+
+if __name__ == "__main__":
+    main()
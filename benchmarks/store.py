@@ -0,0 +1,88 @@
+"""
+Data store write benchmark.
+Fills a fresh store with one settings entry per guild, then reports how long the event loop side of a write takes,
+how long until a batch is durable, and how long cold and warm per-guild reads take.
+
+Run from the repository root with `python -m benchmarks.store [guilds]`.
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+from modules.store import Store
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda p: samples[min(len(samples) - 1, int(len(samples) * p))]
+
+    return "p50 {:.1f}us  p99 {:.1f}us  max {:.1f}us".format(
+        pick(0.5) * 1e6, pick(0.99) * 1e6, samples[-1] * 1e6
+    )
+
+
+def main(guilds):
+    folder = tempfile.mkdtemp()
+    path = os.path.join(folder, "bench.db")
+
+    try:
+        store = Store(path)
+        settings = store.namespace("server_settings")
+        put = []
+        start = time.perf_counter()
+
+        for i in range(guilds):
+            t = time.perf_counter()
+            settings[str(i)] = {"blocked_games": ["Zork I", "Zork II"]}
+            put.append(time.perf_counter() - t)
+
+        queued = time.perf_counter() - start
+        store.flush()
+        durable = time.perf_counter() - start
+
+        print("{:,} guild entries".format(guilds))
+        print("put (event loop)   {}".format(percentiles(put)))
+        print(
+            "bulk insert        {:.2f}s queued, {:.2f}s durable ({:,.0f} writes/s)".format(
+                queued, durable, guilds / durable
+            )
+        )
+
+        # Single upserts against the full table, each waiting for its own commit.
+        single = []
+
+        for i in range(0, guilds, max(1, guilds // 1000)):
+            t = time.perf_counter()
+            settings[str(i)] = {"blocked_games": []}
+            store.flush()
+            single.append(time.perf_counter() - t)
+
+        print("upsert + commit    {}".format(percentiles(single)))
+        store.close()
+
+        # Reopen so reads start cold, like after a restart.
+        store = Store(path)
+        settings = store.namespace("server_settings")
+        cold, warm = [], []
+
+        for i in range(0, guilds, max(1, guilds // 1000)):
+            t = time.perf_counter()
+            settings.get(str(i))
+            cold.append(time.perf_counter() - t)
+
+            t = time.perf_counter()
+            settings.get(str(i))
+            warm.append(time.perf_counter() - t)
+
+        print("cold read          {}".format(percentiles(cold)))
+        print("warm read          {}".format(percentiles(warm)))
+        store.close()
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,90 @@
+"""
+Timer wheel benchmark.
+Gives thousands of sessions an idle timer and a democracy timer on a `TimerWheel` driven by a fake clock,
+then turns the wheel through a few hours of simulated time, checking every timer fires on the right tick
+and reporting how long each tick takes. A tick only costs as much as the timers in its slot,
+so it tracks how many timers are due rather than how many are pending.
+
+Run from the repository root with `python -m benchmarks.timers [sessions]`.
+"""
+
+import sys
+import time
+import random
+
+from modules.timer_wheel import TimerWheel
+
+# Simulated seconds to run the wheel for.
+DURATION = 4 * 60 * 60
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def run(sessions):
+    clock = FakeClock()
+    wheel = TimerWheel(clock=clock)
+    fired = []
+    late = 0
+    expected = sessions * (DURATION // 3600)
+
+    def fire(deadline, rearm):
+        nonlocal late
+
+        # A timer may be rounded up to the next tick, but never any later than that.
+        if not deadline <= clock.now <= deadline + wheel.tick:
+            late += 1
+
+        fired.append(deadline)
+
+        if rearm:
+            wheel.schedule(rearm, fire, clock.now + rearm, rearm)
+
+    for _ in range(sessions):
+        # An idle check somewhere within the hour, re-armed every hour.
+        delay = random.uniform(1, 3600)
+        wheel.schedule(delay, fire, delay, 3600)
+
+        # A democracy window that gets cancelled half the time, like a game ending mid-vote.
+        timer = wheel.schedule(15, fire, 15, 0)
+
+        if random.random() < 0.5:
+            timer.cancel()
+        else:
+            expected += 1
+
+    ticks = worst = 0
+    start = time.perf_counter()
+
+    while clock.now < DURATION:
+        clock.now += wheel.tick
+        tick_start = time.perf_counter()
+        wheel.advance()
+        worst = max(worst, time.perf_counter() - tick_start)
+        ticks += 1
+
+    elapsed = time.perf_counter() - start
+
+    print(
+        "{:,} sessions, {:,} ticks: {:,} timers fired ({:,} expected, {} late), "
+        "{:.2f}µs/tick mean, {:.0f}µs worst, {:,} still pending".format(
+            sessions,
+            ticks,
+            len(fired),
+            expected,
+            late,
+            elapsed / ticks * 1e6,
+            worst * 1e6,
+            len(wheel),
+        )
+    )
+
+
+if __name__ == "__main__":
+    for amount in ([int(sys.argv[1])] if len(sys.argv) > 1 else (1000, 10000, 100000)):
+        run(amount)
@@ -1,6 +1,7 @@
 from modules.command_sys import command, Command
 from modules.game_channel import GameChannel, InputMode
-from modules.game import Game
+from modules.game import Game, find_games
+from modules.spectators import MAX_SPECTATORS
 from io import BytesIO
 from math import floor
 from xyzzy import Xyzzy
@@ -10,6 +11,7 @@ import re
 import typing
 import asyncio
 import random
+import disnake as discord
 import modules.quetzal_parser as qzl
 
 
@@ -128,35 +130,43 @@ Alternatively, an up-to-date list can be found here: https://www.orangestar.dev/
                 "```accesslog\nSorry, but games cannot be played in DMs. Please try again in a server.```"
             )
 
-        if ctx.msg.channel.id in self.xyzzy.channels:
+        if ctx.msg.channel.id in self.xyzzy.sessions:
             return await ctx.send(
                 '```accesslog\nSorry, but #{} is currently playing "{}". Please try again after the game has finished.\n```'.format(
                     ctx.msg.channel.name,
-                    self.xyzzy.channels[ctx.msg.channel.id].game.name,
+                    self.xyzzy.sessions[ctx.msg.channel.id].game.name,
                 )
             )
 
+        if ctx.msg.channel.id in self.xyzzy.sessions.spectating:
+            return await ctx.send(
+                "```accesslog\nSorry, but #{} is currently spectating a game. Use `unwatch` to stop first.\n```".format(
+                    ctx.msg.channel.name
+                )
+            )
+
+        if not self.xyzzy.sessions.reserve(ctx.msg.channel.id):
+            return await ctx.send(
+                "```accesslog\nSorry, but a game is already being loaded in #{}. Please try again after it has started.\n```".format(
+                    ctx.msg.channel.name
+                )
+            )
+
+        # Reserved until the game has started or failed to, so another `play` can't load one here in the meantime.
+        try:
+            await self._play(ctx)
+        finally:
+            self.xyzzy.sessions.release(ctx.msg.channel.id)
+
+    async def _play(self, ctx):
+        """Finds the game to play, by name or from an attached save, and starts it in a channel that's been reserved."""
         if not ctx.msg.attachments:
             if not ctx.args:
                 return await ctx.send("```diff\n-Please provide a game to play.\n```")
 
             print("Searching for " + ctx.raw)
 
-            games = {
-                x: y
-                for x, y in self.xyzzy.games.items()
-                if ctx.raw.lower() in x.lower()
-                or [z for z in y.aliases if ctx.raw.lower() in z.lower()]
-            }
-            perfect_match = None
-
-            if games:
-                perfect_match = {
-                    x: y
-                    for x, y in games.items()
-                    if ctx.raw.lower() == x.lower()
-                    or [z for z in y.aliases if ctx.raw.lower() == z.lower()]
-                }
+            games, perfect_match = find_games(self.xyzzy.games, ctx.raw)
 
             if not games:
                 return await ctx.send(
@@ -232,24 +242,20 @@ Alternatively, an up-to-date list can be found here: https://www.orangestar.dev/
             )
         )
 
-        chan = GameChannel(ctx.msg, game)
-        self.xyzzy.channels[ctx.msg.channel.id] = chan
-
-        if ctx.msg.attachments:
-            chan.save = "./saves/{}/__UPLOADED__.qzl".format(ctx.msg.channel.id)
-
         await ctx.send(
             '```py\nLoaded "{}"{}\n```'.format(
                 game.name, " by " + game.author if game.author else ""
             )
         )
-        await chan.init_process()
-        await self.xyzzy.update_game()
-        await chan.game_loop()
-        await self.xyzzy.update_game()
 
-        if ctx.msg.channel.id in self.xyzzy.channels:
-            del self.xyzzy.channels[ctx.msg.channel.id]
+        # Made only once nothing else can go wrong before starting it, as it opens a transcript straight away.
+        chan = GameChannel(ctx.msg, game, self.xyzzy)
+
+        if ctx.msg.attachments:
+            chan.engine.save = "./saves/{}/__UPLOADED__.qzl".format(ctx.msg.channel.id)
+
+        await self.xyzzy.sessions.start(chan)
+        self.xyzzy.update_game()
 
     @command(usage="[ filename ]")
     async def debugload(self, ctx):
@@ -263,11 +269,18 @@ Alternatively, an up-to-date list can be found here: https://www.orangestar.dev/
                 "```accesslog\nSorry, but games cannot be played in DMs. Please try again in a server.```"
             )
 
-        if ctx.msg.channel.id in self.xyzzy.channels:
+        if ctx.msg.channel.id in self.xyzzy.sessions:
             return await ctx.send(
                 '```accesslog\nSorry, but #{} is currently playing "{}". Please try again after the game has finished.\n```'.format(
                     ctx.msg.channel.name,
-                    self.xyzzy.channels[ctx.msg.channel.id].game.name,
+                    self.xyzzy.sessions[ctx.msg.channel.id].game.name,
+                )
+            )
+
+        if ctx.msg.channel.id in self.xyzzy.sessions.spectating:
+            return await ctx.send(
+                "```accesslog\nSorry, but #{} is currently spectating a game. Use `unwatch` to stop first.\n```".format(
+                    ctx.msg.channel.name
                 )
             )
 
@@ -279,21 +292,27 @@ Alternatively, an up-to-date list can be found here: https://www.orangestar.dev/
         if not os.path.isfile(file_dir):
             return await ctx.send("```diff\n-File not found.\n```")
 
+        if not self.xyzzy.sessions.reserve(ctx.msg.channel.id):
+            return await ctx.send(
+                "```accesslog\nSorry, but a game is already being loaded in #{}. Please try again after it has started.\n```".format(
+                    ctx.msg.channel.name
+                )
+            )
+
         print(
             "Now loading test file {} for #{} (Server: {})".format(
                 ctx.raw, ctx.msg.channel.name, ctx.msg.guild.name
             )
         )
 
-        chan = GameChannel(ctx.msg, Game(ctx.raw, {"path": file_dir, "debug": True}))
-        self.xyzzy.channels[ctx.msg.channel.id] = chan
-
-        await ctx.send('```py\nLoaded "{}"\n```'.format(ctx.raw))
-        await chan.init_process()
-        await chan.game_loop()
-
-        if ctx.msg.channel.id in self.xyzzy.channels:
-            del self.xyzzy.channels[ctx.msg.channel.id]
+        try:
+            await ctx.send('```py\nLoaded "{}"\n```'.format(ctx.raw))
+            chan = GameChannel(
+                ctx.msg, Game(ctx.raw, {"path": file_dir, "debug": True}), self.xyzzy
+            )
+            await self.xyzzy.sessions.start(chan)
+        finally:
+            self.xyzzy.sessions.release(ctx.msg.channel.id)
 
     @command()
     async def output(self, ctx):
@@ -301,12 +320,12 @@ Alternatively, an up-to-date list can be found here: https://www.orangestar.dev/
         Toggles whether the text being sent to this channel from a currently playing game also should be printed to the terminal.
         This is functionally useless in most cases.
         """
-        if ctx.msg.channel.id not in self.xyzzy.channels:
+        if ctx.msg.channel.id not in self.xyzzy.sessions:
             return await ctx.send(
                 "```diff\n-Nothing is being played in this channel.\n```"
             )
 
-        chan = self.xyzzy.channels[ctx.msg.channel.id]
+        chan = self.xyzzy.sessions[ctx.msg.channel.id]
 
         if chan.output:
             chan.output = False
@@ -322,7 +341,7 @@ Alternatively, an up-to-date list can be found here: https://www.orangestar.dev/
         If you're noticing random spaces after each line break, use this command.
         [Indent level] must be an integer between 0 and the total console width. (Usually 80.)
         """
-        if ctx.msg.channel.id not in self.xyzzy.channels:
+        if ctx.msg.channel.id not in self.xyzzy.sessions:
             return await ctx.send(
                 "```diff\n-Nothing is being played in this channel.\n```"
             )
@@ -330,12 +349,12 @@ Alternatively, an up-to-date list can be found here: https://www.orangestar.dev/
         if not ctx.args:
             return await ctx.send("```diff\n-You need to supply a number.\n```")
 
-        chan = self.xyzzy.channels[ctx.msg.channel.id]
+        chan = self.xyzzy.sessions[ctx.msg.channel.id]
 
         try:
-            chan.indent = int(ctx.args[0])
+            chan.engine.indent = int(ctx.args[0])
             await ctx.send(
-                '```basic\n"Indent Level" is now {}.\n```'.format(chan.indent)
+                '```basic\n"Indent Level" is now {}.\n```'.format(chan.engine.indent)
             )
         except ValueError:
             await ctx.send("```diff\n!ERROR: Valid number not supplied.\n```")
@@ -347,17 +366,17 @@ Alternatively, an up-to-date list can be found here: https://www.orangestar.dev/
         [It is recommended to try to exit the game using an in-game method before using this command.] >quit usually works.
         This command has an alias in '@xyzzy mortim'
         """
-        if ctx.msg.channel.id not in self.xyzzy.channels:
+        if ctx.msg.channel.id not in self.xyzzy.sessions:
             return await ctx.send(
                 "```diff\n-Nothing is being played in this channel.\n```"
             )
 
-        channel = self.xyzzy.channels[ctx.msg.channel.id]
+        channel = self.xyzzy.sessions[ctx.msg.channel.id]
 
         if (
             not ctx.has_permission("manage_guild", "author")
             and str(ctx.msg.author.id) not in self.xyzzy.owner_ids
-            and ctx.msg.author != channel.owner
+            and ctx.msg.author.id != channel.owner_id
             and (
                 channel.mode == InputMode.DEMOCRACY or channel.mode == InputMode.DRIVER
             )
@@ -382,33 +401,11 @@ Alternatively, an up-to-date list can be found here: https://www.orangestar.dev/
             msg = await self.xyzzy.wait_for("message", check=check, timeout=30)
 
             if re.match(r"^`?({})?y(es)?`?$", msg.content.lower()):
-                chan = self.xyzzy.channels[ctx.msg.channel.id]
-
-                await chan.force_quit()
-                chan.cleanup()
-
-                if ctx.msg.channel.id in self.xyzzy.channels:
-                    del self.xyzzy.channels[ctx.msg.channel.id]
+                await self.xyzzy.sessions.stop(ctx.msg.channel.id)
             else:
                 await ctx.send("```diff\n+Continuing game.\n```")
         except asyncio.TimeoutError:
             await ctx.send("```diff\n+Message timeout expired. Continuing game.\n```")
-        except ProcessLookupError:
-            chan = self.xyzzy.channels[ctx.msg.channel.id]
-            saves = chan.check_saves()
-
-            if saves:
-                await self.channel.send(
-                    "```diff\n-The game has ended.\n+Here are your saves from the game.\n```",
-                    files=saves,
-                )
-            else:
-                await ctx.send("```diff\n-The game has ended.\n```")
-
-            chan.cleanup()
-
-            if ctx.msg.channel.id in self.xyzzy.channels:
-                del self.xyzzy.channels[ctx.msg.channel.id]
 
     @command(aliases=["upload"], usage="[ Save as Attachment ]")
     async def uploadsave(self, ctx):
@@ -478,7 +475,7 @@ Alternatively, an up-to-date list can be found here: https://www.orangestar.dev/
         If "list" is specified as the mode, a list of the supported input modes will be shown (this is also aliased to '@xyzzy modes').
         [Only users who can manage the server, or the "owner" of the current game can change the mode.]
         """
-        if ctx.msg.channel.id not in self.xyzzy.channels:
+        if ctx.msg.channel.id not in self.xyzzy.sessions:
             return await ctx.send(
                 "```diff\n-Nothing is being played in this channel.\n```"
             )
@@ -486,7 +483,7 @@ Alternatively, an up-to-date list can be found here: https://www.orangestar.dev/
         if (
             not ctx.has_permission("manage_guild", "author")
             and str(ctx.msg.author.id) not in self.xyzzy.owner_ids
-            and ctx.msg.author != self.xyzzy.channels[ctx.msg.channel.id].owner
+            and ctx.msg.author.id != self.xyzzy.sessions[ctx.msg.channel.id].owner_id
         ):
             return await ctx.send(
                 '```diff\n-Only people who can manage the server, or the "owner" of the current game can change the mode.\n```'
@@ -507,7 +504,7 @@ Alternatively, an up-to-date list can be found here: https://www.orangestar.dev/
             )
 
         res = [x for x in InputMode if ctx.args[0].lower() == x.name.lower()][0]
-        channel = self.xyzzy.channels[ctx.msg.channel.id]
+        channel = self.xyzzy.sessions[ctx.msg.channel.id]
 
         if res == channel.mode:
             return await ctx.send(
@@ -540,7 +537,9 @@ Alternatively, an up-to-date list can be found here: https://www.orangestar.dev/
                 "-Driver mode is now on.\n"
                 "Only {} will be able to submit commands.\n"
                 "You can transfer the \"wheel\" with '@xyzzy transfer [user]'\n"
-                "```".format(channel.owner)
+                "```".format(
+                    ctx.msg.guild.get_member(channel.owner_id) or "the game's owner"
+                )
             )
 
     @command(usage="[ @User Mentions#1234 ]")
@@ -550,19 +549,19 @@ Alternatively, an up-to-date list can be found here: https://www.orangestar.dev/
         NOTE: this only works in driver or democracy mode.
         [This command can only be used by the "owner" of the game.]
         """
-        if ctx.msg.channel.id not in self.xyzzy.channels:
+        if ctx.msg.channel.id not in self.xyzzy.sessions:
             return await ctx.send(
                 "```diff\n-Nothing is being played in this channel.\n```"
             )
 
-        if self.xyzzy.channels[ctx.msg.channel.id].mode == InputMode.ANARCHY:
+        if self.xyzzy.sessions[ctx.msg.channel.id].mode == InputMode.ANARCHY:
             return await ctx.send(
                 "```diff\n-'transfer' may only be used in driver or anarchy mode.\n```"
             )
 
         if (
             str(ctx.msg.author.id) not in self.xyzzy.owner_ids
-            and ctx.msg.author != self.xyzzy.channels[ctx.msg.channel.id].owner
+            and ctx.msg.author.id != self.xyzzy.sessions[ctx.msg.channel.id].owner_id
         ):
             return await ctx.send(
                 "```diff\n-Only the current owner of the game can use this command.\n```"
@@ -573,12 +572,130 @@ Alternatively, an up-to-date list can be found here: https://www.orangestar.dev/
                 '```diff\n-Please give me a user to pass the "wheel" to.\n```'
             )
 
-        self.xyzzy.channels[ctx.msg.channel.id].owner = ctx.msg.mentions[0]
+        self.xyzzy.sessions[ctx.msg.channel.id].owner_id = ctx.msg.mentions[0].id
 
         await ctx.send(
             '```diff\n+Transferred the "wheel" to {}.\n```'.format(ctx.msg.mentions[0])
         )
 
+    @command(usage="[ #channel ]")
+    async def watch(self, ctx):
+        """
+        Mirrors the game being played in [#channel] to this channel, so it can be followed from here.
+        Input can only be sent from the channel the game is being played in.
+        [This command can only be used by people who can manage the server.]
+        """
+        if ctx.is_dm():
+            return await ctx.send(
+                "```accesslog\nSorry, but games cannot be watched in DMs. Please try again in a server.```"
+            )
+
+        if (
+            not ctx.has_permission("manage_guild", "author")
+            and str(ctx.msg.author.id) not in self.xyzzy.owner_ids
+        ):
+            return await ctx.send(
+                "```diff\n-Only people who can manage the server can set up spectating.\n```"
+            )
+
+        if not ctx.msg.channel_mentions:
+            return await ctx.send("```diff\n-Please give me a channel to watch.\n```")
+
+        target = ctx.msg.channel_mentions[0]
+        chan = self.xyzzy.sessions.get(target.id)
+
+        if chan is None or target.guild.id != ctx.msg.guild.id:
+            return await ctx.send(
+                "```diff\n-Nothing is being played in #{}.\n```".format(target.name)
+            )
+
+        if (
+            ctx.msg.channel.id in self.xyzzy.sessions
+            or ctx.msg.channel.id in self.xyzzy.sessions.reserved
+        ):
+            return await ctx.send(
+                "```diff\n-A game is already being played in this channel.\n```"
+            )
+
+        if len(chan.spectators) >= MAX_SPECTATORS:
+            return await ctx.send(
+                "```diff\n-#{} already has the most spectators it can.\n```".format(
+                    target.name
+                )
+            )
+
+        self.xyzzy.sessions.unwatch(ctx.msg.channel.id)
+        self.xyzzy.sessions.watch(chan, ctx.msg.channel)
+
+        await ctx.send(
+            '```diff\n+Now watching "{}" in #{}.\n```'.format(
+                chan.game.name, target.name
+            )
+        )
+
+    @command()
+    async def unwatch(self, ctx):
+        """
+        Stops mirroring a game to this channel.
+        [This command can only be used by people who can manage the server.]
+        """
+        if (
+            not ctx.has_permission("manage_guild", "author")
+            and str(ctx.msg.author.id) not in self.xyzzy.owner_ids
+        ):
+            return await ctx.send(
+                "```diff\n-Only people who can manage the server can stop spectating.\n```"
+            )
+
+        chan = self.xyzzy.sessions.unwatch(ctx.msg.channel.id)
+
+        if chan is None:
+            return await ctx.send(
+                "```diff\n-This channel isn't watching anything.\n```"
+            )
+
+        await ctx.send("```diff\n+Stopped watching #{}.\n```".format(chan.channel.name))
+
+    @command(usage="[ amount ]")
+    async def recap(self, ctx):
+        """
+        Sends the last [amount] outputs of the game being played (or watched) in this channel, and what was typed, as a text file.
+        [Amount] defaults to 10.
+        """
+        chan = self.xyzzy.sessions.get(
+            ctx.msg.channel.id
+        ) or self.xyzzy.sessions.spectating.get(ctx.msg.channel.id)
+
+        if chan is None:
+            return await ctx.send(
+                "```diff\n-Nothing is being played in this channel.\n```"
+            )
+
+        if not ctx.has_permission("attach_files"):
+            return await ctx.send(
+                "```diff\n-I need the `Attach Files` permission to send a recap.\n```"
+            )
+
+        try:
+            amount = max(1, int(ctx.args[0])) if ctx.args else 10
+        except ValueError:
+            return await ctx.send("```diff\n!ERROR: Valid number not supplied.\n```")
+
+        text = chan.recap.render(amount)
+
+        if not text:
+            return await ctx.send("```diff\n-Nothing has happened yet.\n```")
+
+        await ctx.send(
+            '```diff\n+Recap of "{}" in #{}. ({:.1f}/{:.1f} KiB of history kept)\n```'.format(
+                chan.game.name,
+                chan.channel.name,
+                chan.recap.memory / 1024,
+                chan.recap.capacity / 1024,
+            ),
+            file=discord.File(BytesIO(text.encode("utf-8")), "recap.txt"),
+        )
+
     @command(has_site_help=False)
     async def jump(self, ctx):
         """Wheeeeeeeeee!!!!!"""
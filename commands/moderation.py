@@ -1,5 +1,4 @@
 from modules.command_sys import command
-import json
 
 
 class Moderation:
@@ -25,19 +24,19 @@ class Moderation:
         if not ctx.msg.mentions:
             return await ctx.send("```diff\n-Please mention some people to block.\n```")
 
-        if str(ctx.msg.guild.id) not in self.xyzzy.blocked_users:
-            self.xyzzy.blocked_users[str(ctx.msg.guild.id)] = []
-
         for men in ctx.msg.mentions:
-            self.xyzzy.blocked_users[str(ctx.msg.guild.id)].append(str(men.id))
-            await ctx.send(
-                '```diff\n+ "{}" has been restricted from entering commands in this server.\n```'.format(
-                    men.display_name
+            if self.xyzzy.blocked_users.block(ctx.msg.guild.id, men.id):
+                await ctx.send(
+                    '```diff\n+ "{}" has been restricted from entering commands in this server.\n```'.format(
+                        men.display_name
+                    )
+                )
+            else:
+                await ctx.send(
+                    '```diff\n- "{}" is already restricted in this server.\n```'.format(
+                        men.display_name
+                    )
                 )
-            )
-
-        with open("./bot-data/blocked_users.json", "w") as blck:
-            json.dump(self.xyzzy.blocked_users, blck)
 
     @command(usage="[ @User Mention#1234s ]")
     async def unblock(self, ctx):
@@ -59,22 +58,14 @@ class Moderation:
                 "```diff\n-Please mention some people to unblock.\n```"
             )
 
-        if str(ctx.msg.guild.id) not in self.xyzzy.blocked_users:
-            self.xyzzy.blocked_users[str(ctx.msg.guild.id)] = []
-            return
-
         for men in ctx.msg.mentions:
-            if str(men.id) in self.xyzzy.blocked_users[str(ctx.msg.guild.id)]:
-                self.xyzzy.blocked_users[str(ctx.msg.guild.id)].remove(str(men.id))
+            if self.xyzzy.blocked_users.unblock(ctx.msg.guild.id, men.id):
                 await ctx.send(
                     '```diff\n+ "{}" is now allowed to submit commands.\n```'.format(
                         men.display_name
                     )
                 )
 
-        with open("./bot-data/blocked_users.json", "w") as blck:
-            json.dump(self.xyzzy.blocked_users, blck)
-
     @command(usage="[ Game name ] or list")
     async def blockgame(self, ctx):
         """
@@ -149,26 +140,19 @@ class Moderation:
         else:
             game = list(games[0].items())[0][0]
 
-        if str(ctx.msg.guild.id) not in self.xyzzy.server_settings:
-            self.xyzzy.server_settings[str(ctx.msg.guild.id)] = {
-                "blocked_games": [game]
-            }
-        else:
-            if (
-                game
-                not in self.xyzzy.server_settings[str(ctx.msg.guild.id)][
-                    "blocked_games"
-                ]
-            ):
-                self.xyzzy.server_settings[str(ctx.msg.guild.id)][
-                    "blocked_games"
-                ].append(game)
-            else:
-                return await ctx.send(
-                    '```diff\n- "{}" has already been blocked on this server.\n```'.format(
-                        game
-                    )
+        settings = self.xyzzy.server_settings.get(
+            str(ctx.msg.guild.id), {"blocked_games": []}
+        )
+
+        if game in settings["blocked_games"]:
+            return await ctx.send(
+                '```diff\n- "{}" has already been blocked on this server.\n```'.format(
+                    game
                 )
+            )
+
+        settings["blocked_games"].append(game)
+        self.xyzzy.server_settings[str(ctx.msg.guild.id)] = settings
 
         await ctx.send(
             '```diff\n+ "{}" has been blocked and will no longer be able to be played on this server.\n```'.format(
@@ -176,9 +160,6 @@ class Moderation:
             )
         )
 
-        with open("./bot-data/server_settings.json", "w") as srv:
-            json.dump(self.xyzzy.server_settings, srv)
-
     @command(usage="[ Game name ]")
     async def unblockgame(self, ctx):
         """
@@ -231,32 +212,27 @@ class Moderation:
         else:
             game = list(games[0].items())[0][0]
 
-        if str(ctx.msg.guild.id) not in self.xyzzy.server_settings:
-            self.xyzzy.server_settings[str(ctx.msg.guild.id)] = {
-                "blocked_games": [game]
-            }
+        settings = self.xyzzy.server_settings.get(str(ctx.msg.guild.id))
+
+        if not settings or not settings["blocked_games"]:
             return await ctx.send(
                 "```diff\n-No games have been blocked on this server.\n```"
             )
 
-        if game in self.xyzzy.server_settings[str(ctx.msg.guild.id)]["blocked_games"]:
-            self.xyzzy.server_settings[str(ctx.msg.guild.id)]["blocked_games"].remove(
-                game
-            )
-        else:
+        if game not in settings["blocked_games"]:
             return await ctx.send(
                 '```diff\n- "{}" has not been blocked on this server.\n```'.format(game)
             )
 
+        settings["blocked_games"].remove(game)
+        self.xyzzy.server_settings[str(ctx.msg.guild.id)] = settings
+
         await ctx.send(
             '```diff\n+ "{}" has been unblocked and can be played again on this server.\n```'.format(
                 game
             )
         )
 
-        with open("./bot-data/server_settings.json", "w") as srv:
-            json.dump(self.xyzzy.server_settings, srv)
-
 
 def setup(xyzzy):
     return Moderation(xyzzy)
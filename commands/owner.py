@@ -1,4 +1,6 @@
 from modules.command_sys import command
+from modules.broadcast import Broadcast
+from modules.profiling import Profiler, ProfileError
 from subprocess import PIPE
 
 import traceback as tb
@@ -12,10 +14,21 @@ import os.path
 
 from xyzzy import Xyzzy
 
+# Sessions shown per page of `nowplaying`.
+NOWPLAYING_PAGE = 20
+# Seconds to spend telling running games about a shutdown before going ahead with it.
+SHUTDOWN_NOTICE_TIMEOUT = 15
+# Seconds a profile runs for when not told otherwise.
+PROFILE_TIME = 30
+# Largest report attached to a message, in bytes. Bigger ones are only saved.
+MAX_ATTACHMENT = 8 * 1024 * 1024
+
 
 class Owner:
     def __init__(self, xyzzy: Xyzzy):
         self.xyzzy = xyzzy
+        self.broadcast = None
+        self.profiler = Profiler()
 
     @command(aliases=["eval"], usage="[ python ]", owner=True)
     async def evaluate(self, ctx):
@@ -41,13 +54,13 @@ class Owner:
         After confirmation, shuts down the bot and all running games.
         [This command may only be used by trusted individuals.]
         """
-        if self.xyzzy.channels:
+        if self.xyzzy.sessions:
             await ctx.send(
                 "```diff\n"
                 "!There are currently {} games running on my system.\n"
                 "-If you shut me down now, all unsaved data regarding these games could be lost!\n"
                 "(Use `{}nowplaying` for a list of currently running games.)\n```".format(
-                    len(self.xyzzy.channels), self.xyzzy.user.mention
+                    len(self.xyzzy.sessions), self.xyzzy.user.mention
                 )
             )
 
@@ -68,6 +81,19 @@ class Owner:
                     msg.content.lower(),
                 ):
                     await ctx.send("```asciidoc\n.Xyzzy.\n// Now shutting down...\n```")
+
+                    if self.xyzzy.sessions:
+                        notice = await Broadcast(
+                            [x.channel for x in self.xyzzy.sessions],
+                            "```diff\n-Xyzzy is shutting down, so this game is being stopped.\n```",
+                        ).run(timeout=SHUTDOWN_NOTICE_TIMEOUT)
+
+                        await ctx.send(
+                            "```diff\n+Shutdown notice: {}\n```".format(
+                                notice.summary()
+                            )
+                        )
+
                     await self.xyzzy.logout()
                 elif re.match(
                     r"^`?({} ?)?no?`?$".format(self.xyzzy.user.mention),
@@ -79,27 +105,60 @@ class Owner:
             except asyncio.TimeoutError:
                 return await ctx.send("```css\nMessage timeout: Shutdown aborted.\n```")
 
-    @command(owner=True, usage="[ announcement ]")
+    @command(owner=True, usage="[ announcement | cancel ]")
     async def announce(self, ctx):
         """
         For each channel currently playing a game, sends the text in [announcement].
+        `announce cancel` stops an announcement that is still being sent.
         [This command may only be used by trusted individuals.]
         """
         if not ctx.args:
             return await ctx.send("```diff\n-Nothing to announce.\n```")
 
-        count = 0
-        with ctx.msg.channel.typing():
-            for chan in self.xyzzy.channels.values():
-                try:
-                    await chan.channel.send("```{}```".format(ctx.raw))
-                    count += 1
-                except:
-                    pass
+        running = self.broadcast is not None and self.broadcast.finished is None
+
+        if ctx.raw.strip().lower() == "cancel":
+            if not running:
+                return await ctx.send("```diff\n-No announcement is being sent.\n```")
+
+            self.broadcast.cancel()
+            return await ctx.send("```diff\n+Cancelling announcement.\n```")
+
+        if running:
+            return await ctx.send(
+                "```diff\n-An announcement is already being sent. ({})\n```".format(
+                    self.broadcast.summary()
+                )
+            )
 
-        return await ctx.send(
-            f"```diff\n+ Announcement as been sent to {count} channels. (Failed in {len(self.xyzzy.channels) - count})\n```"
+        self.broadcast = broadcast = Broadcast(
+            [x.channel for x in self.xyzzy.sessions], "```{}```".format(ctx.raw)
         )
+        status = await ctx.send(
+            "```diff\n+Sending announcement to {} channels...\n```".format(
+                broadcast.total
+            )
+        )
+
+        async def progress(broadcast):
+            await status.edit(
+                content="```diff\n+Sending announcement: {}\n```".format(
+                    broadcast.summary()
+                )
+            )
+
+        await broadcast.run(progress)
+
+        msg = "```diff\n{} Announcement {}: {}\n".format(
+            "-" if broadcast.cancelled else "+",
+            "cancelled" if broadcast.cancelled else "sent",
+            broadcast.summary(),
+        )
+
+        for error, count in broadcast.errors().most_common():
+            msg += "-{}: {}\n".format(error, count)
+
+        await ctx.send(msg + "```")
 
     @command(usage="[ module ]", owner=True, has_site_help=False)
     async def reload(self, ctx):
@@ -128,28 +187,277 @@ class Owner:
             '```diff\n+Reloaded module "{}".\n```'.format(ctx.args[0].lower())
         )
 
-    @command(owner=True)
+    @command(owner=True, usage="[ page ]")
     async def nowplaying(self, ctx):
         """
-        Sends you a direct message containing all currently running xyzzy instances across Discord.
+        Sends you a direct message containing currently running xyzzy instances across Discord, most idle first.
         [This command may only be used by trusted individuals.]
         """
-        if not self.xyzzy.channels:
+        sessions = self.xyzzy.sessions
+
+        if not sessions:
             return await ctx.send(
                 "```md\n## Nothing is currently being played. ##\n```", dest="author"
             )
 
+        try:
+            page = max(1, int(ctx.args[0])) if ctx.args else 1
+        except ValueError:
+            page = 1
+
+        pages = (len(sessions) - 1) // NOWPLAYING_PAGE + 1
+        page = min(page, pages)
+
         msg = "```md\n## Currently playing games: ##\n"
+        msg += "# {} sessions ({} counted) in {} servers. Page {}/{} #\n".format(
+            len(sessions), sessions.counted, len(sessions.by_guild), page, pages
+        )
 
-        for chan in self.xyzzy.channels.values():
-            msg += "[{0.channel.guild.name}]({0.channel.name}) {0.game.name} {{{1} minutes ago}}\n".format(
-                chan, (ctx.msg.created_at - chan.last).total_seconds() // 60
+        for chan in sessions.idle((page - 1) * NOWPLAYING_PAGE, NOWPLAYING_PAGE):
+            memory = sessions.memory_of(chan)
+            msg += "[{0.channel.guild.name}]({0.channel.name}) {0.game.name} {{{1} minutes ago}} <queue {2}> <recap {3:.1f}KiB> <heap {4:.1f}KiB> <dfrotz {5}>\n".format(
+                chan,
+                (ctx.msg.created_at - chan.last).total_seconds() // 60,
+                len(chan.engine.inputs),
+                chan.recap.memory / 1024,
+                memory.heap / 1024,
+                (
+                    "?"
+                    if memory.interpreter is None
+                    else "{:.1f}MiB".format(memory.interpreter / 1024 / 1024)
+                ),
             )
 
         msg += "```"
 
         await ctx.send(msg, dest="author")
 
+    @command(owner=True, has_site_help=False)
+    async def ratelimits(self, ctx):
+        """
+        Shows how many commands and game inputs have been dropped by the rate limiter, and the worst offenders.
+        [This command may only be used by trusted individuals.]
+        """
+        msg = "```md\n"
+
+        for limiter in (self.xyzzy.command_limits, self.xyzzy.input_limits):
+            msg += "## {} ##\n".format(limiter.kind.title())
+
+            for scope, buckets in limiter.scopes.items():
+                msg += "* {}: {} dropped, {} active buckets\n".format(
+                    scope, buckets.total_dropped, len(buckets.buckets)
+                )
+
+                for key, count in limiter.top_dropped(scope):
+                    msg += "  - {}: {}\n".format(key, count)
+
+        msg += "```"
+
+        await ctx.send(msg)
+
+    @command(aliases=["cmdstats"], usage="[ command ]", owner=True, has_site_help=False)
+    async def commandstats(self, ctx):
+        """
+        Shows how long each command takes, how many are running and how often they fail, most total time first.
+        Give a command to see its errors and traces of its slowest runs.
+        [This command may only be used by trusted individuals.]
+        """
+        stats = self.xyzzy.command_stats
+
+        if ctx.args:
+            cmd = self.xyzzy.commands.get_command(ctx.args[0].lower())
+
+            if not cmd or cmd.name not in stats.stats:
+                return await ctx.send(
+                    '```diff\n-No stats for "{}".\n```'.format(ctx.args[0])
+                )
+
+            stat = stats.stats[cmd.name]
+            lat = stat.latency
+            msg = "```md\n## {} ##\n".format(cmd.name)
+            msg += "* {} calls, {} running, {} failed\n".format(
+                stat.calls, stat.in_flight, stat.failed
+            )
+            msg += "* mean {:.0f}ms, p50 {:.0f}ms, p99 {:.0f}ms, max {:.0f}ms\n".format(
+                lat.mean * 1000,
+                lat.percentile(0.5) * 1000,
+                lat.percentile(0.99) * 1000,
+                lat.max * 1000,
+            )
+
+            for error, count in stat.errors.most_common():
+                msg += "  - {}: {}\n".format(error, count)
+
+            msg += "```"
+
+            for trace in reversed(stat.traces):
+                msg += "```py\n# {:%H:%M:%S} {} by {} in {}: {}\n{}```".format(
+                    trace.when,
+                    (
+                        "still running"
+                        if trace.duration is None
+                        else "{:.1f}s".format(trace.duration)
+                    ),
+                    trace.user_id,
+                    trace.channel_id,
+                    trace.input,
+                    trace.stack[-600:],
+                )
+
+            return await ctx.send(msg)
+
+        if not stats.stats:
+            return await ctx.send("```md\n## No commands have been run yet. ##\n```")
+
+        msg = "```md\n## Commands, by total time ##\n"
+        msg += "# name          calls  run  fail   mean    p99    max  total #\n"
+
+        for name, stat in stats.by_total_time():
+            lat = stat.latency
+            msg += (
+                "{:<14}{:>6}{:>5}{:>6}{:>6.0f}ms{:>5.0f}ms{:>5.0f}ms{:>6.1f}s\n".format(
+                    name,
+                    stat.calls,
+                    stat.in_flight,
+                    stat.failed,
+                    lat.mean * 1000,
+                    lat.percentile(0.99) * 1000,
+                    lat.max * 1000,
+                    lat.sum,
+                )
+            )
+
+        msg += "```"
+
+        await ctx.send(msg)
+
+    @command(
+        owner=True, usage="[ detect <milliseconds> | detect off ]", has_site_help=False
+    )
+    async def lag(self, ctx):
+        """
+        Shows how late the event loop has been running, and any stalls caught by the slow callback detector.
+        `detect` turns the detector on with a threshold, or off.
+        [This command may only be used by trusted individuals.]
+        """
+        monitor = self.xyzzy.loop_monitor
+
+        if ctx.args and ctx.args[0].lower() == "detect":
+            if len(ctx.args) < 2:
+                return await ctx.send(
+                    '```diff\n-Give a threshold in milliseconds, or "off".\n```'
+                )
+
+            if ctx.args[1].lower() == "off":
+                monitor.detect(0)
+                return await ctx.send("```diff\n+Slow callback detector off.\n```")
+
+            try:
+                threshold = float(ctx.args[1])
+            except ValueError:
+                return await ctx.send("```diff\n-That isn't a number.\n```")
+
+            if threshold <= 0:
+                return await ctx.send("```diff\n-The threshold must be above 0.\n```")
+
+            monitor.detect(threshold / 1000)
+            return await ctx.send(
+                "```diff\n+Reporting event loop stalls over {:g}ms.\n```".format(
+                    threshold
+                )
+            )
+
+        lag = monitor.lag
+        msg = "```md\n## Event loop lag ##\n"
+        msg += "* {} samples, every {:g}s\n".format(lag.count, monitor.interval)
+        msg += "* mean {:.1f}ms, p50 {:.1f}ms, p99 {:.1f}ms, max {:.1f}ms\n".format(
+            lag.mean * 1000,
+            lag.percentile(0.5) * 1000,
+            lag.percentile(0.99) * 1000,
+            lag.max * 1000,
+        )
+
+        for bound, count in zip(lag.bounds + (float("inf"),), lag.counts):
+            if count:
+                msg += "  - <= {:g}ms: {}\n".format(bound * 1000, count)
+
+        if monitor.threshold:
+            msg += "\n## Stalls over {:g}ms ({} caught) ##\n".format(
+                monitor.threshold * 1000, monitor.stall_count
+            )
+        else:
+            msg += "\n## Slow callback detector off ({} caught) ##\n".format(
+                monitor.stall_count
+            )
+
+        for stall in reversed(monitor.stalls):
+            msg += "* {:%H:%M:%S} {:.0f}ms in {}\n".format(
+                stall.when, stall.duration * 1000, stall.task
+            )
+
+        msg += "```"
+
+        await ctx.send(msg)
+
+    async def _profile(self, ctx, kind, seconds):
+        try:
+            seconds = float(seconds) if seconds else PROFILE_TIME
+        except ValueError:
+            return await ctx.send("```diff\n-That isn't a number of seconds.\n```")
+
+        await ctx.send(
+            "```diff\n+Profiling ({}) for up to {:g} seconds. Use `profile stop` to finish early.\n```".format(
+                kind, seconds
+            )
+        )
+
+        try:
+            summary, paths = await self.profiler.run(kind, seconds)
+        except ProfileError as e:
+            return await ctx.send("```diff\n-{}\n```".format(e))
+
+        files = [
+            discord.File(x, os.path.basename(x))
+            for x in paths
+            if os.path.getsize(x) <= MAX_ATTACHMENT
+        ]
+
+        await ctx.send(
+            "```diff\n+{}\nSaved to {}\n```".format(summary, ", ".join(paths)),
+            files=files or None,
+        )
+
+    @command(owner=True, usage="[ seconds ] [ cprofile ] | stop", has_site_help=False)
+    async def profile(self, ctx):
+        """
+        Profiles the event loop for [seconds], 30 by default, and attaches the report when it's done.
+        The default samples the loop's stack every 10ms, which is cheap enough to leave running on a busy bot, and also writes
+        folded stacks for a flame graph. `cprofile` traces every call instead, which is far slower, so it's capped at 60 seconds.
+        `profile stop` finishes a running profile (or heap diff) early.
+        [This command may only be used by trusted individuals.]
+        """
+        args = [x.lower() for x in ctx.args]
+
+        if args[:1] == ["stop"]:
+            if not self.profiler.stop():
+                return await ctx.send("```diff\n-Nothing is being profiled.\n```")
+
+            return await ctx.send("```diff\n+Stopping the profile.\n```")
+
+        kind = "cprofile" if "cprofile" in args else "sample"
+        seconds = next((x for x in args if x != "cprofile"), None)
+
+        await self._profile(ctx, kind, seconds)
+
+    @command(owner=True, usage="[ seconds ]", has_site_help=False)
+    async def heapdiff(self, ctx):
+        """
+        Snapshots the Python heap with tracemalloc, again after [seconds] (30 by default), and attaches what grew in between.
+        Tracing allocations slows everything down while it runs, so keep it short on a busy bot.
+        [This command may only be used by trusted individuals.]
+        """
+        await self._profile(ctx, "heap", ctx.args[0] if ctx.args else None)
+
     @command(owner=True, has_site_help=False)
     async def repl(self, ctx):
         """Repl in Discord. Because debugging using eval is a PiTA."""
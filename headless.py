@@ -0,0 +1,211 @@
+"""
+Runs games from games.json without Discord, feeding each one an input script and writing out what it printed.
+Handy for walkthrough regression tests (compare the output against a known-good copy with --expected)
+and for measuring raw interpreter throughput, as many scripts can be run at once.
+
+Scripts have one command per line. Blank lines send ENTER, and lines starting with "#" are skipped.
+
+    python headless.py "Zork I" walkthroughs/zork1.txt --expected walkthroughs/zork1-output/
+    python headless.py "Zork I" walkthroughs/*.txt --parallel 32 --repeat 10
+"""
+
+from argparse import ArgumentParser
+from modules.game import Game
+from modules.input_queue import InputQueue, QueuePolicy
+from modules.process_helpers import QUIET_PERIOD
+from modules.session_engine import SessionEngine
+
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import tempfile
+
+
+def load_script(path):
+    commands = []
+
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+
+            if line.startswith("#"):
+                continue
+
+            commands.append(line or "ENTER")
+
+    return commands
+
+
+async def run_script(game, commands, quiet, timeout):
+    """Plays through one script, returning the output and whether it finished in time."""
+    out = []
+
+    async def on_output(text, save):
+        out.append(text)
+
+    save_path = tempfile.mkdtemp(prefix="xyzzy-headless-")
+    inputs = InputQueue(len(commands) + 1, QueuePolicy.REJECT)
+    engine = SessionEngine(
+        game, save_path, inputs, on_output, lambda x: out.append("> " + x), quiet
+    )
+
+    for command in commands:
+        inputs.push(command)
+
+    try:
+        await engine.start()
+
+        runner = asyncio.ensure_future(engine.run())
+        waiter = asyncio.ensure_future(engine.waiting.wait())
+        done, _ = await asyncio.wait(
+            {runner, waiter}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+        )
+        waiter.cancel()
+        engine.terminate()
+        engine.process.stdin.close()
+        await runner
+    finally:
+        engine.cleanup()
+
+    return "\n".join(out) + "\n", bool(done)
+
+
+async def run_all(args, game):
+    semaphore = asyncio.Semaphore(args.parallel)
+    scripts = [(path, load_script(path)) for path in args.scripts]
+    results = []
+
+    async def run_one(path, commands, run):
+        async with semaphore:
+            start = time.perf_counter()
+            output, finished = await run_script(
+                game, commands, args.quiet, args.timeout
+            )
+            results.append(
+                (
+                    path,
+                    run,
+                    len(commands),
+                    output,
+                    finished,
+                    time.perf_counter() - start,
+                )
+            )
+
+    start = time.perf_counter()
+
+    await asyncio.gather(
+        *(
+            run_one(path, commands, run)
+            for run in range(args.repeat)
+            for path, commands in scripts
+        )
+    )
+
+    return results, time.perf_counter() - start
+
+
+def main():
+    parser = ArgumentParser(
+        description="Runs games from games.json with input scripts, without Discord."
+    )
+    parser.add_argument("game", help="name of the game in games.json")
+    parser.add_argument(
+        "scripts", nargs="+", help="input scripts, one command per line"
+    )
+    parser.add_argument(
+        "--games", default="./games.json", help="game database (default: ./games.json)"
+    )
+    parser.add_argument(
+        "--out",
+        default="./headless-output/",
+        help="where to write each script's output",
+    )
+    parser.add_argument(
+        "--expected", help="directory of known-good outputs to compare against"
+    )
+    parser.add_argument(
+        "--parallel",
+        type=int,
+        default=8,
+        help="most games running at once (default: 8)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=1, help="times to run each script (default: 1)"
+    )
+    parser.add_argument(
+        "--quiet",
+        type=float,
+        default=QUIET_PERIOD,
+        help="seconds of silence that end a turn's output, for games without a prompt (default: {})".format(
+            QUIET_PERIOD
+        ),
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=300,
+        help="most seconds a script may take (default: 300)",
+    )
+    args = parser.parse_args()
+
+    if not shutil.which("dfrotz"):
+        sys.exit("dfrotz not detected to be in PATH.")
+
+    with open(args.games) as f:
+        games = json.load(f)
+
+    if args.game not in games:
+        sys.exit('No game called "{}" in {}.'.format(args.game, args.games))
+
+    game = Game(args.game, games[args.game])
+    results, elapsed = asyncio.run(run_all(args, game))
+
+    os.makedirs(args.out, exist_ok=True)
+    failed = 0
+
+    for path, run, commands, output, finished, took in sorted(results):
+        name = os.path.splitext(os.path.basename(path))[0] + ".txt"
+        status = "ok"
+
+        if run == 0:
+            with open(os.path.join(args.out, name), "w") as f:
+                f.write(output)
+
+        if not finished:
+            status = "TIMED OUT"
+        elif args.expected:
+            with open(os.path.join(args.expected, name)) as f:
+                if f.read() != output:
+                    status = "MISMATCH"
+
+        if status != "ok":
+            failed += 1
+
+        print(
+            "{:<40} run {:<3} {:>5} commands {:>7.2f}s  {}".format(
+                path, run + 1, commands, took, status
+            )
+        )
+
+    total = sum(x[2] for x in results)
+
+    print(
+        "\n{} sessions, {} commands in {:.2f}s: {:.2f} sessions/s, {:.1f} commands/s, {} failed".format(
+            len(results),
+            total,
+            elapsed,
+            len(results) / elapsed,
+            total / elapsed,
+            failed,
+        )
+    )
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
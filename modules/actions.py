@@ -0,0 +1,102 @@
+"""
+Action canonicalizer, used to clump together votes for the same action in democracy mode.
+Everything is table-driven: input is normalised once, then looked up as a whole phrase, then by its first word.
+Games can add their own synonyms through the "synonyms" key in `games.json`.
+"""
+
+from functools import lru_cache
+from typing import Dict
+
+# How many distinct inputs to remember per canonicalizer.
+CACHE_SIZE = 2048
+
+DIRECTIONS = {
+    "n": "north",
+    "s": "south",
+    "e": "east",
+    "w": "west",
+    "ne": "northeast",
+    "nw": "northwest",
+    "se": "southeast",
+    "sw": "southwest",
+    "u": "up",
+    "d": "down",
+}
+
+# Whole inputs, mapped to what they should be clumped as.
+PHRASES: Dict[str, str] = {
+    "z": "wait",
+    "wait": "wait",
+    "i": "inventory",
+    "inv": "inventory",
+    "inventory": "inventory",
+    "l": "look",
+    "look": "look",
+    "g": "again",
+    "again": "again",
+    "space": "SPACE",
+}
+
+for short, full in DIRECTIONS.items():
+    for word in (short, full):
+        for prefix in ("", "go ", "walk ", "run "):
+            PHRASES[prefix + word] = short
+
+for key in ("enter", "space"):
+    for left, right in ("[]", "()", "{}", "<>"):
+        PHRASES[left + key + right] = key.upper()
+
+# First words of an input, mapped to the verb they're short for.
+# These only apply when the verb has an object, eg. "x lamp" but not "x".
+VERBS: Dict[str, str] = {
+    "x": "examine",
+    "examine": "examine",
+    "l": "look",
+    "look": "look",
+    "get": "take",
+    "take": "take",
+}
+
+
+class ActionCanonicalizer:
+    """Turns raw input into a canonical action. Each instance caches its most recent inputs."""
+
+    def __init__(self, synonyms: Dict[str, str] = None):
+        self.phrases = dict(PHRASES)
+        self.verbs = dict(VERBS)
+
+        for word, canonical in (synonyms or {}).items():
+            word = " ".join(word.lower().split())
+            self.phrases[word] = canonical
+
+            if " " not in word:
+                self.verbs[word] = canonical
+
+        self.parse = lru_cache(maxsize=CACHE_SIZE)(self._parse)
+
+    def _parse(self, action: str) -> str:
+        # Uppercase ENTER is how people ask for an empty line; lowercase "enter" is a verb in plenty of games.
+        if action == "ENTER":
+            return "ENTER"
+
+        text = " ".join(action.lower().split())
+        phrase = self.phrases.get(text)
+
+        if phrase is not None:
+            return phrase
+
+        verb, _, rest = text.partition(" ")
+        canonical = self.verbs.get(verb)
+
+        if canonical is not None and rest:
+            return canonical + " " + rest
+
+        return text
+
+
+DEFAULT = ActionCanonicalizer()
+
+
+def parse_action(action: str) -> str:
+    """Parses an action string to easily clump similar actions"""
+    return DEFAULT.parse(action)
@@ -0,0 +1,87 @@
+"""
+In-memory index of blocked users, checked for every command and piece of game input.
+The data store keeps string IDs in lists, which are fine on disk but slow to search, so they get loaded into int sets.
+"""
+
+from typing import Dict, Set
+from modules.store import Namespace
+
+import time
+
+# How long to wait before reminding a blocked user that they are blocked.
+NOTICE_COOLDOWN = 300
+# Expired cooldowns are only swept once there are this many of them.
+NOTICE_SWEEP_SIZE = 4096
+
+
+class BlockIndex:
+    """Per-guild and global sets of blocked user IDs, plus DM cooldowns for blocked users."""
+
+    def __init__(self, data: Namespace, cooldown=NOTICE_COOLDOWN):
+        self.data = data
+        self.guilds: Dict[int, Set[int]] = {}
+        self.globals: Set[int] = {int(x) for x in data.get("global", ())}
+        self.cooldown = cooldown
+        self.notified: Dict[int, float] = {}
+
+    def _users(self, guild_id: int) -> Set[int]:
+        """Gets the blocked users for a guild, loading them from the store the first time."""
+        users = self.guilds.get(guild_id)
+
+        if users is None:
+            users = self.guilds[guild_id] = {
+                int(x) for x in self.data.get(str(guild_id), ())
+            }
+
+        return users
+
+    def _save(self, guild_id: int, users: Set[int]) -> None:
+        if users:
+            self.data[str(guild_id)] = sorted(str(x) for x in users)
+        else:
+            del self.data[str(guild_id)]
+
+    def is_blocked(self, guild_id: int, user_id: int) -> bool:
+        """Checks if a user may not send commands in a guild."""
+        return user_id in self.globals or user_id in self._users(guild_id)
+
+    def block(self, guild_id: int, user_id: int) -> bool:
+        """Blocks a user in a guild. Returns False if they were already blocked."""
+        users = self._users(guild_id)
+
+        if user_id in users:
+            return False
+
+        users.add(user_id)
+        self._save(guild_id, users)
+
+        return True
+
+    def unblock(self, guild_id: int, user_id: int) -> bool:
+        """Unblocks a user in a guild. Returns False if they weren't blocked."""
+        users = self._users(guild_id)
+
+        if user_id not in users:
+            return False
+
+        users.remove(user_id)
+        self.notified.pop(user_id, None)
+        self._save(guild_id, users)
+
+        return True
+
+    def should_notify(self, user_id: int) -> bool:
+        """Checks if a blocked user should be DM'd about it, starting their cooldown if so."""
+        now = time.monotonic()
+        last = self.notified.get(user_id)
+
+        if last is not None and now - last < self.cooldown:
+            return False
+
+        if len(self.notified) >= NOTICE_SWEEP_SIZE:
+            self.notified = {
+                k: v for k, v in self.notified.items() if now - v < self.cooldown
+            }
+
+        self.notified[user_id] = now
+        return True
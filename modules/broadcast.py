@@ -0,0 +1,139 @@
+"""
+Bounded fan-out of one message to many channels, for owner announcements and shutdown notices.
+A fixed number of workers pull channels off a queue, so only that many sends are ever in flight,
+and the library's own rate limit handling paces them instead of hundreds of requests piling up at once.
+"""
+
+from collections import Counter, deque
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set
+
+import time
+import asyncio
+
+# Most sends in flight at once.
+BROADCAST_CONCURRENCY = 10
+# Seconds between progress reports.
+PROGRESS_INTERVAL = 3
+
+# Broadcasts that are currently sending, for metrics.
+RUNNING: Set["Broadcast"] = set()
+
+
+class Broadcast:
+    """
+    Sends `content` to every channel given, keeping the result for each one.
+    Alternatively, `render` can pick the arguments for `send` per channel.
+    """
+
+    def __init__(
+        self,
+        channels: Iterable,
+        content: Optional[str] = None,
+        concurrency: int = BROADCAST_CONCURRENCY,
+        render: Optional[Callable[[Any], dict]] = None,
+    ):
+        self.queue = deque(channels)
+        self.content = content
+        self.render = render
+        self.concurrency = concurrency
+        self.total = len(self.queue)
+        # Channel ID -> None if the send worked, otherwise the name of the error.
+        self.results: Dict[int, Optional[str]] = {}
+        self.sent = 0
+        self.failed = 0
+        self.cancelled = False
+        self.started = None
+        self.finished = None
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.failed
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - (self.started or time.monotonic())
+
+    def cancel(self) -> None:
+        """Stops handing out channels. Sends that are already in flight still finish."""
+        self.cancelled = True
+
+    def errors(self) -> Counter:
+        return Counter(x for x in self.results.values() if x is not None)
+
+    def summary(self) -> str:
+        return "{}/{} sent, {} failed{} in {:.1f}s".format(
+            self.sent,
+            self.total,
+            self.failed,
+            ", {} skipped".format(self.total - self.done) if self.cancelled else "",
+            self.elapsed,
+        )
+
+    async def _worker(self):
+        while self.queue and not self.cancelled:
+            channel = self.queue.popleft()
+
+            try:
+                if self.render:
+                    await channel.send(**self.render(channel))
+                else:
+                    await channel.send(self.content)
+            except Exception as e:
+                self.results[channel.id] = type(e).__name__
+                self.failed += 1
+            else:
+                self.results[channel.id] = None
+                self.sent += 1
+
+    async def _report(self, progress):
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+
+            try:
+                await progress(self)
+            except Exception:
+                # A failed progress report shouldn't take the broadcast down with it.
+                pass
+
+    async def run(
+        self,
+        progress: Optional[Callable[["Broadcast"], Awaitable]] = None,
+        timeout: Optional[float] = None,
+    ) -> "Broadcast":
+        """
+        Sends to every channel, calling `progress` every few seconds while it runs.
+        If `timeout` passes first, whatever is left is cancelled.
+        """
+        self.started = time.monotonic()
+        RUNNING.add(self)
+        workers = [
+            asyncio.ensure_future(self._worker())
+            for _ in range(min(self.concurrency, self.total))
+        ]
+        reporter = asyncio.ensure_future(self._report(progress)) if progress else None
+
+        try:
+            if workers:
+                _, pending = await asyncio.wait(workers, timeout=timeout)
+
+                if pending:
+                    self.cancel()
+
+                    for worker in pending:
+                        worker.cancel()
+
+                    await asyncio.wait(pending)
+        finally:
+            # Don't leave workers running if we were cancelled ourselves.
+            for worker in workers:
+                if not worker.done():
+                    self.cancel()
+                    worker.cancel()
+
+            self.finished = time.monotonic()
+            RUNNING.discard(self)
+
+            if reporter:
+                reporter.cancel()
+
+        return self
@@ -0,0 +1,174 @@
+"""
+Per-command latency, concurrency and error accounting, run as middleware around every command.
+A sweep over whatever is running goes round every so often while commands are in flight, and captures the await chain
+of invocations that have gone on longer than `SLOW_THRESHOLD`, at most once a minute per command,
+so `commandstats` can show where slow commands spend their time without every call paying for a timer.
+"""
+
+from collections import Counter, deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from modules.histogram import Histogram
+from modules.command_sys import ArgumentParseError
+
+import time
+import asyncio
+import traceback
+
+# Seconds a command can run before it counts as slow.
+SLOW_THRESHOLD = 2
+# Slow invocations kept per command.
+MAX_TRACES = 5
+# Minimum seconds between traces of the same command, so a command that's always slow costs one capture a minute at most.
+TRACE_INTERVAL = 60
+# Deepest await chain kept for a trace.
+TRACE_DEPTH = 15
+
+
+class SlowTrace:
+    """A slow invocation, with the await chain it was stuck on when it crossed the threshold."""
+
+    __slots__ = ("when", "duration", "user_id", "channel_id", "input", "stack")
+
+    def __init__(self, ctx, stack: str):
+        self.when = datetime.utcnow()
+        # Filled in when the command finishes.
+        self.duration = None
+        self.user_id = ctx.msg.author.id
+        self.channel_id = ctx.msg.channel.id
+        self.input = ctx.clean[:100]
+        self.stack = stack
+
+
+class Invocation:
+    __slots__ = ("start", "stat", "ctx", "task", "trace")
+
+    def __init__(self, start: float, stat: "CommandStat", ctx, task: asyncio.Task):
+        self.start = start
+        self.stat = stat
+        self.ctx = ctx
+        self.task = task
+        self.trace: Optional[SlowTrace] = None
+
+
+class CommandStat:
+    __slots__ = ("latency", "in_flight", "errors", "traces", "last_trace")
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.in_flight = 0
+        # Exception name -> count.
+        self.errors: Counter = Counter()
+        self.traces = deque(maxlen=MAX_TRACES)
+        self.last_trace = 0.0
+
+    @property
+    def calls(self) -> int:
+        return self.latency.count
+
+    @property
+    def failed(self) -> int:
+        return sum(self.errors.values())
+
+
+def await_chain(coro) -> str:
+    """Formats where a suspended coroutine is, following what it's awaiting down to the innermost call."""
+    frames = []
+
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+
+        if frame is None:
+            break
+
+        frames.append(
+            (frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name, None)
+        )
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+
+    # The innermost calls are the interesting ones.
+    return "".join(
+        traceback.format_list(traceback.StackSummary.from_list(frames[-TRACE_DEPTH:]))
+    )
+
+
+class CommandStats:
+    """Middleware for `Holder`. Keeps a `CommandStat` for every command that's been run."""
+
+    def __init__(self, xyzzy, slow_threshold: float = SLOW_THRESHOLD):
+        self.xyzzy = xyzzy
+        self.slow_threshold = slow_threshold
+        self.stats: Dict[str, CommandStat] = {}
+        self.running: Dict[int, Invocation] = {}
+        self.sweeper = None
+
+    def get(self, name: str) -> CommandStat:
+        stat = self.stats.get(name)
+
+        if stat is None:
+            stat = self.stats[name] = CommandStat()
+
+        return stat
+
+    def by_total_time(self) -> List[tuple]:
+        return sorted(self.stats.items(), key=lambda x: x[1].latency.sum, reverse=True)
+
+    async def __call__(self, cmd, run, ctx) -> None:
+        stat = self.get(cmd.name)
+        start = time.perf_counter()
+        invocation = Invocation(start, stat, ctx, asyncio.current_task())
+        self.running[id(invocation)] = invocation
+        stat.in_flight += 1
+
+        if self.sweeper is None:
+            self.sweeper = self.xyzzy.timers.schedule(
+                self.slow_threshold / 2, self._sweep
+            )
+
+        counted = True
+
+        try:
+            await run(ctx)
+        except ArgumentParseError:
+            # A message that couldn't be split into arguments says nothing about the command, so it isn't counted.
+            counted = False
+            raise
+        except Exception as e:
+            stat.errors[type(e).__name__] += 1
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            del self.running[id(invocation)]
+            stat.in_flight -= 1
+
+            if counted:
+                stat.latency.observe(duration)
+
+            if invocation.trace is not None:
+                invocation.trace.duration = duration
+
+    def _sweep(self):
+        self.sweeper = None
+        now = time.perf_counter()
+
+        for invocation in list(self.running.values()):
+            stat = invocation.stat
+
+            if (
+                invocation.trace is None
+                and now - invocation.start >= self.slow_threshold
+                and time.monotonic() - stat.last_trace >= TRACE_INTERVAL
+                and invocation.task is not None
+                and not invocation.task.done()
+            ):
+                stat.last_trace = time.monotonic()
+                invocation.trace = SlowTrace(
+                    invocation.ctx, await_chain(invocation.task.get_coro())
+                )
+                stat.traces.append(invocation.trace)
+
+        if self.running:
+            self.sweeper = self.xyzzy.timers.schedule(
+                self.slow_threshold / 2, self._sweep
+            )
@@ -2,7 +2,8 @@
 Totally not "stolen" from Amethyst and stripped down.
 """
 
-from typing import Callable, List, Union, Tuple
+from typing import Callable, List, Optional, Union, Tuple
+from functools import partial
 from random import randint
 import disnake as discord
 import inspect
@@ -25,6 +26,60 @@ PERMS = [
 ]
 
 
+class ArgumentParseError(ValueError):
+    """Raised when a command reads `Context.args` and the message can't be split by shlex."""
+
+
+def parse_args(clean: str) -> typing.List[str]:
+    """Splits the text after the prefix into arguments, dropping the command name."""
+    try:
+        args = shlex.split(
+            clean.replace(r"\"", "\u009e").replace("'", "\u009f")
+        )  # Shlex doesn't obey escaped quotes, so lets do it ourselves.
+    except ValueError as e:
+        raise ArgumentParseError(str(e)) from e
+
+    return [x.replace("\u009e", '"').replace("\u009f", "'") for x in args][1:]
+
+
+class Envelope:
+    """
+    A message that has been checked once for the bot's prefix or for being a reply to the bot.
+    Created with `Envelope.parse`, and then passed through to game input or a `Context`.
+    """
+
+    __slots__ = ("msg", "is_reply", "clean", "cmd", "raw")
+
+    def __init__(self, msg: discord.Message, is_reply: bool, clean: str):
+        self.msg = msg
+        self.is_reply = is_reply
+        self.clean = clean
+
+        parts = clean.split(" ", 1)
+        self.cmd = parts[0]
+        self.raw = parts[1] if len(parts) > 1 else ""
+
+    @classmethod
+    def parse(cls, msg: discord.Message, xyzzy: "Xyzzy") -> Optional["Envelope"]:
+        """Returns an envelope if the message is addressed to the bot, otherwise None."""
+        ref = msg.reference
+
+        # Take plain message content if it's a reply to us, otherwise force prefix match
+        if (
+            ref is not None
+            and isinstance(ref.resolved, discord.Message)
+            and ref.resolved.author.id == xyzzy.user.id
+        ):
+            return cls(msg, True, msg.content)
+
+        match = xyzzy.prefix.match(msg.content)
+
+        if match is None:
+            return None
+
+        return cls(msg, False, match[1].strip())
+
+
 class Context:
     """
     Custom object that gets passed to commands.
@@ -33,35 +88,31 @@ class Context:
 
     msg: discord.Message
     client: "Xyzzy"
+    envelope: Envelope
     clean: str
     cmd: str
-    args: typing.List[str]
     raw: str
 
-    def __init__(self, msg: discord.Message, xyzzy: "Xyzzy"):
-        is_reply_to_me = (
-            msg.reference
-            and isinstance(msg.reference.resolved, discord.Message)
-            and msg.reference.resolved.author.id == xyzzy.user.id
-        )
+    def __init__(self, msg: discord.Message, xyzzy: "Xyzzy", envelope: Envelope = None):
+        if envelope is None:
+            envelope = typing.cast(Envelope, Envelope.parse(msg, xyzzy))
 
         self.msg = msg
         self.client = xyzzy
+        self.envelope = envelope
 
-        self.clean = (
-            msg.content
-            if is_reply_to_me
-            else typing.cast(re.Match, xyzzy.prefix.match(msg.content))[1].strip()
-        )
+        self.clean = envelope.clean
+        self.cmd = envelope.cmd
+        self.raw = envelope.raw
+        self._args = None
 
-        self.cmd = self.clean.split(" ")[0]
-        self.args = shlex.split(
-            self.clean.replace(r"\"", "\u009E").replace("'", "\u009F")
-        )  # Shlex doesn't obey escaped quotes, so lets do it ourselves.
-        self.args = [
-            x.replace("\u009E", '"').replace("\u009F", "'") for x in self.args
-        ][1:]
-        self.raw = self.clean.split(" ", 1)[1] if len(self.clean.split(" ")) > 1 else ""
+    @property
+    def args(self) -> typing.List[str]:
+        """Shlex-split arguments, only parsed the first time a command asks for them."""
+        if self._args is None:
+            self._args = parse_args(self.clean)
+
+        return self._args
 
     async def _send(self, content, dest, *, embed=None, file=None, files=None):
         """Internal send function, not actually meant to be used by anyone."""
@@ -94,8 +145,8 @@ class Context:
             # Escape bad mentions
             content = (
                 str(content)
-                .replace("@everyone", "@\u200Beveryone")
-                .replace("@here", "@\u200Bhere")
+                .replace("@everyone", "@\u200beveryone")
+                .replace("@here", "@\u200bhere")
             )
 
         msg = None
@@ -161,9 +212,7 @@ class Context:
             return False
 
         if who == "self":
-            return getattr(
-                self.msg.channel.permissions_for(self.msg.guild.me), permission
-            )
+            return getattr(self.client.perms.permissions(self.msg.channel), permission)
         elif who == "author":
             return getattr(
                 self.msg.channel.permissions_for(self.msg.author), permission
@@ -217,6 +266,8 @@ class Holder:
         self.aliases = {}
         self.modules = {}
         self.xyzzy = xyzzy
+        # Called as `middleware(cmd, run, ctx)` around every command, outermost first. Each one awaits `run(ctx)` to carry on.
+        self.middleware: List[Callable] = []
 
     def __len__(self):
         return len(self.commands)
@@ -305,9 +356,7 @@ class Holder:
         return (
             self.aliases[cmd_name]
             if cmd_name in self.aliases
-            else self.commands[cmd_name]
-            if cmd_name in self.commands
-            else None
+            else self.commands[cmd_name] if cmd_name in self.commands else None
         )
 
     async def run(self, ctx: Context) -> None:
@@ -316,7 +365,12 @@ class Holder:
         if not cmd:
             return
 
-        await cmd.run(ctx)
+        run = cmd.run
+
+        for middleware in reversed(self.middleware):
+            run = partial(middleware, cmd, run)
+
+        await run(ctx)
 
     @property
     def all_commands(self) -> List[str]:
@@ -0,0 +1,70 @@
+"""
+Vote counting for democracy mode.
+Every vote is O(1): the tally keeps who voted for what, a count per action, and the current leaders.
+"""
+
+from typing import Dict, List
+
+import heapq
+
+
+class VoteTally:
+    """Votes for a single voting window. Each voter gets one vote, which can't be changed."""
+
+    __slots__ = ("voters", "counts", "best", "leaders")
+
+    def __init__(self):
+        self.voters: Dict[int, str] = {}
+        self.counts: Dict[str, int] = {}
+        self.best = 0
+        self.leaders: List[str] = []
+
+    def __len__(self):
+        return len(self.voters)
+
+    def __bool__(self):
+        return bool(self.voters)
+
+    def vote(self, voter_id: int, action: str) -> bool:
+        """Records a vote. Returns False if the voter has already voted this window."""
+        if voter_id in self.voters:
+            return False
+
+        self.voters[voter_id] = action
+        count = self.counts[action] = self.counts.get(action, 0) + 1
+
+        # Counts only ever go up, so the leaders can be tracked without rescanning.
+        if count > self.best:
+            self.best = count
+            self.leaders = [action]
+        elif count == self.best:
+            self.leaders.append(action)
+
+        return True
+
+    def winners(self) -> List[str]:
+        """Returns every action tied for the most votes, sorted by name."""
+        return sorted(self.leaders)
+
+    def top(self, amount: int):
+        """Returns the `amount` most voted actions, as (action, count) pairs."""
+        return heapq.nlargest(amount, self.counts.items(), key=lambda x: x[1])
+
+    def render(self, amount: int = 10) -> str:
+        """Formats the tally as a message for the channel."""
+        lines = [
+            '{:>4}  "{}"'.format(count, action) for action, count in self.top(amount)
+        ]
+
+        if len(self.counts) > amount:
+            lines.append("      ...and {} more".format(len(self.counts) - amount))
+
+        return "```py\n@ CURRENT VOTES @ ({} voter{})\n{}\n```".format(
+            len(self.voters), "" if len(self.voters) == 1 else "s", "\n".join(lines)
+        )
+
+    def clear(self) -> None:
+        self.voters.clear()
+        self.counts.clear()
+        self.best = 0
+        self.leaders = []
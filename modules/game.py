@@ -1,4 +1,19 @@
+from typing import Dict, Tuple
+from modules.actions import ActionCanonicalizer
+
+
 class Game:
+    __slots__ = (
+        "name",
+        "path",
+        "url",
+        "aliases",
+        "author",
+        "debug",
+        "synonyms",
+        "_actions",
+    )
+
     def __init__(self, name, data):
         self.name = name
         self.path = data["path"]
@@ -6,3 +21,35 @@ class Game:
         self.aliases = data.get("aliases", [])
         self.author = data.get("author")
         self.debug = data.get("debug", False)
+        self.synonyms = data.get("synonyms", {})
+        self._actions = None
+
+    @property
+    def actions(self) -> ActionCanonicalizer:
+        """The canonicalizer for this game's actions, shared by every session playing it."""
+        if self._actions is None:
+            self._actions = ActionCanonicalizer(self.synonyms)
+
+        return self._actions
+
+
+def find_games(
+    games: Dict[str, Game], query: str
+) -> Tuple[Dict[str, Game], Dict[str, Game]]:
+    """
+    Searches games by name and aliases, the way `play` does.
+    Returns every game with the query somewhere in its name or an alias, and those of them that match it exactly.
+    """
+    query = query.lower()
+    found = {
+        x: y
+        for x, y in games.items()
+        if query in x.lower() or any(query in z.lower() for z in y.aliases)
+    }
+    perfect = {
+        x: y
+        for x, y in found.items()
+        if query == x.lower() or any(query == z.lower() for z in y.aliases)
+    }
+
+    return found, perfect
@@ -1,54 +1,54 @@
-from subprocess import PIPE
 from enum import Enum
-from modules.process_helpers import handle_process_output
+from typing import Optional
+from modules.democracy import VoteTally
+from modules.input_queue import InputQueue
+from modules.session_engine import SessionEngine
+from modules.spectators import Frame, Spectators
+from modules.recap import RecapBuffer, INPUT, FRAME
+from modules.memory import SessionMemory, heap_size, process_rss
 
-import re
-import shutil
 import os
 import asyncio
 import disnake as discord
 
-SCRIPT_OR_RECORD = re.compile(r"(?i).*(?:\.rec|\.scr)$")
-
-
-def parse_action(action):
-    """Parses an action string to easily clump similar actions"""
-    if action.lower() in ("n", "north", "go n", "go north", "walk north", "run north"):
-        return "n"
-    elif action.lower() in (
-        "s",
-        "south",
-        "go s",
-        "go south",
-        "walk south",
-        "run south",
-    ):
-        return "s"
-    elif action.lower() in ("e", "east", "go e", "go east", "walk east", "run east"):
-        return "e"
-    elif action.lower() in ("w", "west", "go w", "go west", "walk west", "run west"):
-        return "w"
-    elif (
-        action.lower() in ("[enter]", "(enter)", "{enter}", "<enter>")
-        or action == "ENTER"
-    ):
-        return "ENTER"
-    elif action.lower() in ("space", "[space]", "(space)", "{space}", "<space>"):
-        return "SPACE"
-    elif re.match(r"^(?:x|examine) +(?:.+)", action.lower()):
-        return "examine " + action.lower().split(" ", 1)[1].strip()
-    elif action.lower() in ("z", "wait"):
-        return "wait"
-    elif action.lower() in ("i", "inventory", "inv"):
-        return "inventory"
-    if re.match(r"l(?:ook)(?: .*)?", action.lower()):
-        return (
-            "look " + action.lower().split(" ", 1)[1].strip()
-            if len(action.lower().split(" ")) > 1
-            else "look"
-        )
-    else:
-        return action.lower()
+# Seconds between edits of the democracy vote tally.
+TALLY_INTERVAL = 2
+# Length of a democracy voting window, and when in it to warn that it's closing.
+VOTE_WINDOW = 15
+VOTE_WARNING = 10
+# Most commands that can be pipelined from a single message, and what separates them.
+MAX_PIPELINE = 20
+PIPELINE_SEPARATOR = ";"
+
+
+def split_pipeline(input):
+    """
+    Splits compound input like "n; e; take lamp" into a list of commands, to be fed in one at a time,
+    and returns it with how many commands were left off past `MAX_PIPELINE`.
+    Separators inside double quotes don't count, so `say "hi; bye"` is left whole.
+    Anything that isn't compound is passed back untouched.
+    """
+    if PIPELINE_SEPARATOR not in input:
+        return input, 0
+
+    commands = []
+    start = 0
+    quoted = False
+
+    for i, char in enumerate(input):
+        if char == '"':
+            quoted = not quoted
+        elif char == PIPELINE_SEPARATOR and not quoted:
+            commands.append(input[start:i])
+            start = i + 1
+
+    commands.append(input[start:])
+    commands = [x.strip() for x in commands if x.strip()]
+
+    if len(commands) < 2:
+        return input, 0
+
+    return commands[:MAX_PIPELINE], max(0, len(commands) - MAX_PIPELINE)
 
 
 class InputMode(Enum):
@@ -60,39 +60,83 @@ class InputMode(Enum):
 class GameChannel:
     """Represents a channel that is prepped for playing a game through Xyzzy."""
 
-    def __init__(self, msg, game):
+    # There's one of these for every game being played, so they're kept compact.
+    __slots__ = (
+        "xyzzy",
+        "loop",
+        "output",
+        "last",
+        "owner_id",
+        "channel",
+        "game",
+        "playing",
+        "mode",
+        "votes",
+        "timer",
+        "voting",
+        "tally_msg",
+        "tally_timer",
+        "tally_shown",
+        "idle_timer",
+        "idle_warned",
+        "engine",
+        "spectators",
+        "recap",
+        "transcript",
+        "memory",
+    )
+
+    def __init__(self, msg, game, xyzzy):
+        self.xyzzy = xyzzy
         self.loop = asyncio.get_event_loop()
-        self.indent = 0
         self.output = False
         self.last = msg.created_at
-        self.owner = msg.author
+        # Whoever started the game, or has since been passed the "wheel".
+        self.owner_id = msg.author.id
         self.channel = msg.channel
         self.game = game
-        self.process = None
         self.playing = False
-        self.save_path = "./saves/" + str(self.channel.id)
-        self.last_save = None
-        self.save = None
         self.mode = InputMode.ANARCHY
-        self.votes = {}
+        self.votes = VoteTally()
         self.timer = None
         self.voting = True
+        self.tally_msg = None
+        self.tally_timer = None
+        self.tally_shown = 0
+        self.idle_timer = None
+        self.idle_warned = False
+        self.engine = SessionEngine(
+            game,
+            "./saves/" + str(self.channel.id),
+            InputQueue(xyzzy.input_queue_size, xyzzy.input_queue_policy),
+            self._on_output,
+            self._on_input,
+        )
+        self.spectators = Spectators(xyzzy.perms)
+        self.recap = RecapBuffer(xyzzy.recap_size)
+        self.transcript = xyzzy.transcripts.open(self.channel.id, game.name)
+        # Latest estimate of what this session costs, kept up to date by the session manager.
+        self.memory: Optional[SessionMemory] = None
+
+    def _democracy_warning(self):
+        self.timer = self.xyzzy.timers.schedule(
+            VOTE_WINDOW - VOTE_WARNING, self._democracy_end
+        )
 
-    async def _democracy_loop(self):
-        try:
-            await asyncio.sleep(10)
-            await self.channel.send("```py\n@ 5 seconds of voting remaining. @\n```")
-            await asyncio.sleep(5)
-
-            self.voting = False
-            vote_sort = sorted(
-                self.votes.items(), key=lambda x: len(x[1]), reverse=True
+        return self.channel.send(
+            "```py\n@ {} seconds of voting remaining. @\n```".format(
+                VOTE_WINDOW - VOTE_WARNING
             )
-            highest = sorted(x for x in vote_sort if len(x[1]) == len(vote_sort[0][1]))
+        )
+
+    async def _democracy_end(self):
+        self.voting = False
+        self._stop_tally()
+        highest = self.votes.winners()
 
+        try:
             # Discard draws
             if len(highest) > 1:
-                highest = [x[0] for x in highest]
                 draw_join = '"{}" and "{}"'.format(", ".join(highest[:-1]), highest[-1])
 
                 await self.channel.send(
@@ -101,200 +145,181 @@ class GameChannel:
                     )
                 )
             else:
-                cmd = highest[0][0]
-                amt = len(highest[0][1])
+                cmd = highest[0]
+                amt = self.votes.best
 
                 await self.channel.send(
                     '```py\n@ VOTING RESULTS @\nRunning command "{}" with {} vote(s).\n```'.format(
                         cmd, amt
                     )
                 )
-                self._send_input(cmd)
-
-            self.votes = {}
+                await self.engine.send(cmd)
+        finally:
+            self.votes.clear()
             self.voting = True
             self.timer = None
-        except Exception as e:
-            print(e)
-            raise e
 
-    def _send_input(self, input):
-        """Send's text input to the game process."""
-        if not self.process:
-            raise Exception("Channel does not have an attached process.")
+    def _tally_tick(self):
+        """Edits the vote tally if votes have come in since it was last shown."""
+        self.tally_timer = None
 
-        if input == "ENTER":
-            input = ""
-        elif input == "SPACE":
-            input = " "
+        if not self.voting or len(self.votes) == self.tally_shown:
+            return
 
-        self.process.stdin.write((input + "\n").encode("latin-1", "replace"))
+        self.tally_timer = self.xyzzy.timers.schedule(TALLY_INTERVAL, self._tally_tick)
+        return self._show_tally()
 
-    async def parse_output(self, buffer):
-        if buffer != b"":
-            out = buffer.decode("latin-1", "replace")
-            msg = ""
+    async def _show_tally(self):
+        self.tally_shown = len(self.votes)
 
-            for i, line in enumerate(out.splitlines()):
-                if line.strip() == ".":
-                    line = ""
+        if self.tally_msg is None:
+            self.tally_msg = await self.channel.send(self.votes.render())
+        else:
+            await self.tally_msg.edit(content=self.votes.render())
 
-                line = line.replace("*", "\*").replace("_", "\_").replace("~", "\~")
+    def _queue_tally(self):
+        """Shows the tally straight away, unless it's been shown in the last `TALLY_INTERVAL` seconds."""
+        if self.tally_timer is None:
+            self.tally_timer = self.xyzzy.timers.schedule(
+                TALLY_INTERVAL, self._tally_tick
+            )
+            self.loop.create_task(self._show_tally())
 
-                if len(msg + line[self.indent :] + "\n") < 2000:
-                    msg += line[self.indent :] + "\n"
-                else:
-                    await self.send_game_output(msg)
+    def _stop_tally(self):
+        if self.tally_timer is not None:
+            self.tally_timer.cancel()
+            self.tally_timer = None
 
-                    msg = line[self.indent :]
+        self.tally_msg = None
+        self.tally_shown = 0
 
-            if not msg.strip():
-                return
+    def stop_timers(self):
+        """Cancels every timer belonging to this session."""
+        for timer in (self.timer, self.idle_timer):
+            if timer is not None:
+                timer.cancel()
 
-            msg = msg.strip()
-            saves = self.check_saves()
+        self.timer = None
+        self.idle_timer = None
+        self._stop_tally()
 
-            if self.first_time:
-                saves = None
-                self.first_time = False
+    def _on_input(self, line):
+        self.recap.add(INPUT, line)
+        self.transcript.record(INPUT, line)
 
-            await self.send_game_output(msg, saves)
+    async def _on_output(self, text, save):
+        """Escapes the game's output and splits it into pages that fit in a message."""
+        msg = ""
 
-    async def game_loop(self):
-        """Enters into the channel's game process loop."""
-        if not self.process:
-            await self.init_process()
+        for line in text.splitlines():
+            line = line.replace("*", "\\*").replace("_", "\\_").replace("~", "\\~")
 
-        self.first_time = True
-        self.playing = True
+            if len(msg + line + "\n") < 2000:
+                msg += line + "\n"
+            else:
+                await self.send_game_output(msg)
 
-        async def looper(buffer):
-            await self.parse_output(buffer)
+                msg = line
 
-            if os.path.exists(self.save_path):
-                files = os.listdir(self.save_path)
-                latest = 0
+        if not msg.strip():
+            return
 
-                for file in os.listdir(self.save_path):
-                    mod_time = os.stat("{}/{}".format(self.save_path, file)).st_mtime_ns
+        await self.send_game_output(
+            msg.strip(), save and discord.File(save, os.path.basename(save))
+        )
 
-                    if (
-                        mod_time < latest
-                        or SCRIPT_OR_RECORD.match(file)
-                        or file == "__UPLOADED__.qzl"
-                    ):
-                        os.unlink("{}/{}".format(self.save_path, file))
-                    elif mod_time > latest and not SCRIPT_OR_RECORD.match(file):
-                        latest = mod_time
+    async def game_loop(self):
+        """Enters into the channel's game process loop."""
+        self.playing = True
 
-        await handle_process_output(self.process, looper, self.parse_output)
+        await self.engine.run()
 
         self.playing = False
         end_msg = "```diff\n-The game has ended.\n"
         end_kwargs = {}
 
-        if self.last_save:
-            file_dir = "{}/{}".format(self.save_path, self.last_save)
+        save = self.engine.final_save()
 
-            if os.path.isfile(file_dir):
-                end_kwargs = {"file": discord.File(file_dir, self.last_save)}
-                end_msg += "+Here is your most recent save from the game.\n"
+        if save:
+            end_kwargs = {"file": discord.File(save, self.engine.last_save)}
+            end_msg += "+Here is your most recent save from the game.\n"
 
         end_msg += "```"
 
         await self.channel.send(end_msg, **end_kwargs)
+        self.spectators.push(
+            "```diff\n-The game being played in #{} has ended.\n```".format(
+                self.channel.name
+            )
+        )
 
         self.cleanup()
 
     async def force_quit(self):
         """Forces the channel's game process to end."""
-        if self.process is not None:
-            self.process.terminate()
-
+        self.engine.terminate()
         self.playing = False
 
-        if self.timer:
-            self.timer.cancel_task()
+        self.stop_timers()
 
     async def handle_input(self, msg, input):
         """Easily handles the various input types for the game."""
 
         if self.mode == InputMode.ANARCHY:
             # Default mode, anyone can send any command at any time.
-            self._send_input(input)
+            await self._send_pipeline(input)
         elif self.mode == InputMode.DEMOCRACY:
             # Players vote on commands. After 15 seconds of input, the top command is picked.
             # On ties, all commands are scrapped and we start again.
             if not self.voting:
                 return
 
-            voters = []
-            [voters.extend(x) for x in self.votes.values()]
-
-            if msg.author.id in voters:
+            if not self.votes.vote(msg.author.id, self.game.actions.parse(input)):
                 return
 
-            action = parse_action(input)
-
-            if action in self.votes:
-                self.votes[action] += [msg.author.id]
-            else:
-                self.votes[action] = [msg.author.id]
-
-            await self.channel.send(
-                "{} has voted for `{}`".format(msg.author.mention, action)
-            )
+            # One tally message gets edited as votes come in, instead of a message per vote.
+            self._queue_tally()
 
             if not self.timer:
-                self.timer = self.loop.create_task(self._democracy_loop())
+                self.timer = self.xyzzy.timers.schedule(
+                    VOTE_WARNING, self._democracy_warning
+                )
 
         elif self.mode == InputMode.DRIVER:
             # Only the "driver" can send input. They can pass the "wheel" to other people.
-            if msg.author.id == self.owner.id:
-                self._send_input(input)
+            if msg.author.id == self.owner_id:
+                await self._send_pipeline(input)
         else:
             raise ValueError("Currently in unknown input state: {}".format(self.mode))
 
+    async def _send_pipeline(self, input):
+        commands, dropped = split_pipeline(input)
+        await self.engine.send(commands)
+
+        if dropped:
+            await self.channel.send(
+                "```diff\n-Only the first {} commands were sent to the game. The other {} were left off.\n```".format(
+                    MAX_PIPELINE, dropped
+                )
+            )
+
     async def init_process(self):
         """Sets up the channel's game process."""
-        if self.process:
-            raise Exception("Game already has a process.")
-
-        # Make directory for saving
-        if not os.path.exists(self.save_path):
-            os.makedirs(self.save_path)
-
-        if self.save:
-            self.process = await asyncio.create_subprocess_shell(
-                "dfrotz -h 80 -w 5000 -m -R {} -L {} '{}'".format(
-                    self.save_path, self.save, self.game.path
-                ),
-                stdout=PIPE,
-                stdin=PIPE,
-            )
-        else:
-            self.process = await asyncio.create_subprocess_shell(
-                "dfrotz -h 80 -w 5000 -m -R {} '{}'".format(
-                    self.save_path, self.game.path
-                ),
-                stdout=PIPE,
-                stdin=PIPE,
-            )
+        await self.engine.start()
 
     async def send_game_output(self, msg, save=None):
-        """Sends the game output to the game's channel, handling permissions."""
+        """Sends the game output to the game's channel and any spectators, handling permissions."""
         if self.output:
             print(msg)
 
-        can_attach = self.channel.permissions_for(self.channel.guild.me).attach_files
-        opts = {}
+        perms = self.xyzzy.perms.permissions(self.channel)
+        can_attach = perms.attach_files
+        frame = Frame(msg, self.xyzzy.perms.colour(self.channel))
+        opts = frame.kwargs(perms.embed_links)
 
-        if self.channel.permissions_for(self.channel.guild.me).embed_links:
-            opts["embed"] = discord.Embed(
-                description=msg, colour=self.channel.guild.me.top_role.colour
-            )
-        else:
-            opts["content"] = ">>> {}".format(msg)
+        self.spectators.push(frame)
+        self.recap.add(FRAME, msg)
+        self.transcript.record(FRAME, msg)
 
         if save and can_attach:
             opts["file"] = save
@@ -305,6 +330,8 @@ class GameChannel:
                     "If you wish to have saves available, please give me the `Attach Files` permission."
                 )
             else:
+                # The embed is shared with spectators, who don't need to hear about this.
+                opts["embed"] = opts["embed"].copy()
                 opts["embed"].add_field(
                     name="\u200b",
                     value="I was unable to attach the save game due to not having permission to attach files.\n"
@@ -313,32 +340,25 @@ class GameChannel:
 
         await self.channel.send(**opts)
 
-    def check_saves(self):
-        """Checks if the user saved the game."""
-        if os.path.exists(self.save_path):
-            files = [
-                x
-                for x in os.listdir(self.save_path)
-                if not SCRIPT_OR_RECORD.match(x) and x != "__UPLOADED__.qzl"
-            ]
-            latest = [0, None]
-
-            for file in files:
-                mod_time = os.stat("{}/{}".format(self.save_path, file)).st_mtime_ns
-
-                if mod_time > latest[0]:
-                    latest = [mod_time, file]
-
-            if latest[1] and latest[1] != self.last_save:
-                self.last_save = latest[1]
-                return discord.File(
-                    "{}/{}".format(self.save_path, latest[1]), latest[1]
-                )
-            return None
+    def estimate_memory(self) -> SessionMemory:
+        """Estimates what this session costs: its share of the bot's heap, and its interpreter's resident memory."""
+        process = self.engine.process
+        shared = (
+            self.xyzzy,
+            self.loop,
+            self.game,
+            self.channel,
+            self.transcript.writer,
+            self.spectators.perms,
+        )
+        interpreter = None
+
+        if process is not None and process.returncode is None:
+            interpreter = process_rss(process.pid)
+
+        return SessionMemory(heap_size(self, shared), interpreter)
 
     def cleanup(self):
         """Cleans up after the game."""
-
-        # Check if cleanup has already been done.
-        if os.path.isdir(self.save_path):
-            shutil.rmtree(self.save_path)
+        self.transcript.close()
+        self.engine.cleanup()
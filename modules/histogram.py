@@ -0,0 +1,82 @@
+"""
+Fixed-bucket histogram, cheap enough to update on every event.
+Buckets are upper bounds in seconds, kept as plain counts so they can be exported as-is in the Prometheus text format,
+and percentiles are read off the buckets rather than from stored samples.
+"""
+
+from bisect import bisect_left
+from typing import List, Sequence, Tuple
+
+# Upper bounds, in seconds, suiting anything from a few milliseconds to a few seconds.
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "count", "sum", "max")
+
+    def __init__(self, bounds: Sequence[float] = LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        # One more than the bounds, for everything over the last one.
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def percentile(self, q: float) -> float:
+        """The upper bound of the bucket holding the `q`th (0 to 1) observation, or the max if it's past the last bound."""
+        if not self.count:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+
+            if seen >= rank:
+                return min(bound, self.max)
+
+        return self.max
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """`(upper bound, observations at or under it)` for every bucket, ending with infinity."""
+        out = []
+        seen = 0
+
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            seen += count
+            out.append((bound, seen))
+
+        return out
+
+    def reset(self) -> None:
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
@@ -0,0 +1,67 @@
+"""
+Bounded queue of input lines waiting to be written to a game's interpreter.
+Lines are only handed over when the interpreter is waiting for input, so a flood of anarchy input
+piles up here (where it's capped) instead of in the process' stdin buffer.
+"""
+
+from collections import deque
+from enum import Enum
+
+# Inputs standing in for a keypress, which can't be merged with anything.
+KEYS = ("ENTER", "SPACE")
+
+
+class QueuePolicy(Enum):
+    """What to do with new input when the queue is full."""
+
+    DROP_OLDEST = 1  # Throw away the oldest queued line to make room.
+    REJECT = 2  # Throw away the new line.
+    MERGE = 3  # Tack the new line onto the newest queued one, as "n. e".
+
+
+class InputQueue:
+    __slots__ = ("lines", "maxsize", "policy", "dropped", "rejected", "merged")
+
+    def __init__(
+        self, maxsize: int = 10, policy: QueuePolicy = QueuePolicy.DROP_OLDEST
+    ):
+        self.lines = deque()
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+        self.rejected = 0
+        self.merged = 0
+
+    def __len__(self):
+        return len(self.lines)
+
+    def push(self, line) -> bool:
+        """Queues a line of input, or a list of pipelined lines. Returns False if it was rejected."""
+        if len(self.lines) < self.maxsize:
+            self.lines.append(line)
+        elif self.policy == QueuePolicy.DROP_OLDEST:
+            self.lines.popleft()
+            self.lines.append(line)
+            self.dropped += 1
+        elif (
+            self.policy == QueuePolicy.MERGE
+            and self.lines
+            and isinstance(line, str)
+            and isinstance(self.lines[-1], str)
+            and line not in KEYS
+            and self.lines[-1] not in KEYS
+        ):
+            # Z-machine parsers treat periods as separate commands on the same line.
+            self.lines[-1] += ". " + line
+            self.merged += 1
+        else:
+            self.rejected += 1
+            return False
+
+        return True
+
+    def pop(self):
+        return self.lines.popleft()
+
+    def clear(self) -> None:
+        self.lines.clear()
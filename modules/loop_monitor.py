@@ -0,0 +1,194 @@
+"""
+Event loop lag monitoring.
+A sampler task sleeps for a fixed interval and records how late it wakes up, which is how long everything else on the loop
+kept it waiting. That's always on, costing one wakeup every `interval` seconds.
+
+The slow-callback detector is opt-in. A watchdog thread checks that the sampler is still waking up, and when the loop
+has been stuck for longer than `threshold`, grabs the loop thread's stack and works out from it which task is running,
+so the blocking call is caught in the act rather than guessed at afterwards.
+"""
+
+from collections import deque
+from datetime import datetime
+from modules.histogram import Histogram
+
+import sys
+import time
+import asyncio
+import inspect
+import threading
+import traceback
+import disnake as discord
+
+# Seconds between lag samples.
+LAG_INTERVAL = 0.25
+# Stalls remembered for `lag`.
+MAX_STALLS = 20
+# Minimum seconds between stall reports to the home channel. Stalls in between are counted and mentioned in the next one.
+REPORT_INTERVAL = 300
+# Deepest stack frames kept for a stall.
+STACK_DEPTH = 12
+
+
+class Stall:
+    """A time the loop was blocked for longer than the detector's threshold."""
+
+    __slots__ = ("when", "duration", "task", "stack")
+
+    def __init__(self, task: str, stack: str):
+        self.when = datetime.utcnow()
+        # Filled in once the loop gets going again.
+        self.duration = None
+        self.task = task
+        self.stack = stack
+
+
+def describe_stack(frame) -> str:
+    """
+    Names what the loop is running from its thread's stack: the task's coroutine, or a plain callback.
+    Only the frames are looked at, as asyncio's own record of the current task isn't safe to read off the loop's thread.
+    """
+    frames = []
+
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+
+    # Outermost first, so what the loop's handle called is straight after it.
+    frames.reverse()
+    running = None
+
+    for i, frame in enumerate(frames):
+        code = frame.f_code
+
+        if code.co_name == "_run" and code.co_filename == asyncio.events.__file__:
+            running = frames[i + 1 :]
+
+    if not running:
+        return "a callback"
+
+    # A task's outermost coroutine frame is its coroutine, whether or not the task's step is a Python frame.
+    for frame in running:
+        if frame.f_code.co_flags & inspect.CO_COROUTINE:
+            return getattr(frame.f_code, "co_qualname", frame.f_code.co_name)
+
+    return "a callback ({})".format(
+        getattr(running[0].f_code, "co_qualname", running[0].f_code.co_name)
+    )
+
+
+class LoopMonitor:
+    def __init__(self, xyzzy, interval: float = LAG_INTERVAL, threshold: float = 0):
+        self.xyzzy = xyzzy
+        self.interval = interval
+        self.threshold = threshold
+        self.lag = Histogram()
+        self.stalls = deque(maxlen=MAX_STALLS)
+        self.stall_count = 0
+        self.unreported = 0
+        self.last_report = 0.0
+        self.task = None
+        self.loop_thread = None
+        self.watchdog = None
+        self.pending = None
+        # When the sampler last woke up, read by the watchdog thread.
+        self.beat = time.monotonic()
+
+    def start(self) -> None:
+        """Starts sampling, and the detector if a threshold is set. Does nothing if already running."""
+        if self.task is not None:
+            return
+
+        self.loop_thread = threading.get_ident()
+        self.beat = time.monotonic()
+        self.task = asyncio.ensure_future(self._sample())
+
+        if self.threshold:
+            self.detect(self.threshold)
+
+    def stop(self) -> None:
+        self.detect(0)
+
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def detect(self, threshold: float) -> None:
+        """Turns the slow-callback detector on with a threshold in seconds, or off with 0."""
+        self.threshold = threshold
+
+        if threshold and self.task is not None and self.watchdog is None:
+            self.watchdog = threading.Thread(
+                target=self._watch, name="xyzzy-loop-watchdog", daemon=True
+            )
+            self.watchdog.start()
+        elif not threshold:
+            # The thread notices on its next check and exits.
+            self.watchdog = None
+
+    async def _sample(self):
+        loop = asyncio.get_event_loop()
+
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self.beat = time.monotonic()
+            self.lag.observe(lag)
+
+            stall, self.pending = self.pending, None
+
+            if stall is not None:
+                stall.duration = lag
+                self.stalls.append(stall)
+                self.stall_count += 1
+                self._report(stall)
+
+    def _watch(self):
+        me = threading.current_thread()
+
+        while self.watchdog is me:
+            # Checking at a fraction of the threshold keeps the stack capture close to when the stall crossed it.
+            time.sleep(max(0.01, self.threshold / 4))
+            stuck = time.monotonic() - self.beat - self.interval
+
+            if stuck < self.threshold or self.pending is not None:
+                continue
+
+            frame = sys._current_frames().get(self.loop_thread)
+
+            if frame is None:
+                continue
+
+            stack = "".join(traceback.format_stack(frame)[-STACK_DEPTH:])
+            self.pending = Stall(describe_stack(frame), stack)
+            del frame
+
+    def _report(self, stall: Stall) -> None:
+        if not self.xyzzy.home_channel:
+            return
+
+        now = time.monotonic()
+
+        if now - self.last_report < REPORT_INTERVAL:
+            self.unreported += 1
+            return
+
+        msg = "Event loop stalled for {:.0f}ms in `{}`".format(
+            stall.duration * 1000, stall.task
+        )
+
+        if self.unreported:
+            msg += " ({} more since the last report)".format(self.unreported)
+
+        self.last_report = now
+        self.unreported = 0
+        asyncio.ensure_future(
+            self._post("{}\n```py\n{}\n```".format(msg, stall.stack[-1800:]))
+        )
+
+    async def _post(self, msg):
+        try:
+            await self.xyzzy.home_channel.send(msg)
+        except discord.HTTPException:
+            pass
@@ -0,0 +1,116 @@
+"""
+Rough memory accounting for game sessions, for sizing hosts.
+A session's share of the bot's heap is estimated by walking what it owns with `sys.getsizeof`, stopping at anything
+shared between sessions (the bot, the game, Discord objects, the event loop). Its interpreter is a process of its own,
+so that's read off as resident memory from /proc.
+"""
+
+from collections import deque
+from enum import Enum
+from types import (
+    BuiltinFunctionType,
+    CoroutineType,
+    FrameType,
+    FunctionType,
+    MethodType,
+    ModuleType,
+)
+from typing import Iterable, Optional
+
+import sys
+import time
+import asyncio
+import threading
+
+# Most objects looked at in one estimate, so a session that's somehow grown huge can't hold up the loop for long.
+MAX_OBJECTS = 50000
+
+# Never owned by a single session, or not worth the walk.
+SHARED_TYPES = (
+    type,
+    ModuleType,
+    FunctionType,
+    MethodType,
+    BuiltinFunctionType,
+    CoroutineType,
+    FrameType,
+    Enum,
+    asyncio.AbstractEventLoop,
+    asyncio.Future,
+    threading.Thread,
+)
+# Counted, but with nothing inside worth following.
+LEAF_TYPES = (str, bytes, bytearray, int, float, bool, type(None))
+
+
+def heap_size(root, shared: Iterable = ()) -> int:
+    """
+    Bytes taken up by `root` and everything it refers to, short of the objects in `shared`.
+    Objects from the Discord library are counted as they are, without following them, as they all lead back
+    to the client's cache.
+    """
+    seen = {id(x) for x in shared}
+    stack = [root]
+    total = 0
+
+    while stack and len(seen) < MAX_OBJECTS:
+        obj = stack.pop()
+
+        if id(obj) in seen or isinstance(obj, SHARED_TYPES):
+            continue
+
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+
+        if isinstance(obj, LEAF_TYPES):
+            continue
+        elif isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+            stack.extend(obj)
+        elif type(obj).__module__.startswith("disnake"):
+            continue
+        else:
+            if hasattr(obj, "__dict__"):
+                stack.append(obj.__dict__)
+
+            for cls in type(obj).__mro__:
+                slots = getattr(cls, "__slots__", ())
+
+                for slot in (slots,) if isinstance(slots, str) else slots:
+                    value = getattr(obj, slot, None)
+
+                    if value is not None:
+                        stack.append(value)
+
+    return total
+
+
+def process_rss(pid="self") -> Optional[int]:
+    """A process's resident memory in bytes, if /proc is there to ask and the process is still around."""
+    try:
+        with open("/proc/{}/status".format(pid)) as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+
+    return None
+
+
+class SessionMemory:
+    """An estimate of what one session costs, taken at `when`."""
+
+    __slots__ = ("heap", "interpreter", "when")
+
+    def __init__(self, heap: int, interpreter: Optional[int]):
+        self.heap = heap
+        # None when there's no interpreter running, or its memory couldn't be read.
+        self.interpreter = interpreter
+        self.when = time.monotonic()
+
+    @property
+    def total(self) -> int:
+        return self.heap + (self.interpreter or 0)
@@ -0,0 +1,257 @@
+"""
+Process-wide metrics, and an optional local HTTP server exposing them in the Prometheus text format.
+Hot paths only ever bump a counter or a histogram bucket defined here. Anything that can be read off the bot's own state
+(sessions, queues) is gathered when the endpoint is scraped, so it costs nothing in between.
+Session memory is the exception, as estimating it means walking each session's heap: the session manager keeps running
+totals of it instead, refreshed a few sessions at a time in the background.
+"""
+
+from collections import Counter
+from typing import List
+
+from modules.histogram import Histogram
+from modules.broadcast import RUNNING as BROADCASTS
+from modules.memory import process_rss
+
+import time
+import logging
+
+from aiohttp import web
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds from a line of input being written to the game to its output having been sent on.
+# Output only counts as finished after a quiet period, so these start higher than the defaults.
+OUTPUT_BUCKETS = (0.1, 0.25, 0.5, 0.6, 0.75, 1, 1.5, 2, 3, 5, 10, 30)
+
+SPAWN_LATENCY = Histogram()
+OUTPUT_LATENCY = Histogram(OUTPUT_BUCKETS)
+
+
+class RateLimitCounter(logging.Filter):
+    """
+    Counts the 429s the library reports while it retries them. Attached to its logger as a filter,
+    so it sees every record without changing where they're logged to.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+        self.global_count = 0
+
+    def filter(self, record):
+        msg = str(record.msg)
+
+        if msg.startswith("We are being rate limited"):
+            self.count += 1
+        elif msg.startswith("Global rate limit has been hit"):
+            self.global_count += 1
+
+        return True
+
+
+RATE_LIMITS = RateLimitCounter()
+logging.getLogger("disnake.http").addFilter(RATE_LIMITS)
+STARTED = time.monotonic()
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def labels(**kwargs) -> str:
+    return ",".join('{}="{}"'.format(k, escape(v)) for k, v in kwargs.items())
+
+
+class Exposition:
+    """Builds up a page of the Prometheus text format."""
+
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def header(self, name: str, kind: str, help: str) -> None:
+        self.lines.append("# HELP {} {}".format(name, help))
+        self.lines.append("# TYPE {} {}".format(name, kind))
+
+    def sample(self, name: str, value, label: str = "") -> None:
+        self.lines.append(
+            "{}{} {}".format(name, "{" + label + "}" if label else "", value)
+        )
+
+    def histogram(self, name: str, hist: Histogram, label: str = "") -> None:
+        prefix = label + "," if label else ""
+
+        for bound, count in hist.cumulative():
+            self.sample(
+                name + "_bucket",
+                count,
+                prefix + 'le="{}"'.format("+Inf" if bound == float("inf") else bound),
+            )
+
+        self.sample(name + "_sum", hist.sum, label)
+        self.sample(name + "_count", hist.count, label)
+
+    def render(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+
+def render(xyzzy) -> str:
+    out = Exposition()
+
+    out.header("xyzzy_sessions", "gauge", "Games being played, by game and input mode.")
+    sessions = Counter((x.game.name, x.mode.name.lower()) for x in xyzzy.sessions)
+
+    for (game, mode), count in sorted(sessions.items()):
+        out.sample("xyzzy_sessions", count, labels(game=game, mode=mode))
+
+    out.header(
+        "xyzzy_spectators", "gauge", "Channels spectating another channel's game."
+    )
+    out.sample("xyzzy_spectators", len(xyzzy.sessions.spectating))
+
+    out.header(
+        "xyzzy_interpreter_spawn_seconds",
+        "histogram",
+        "Time taken to start a game's interpreter.",
+    )
+    out.histogram("xyzzy_interpreter_spawn_seconds", SPAWN_LATENCY)
+
+    out.header(
+        "xyzzy_output_latency_seconds",
+        "histogram",
+        "Time from a line of input being written to its output having been sent.",
+    )
+    out.histogram("xyzzy_output_latency_seconds", OUTPUT_LATENCY)
+
+    out.header(
+        "xyzzy_outbound_queue",
+        "gauge",
+        "Messages waiting to be sent, by what's sending them.",
+    )
+    out.sample(
+        "xyzzy_outbound_queue",
+        sum(len(x.spectators.frames) for x in xyzzy.sessions),
+        labels(kind="spectators"),
+    )
+    out.sample(
+        "xyzzy_outbound_queue",
+        sum(x.total - x.done for x in BROADCASTS),
+        labels(kind="broadcast"),
+    )
+
+    out.header(
+        "xyzzy_rate_limited_total",
+        "counter",
+        "Requests that Discord answered with a 429, by scope.",
+    )
+    out.sample("xyzzy_rate_limited_total", RATE_LIMITS.count, labels(scope="route"))
+    out.sample(
+        "xyzzy_rate_limited_total", RATE_LIMITS.global_count, labels(scope="global")
+    )
+
+    out.header(
+        "xyzzy_rate_limit_dropped_total",
+        "counter",
+        "Commands and game input dropped by the bot's own rate limits, by kind and scope.",
+    )
+
+    for limiter in (xyzzy.command_limits, xyzzy.input_limits):
+        for scope, buckets in limiter.scopes.items():
+            out.sample(
+                "xyzzy_rate_limit_dropped_total",
+                buckets.total_dropped,
+                labels(kind=limiter.kind, scope=scope),
+            )
+
+    out.header("xyzzy_command_seconds", "histogram", "Time taken to run each command.")
+
+    commands = sorted(xyzzy.command_stats.stats.items())
+
+    for name, stat in commands:
+        out.histogram("xyzzy_command_seconds", stat.latency, labels(command=name))
+
+    out.header("xyzzy_commands_in_flight", "gauge", "Commands currently running.")
+
+    for name, stat in commands:
+        out.sample("xyzzy_commands_in_flight", stat.in_flight, labels(command=name))
+
+    out.header(
+        "xyzzy_command_errors_total",
+        "counter",
+        "Commands that raised an exception, by command and exception.",
+    )
+
+    for name, stat in commands:
+        for error, count in sorted(stat.errors.items()):
+            out.sample(
+                "xyzzy_command_errors_total",
+                count,
+                labels(command=name, error=error),
+            )
+
+    out.header(
+        "xyzzy_event_loop_lag_seconds",
+        "histogram",
+        "How late the event loop ran scheduled callbacks.",
+    )
+    out.histogram("xyzzy_event_loop_lag_seconds", xyzzy.loop_monitor.lag)
+
+    out.header(
+        "xyzzy_event_loop_stalls_total",
+        "counter",
+        "Stalls caught by the slow callback detector.",
+    )
+    out.sample("xyzzy_event_loop_stalls_total", xyzzy.loop_monitor.stall_count)
+
+    out.header(
+        "xyzzy_session_memory_bytes",
+        "gauge",
+        "Estimated memory used by sessions, by game and by what's using it: the bot's heap or the interpreter.",
+    )
+    # Running totals, kept up to date in the background by the session manager.
+    for (game, kind), size in sorted(xyzzy.sessions.memory.items()):
+        out.sample("xyzzy_session_memory_bytes", size, labels(game=game, kind=kind))
+
+    memory = process_rss()
+
+    if memory is not None:
+        out.header(
+            "xyzzy_resident_memory_bytes",
+            "gauge",
+            "Resident memory of the bot process, not counting interpreters.",
+        )
+        out.sample("xyzzy_resident_memory_bytes", memory)
+
+    out.header("xyzzy_uptime_seconds", "gauge", "Seconds since the bot started.")
+    out.sample("xyzzy_uptime_seconds", round(time.monotonic() - STARTED, 1))
+
+    return out.render()
+
+
+class MetricsServer:
+    """Serves `render` at /metrics. Meant to be bound to localhost and scraped by a local Prometheus."""
+
+    def __init__(self, xyzzy, host: str, port: int):
+        self.xyzzy = xyzzy
+        self.host = host
+        self.port = port
+        self.runner = None
+
+    async def start(self) -> None:
+        if self.runner is not None:
+            return
+
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+
+    async def stop(self) -> None:
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def handle(self, request):
+        return web.Response(
+            body=render(self.xyzzy).encode(), headers={"Content-Type": CONTENT_TYPE}
+        )
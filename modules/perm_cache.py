@@ -0,0 +1,100 @@
+"""
+Per-channel cache of the bot's resolved permissions and embed colour.
+Resolving permissions walks every role and overwrite in the guild, so we only do it once per channel
+and let the guild/role/channel/member events throw the stale entries away.
+Threads take their permissions from their parent channel, so they're also indexed by parent and forgotten along with it.
+"""
+
+import disnake as discord
+
+
+class PermissionCache:
+    """Caches `permissions_for(guild.me)` and the bot's top role colour per channel."""
+
+    def __init__(self):
+        # Channel ID -> (permissions, colour, guild ID, parent ID or None).
+        self.entries = {}
+        # Guild ID -> IDs of its cached channels.
+        self.guilds = {}
+        # Parent channel ID -> IDs of its cached threads.
+        self.threads = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _resolve(self, channel):
+        me = channel.guild.me
+        parent_id = channel.parent_id if isinstance(channel, discord.Thread) else None
+        entry = (
+            channel.permissions_for(me),
+            me.top_role.colour,
+            channel.guild.id,
+            parent_id,
+        )
+
+        self.entries[channel.id] = entry
+        self.guilds.setdefault(channel.guild.id, set()).add(channel.id)
+
+        if parent_id is not None:
+            self.threads.setdefault(parent_id, set()).add(channel.id)
+
+        return entry
+
+    def permissions(self, channel) -> discord.Permissions:
+        """Returns the bot's permissions in a guild channel."""
+        entry = self.entries.get(channel.id)
+
+        if entry is None:
+            entry = self._resolve(channel)
+
+        return entry[0]
+
+    def colour(self, channel) -> discord.Colour:
+        """Returns the colour to use for embeds sent in a guild channel."""
+        entry = self.entries.get(channel.id)
+
+        if entry is None:
+            entry = self._resolve(channel)
+
+        return entry[1]
+
+    @staticmethod
+    def _discard(index: dict, key: int, channel_id: int) -> None:
+        ids = index.get(key)
+
+        if ids is not None:
+            ids.discard(channel_id)
+
+            if not ids:
+                del index[key]
+
+    def invalidate_channel(self, channel_id: int) -> None:
+        """Forgets a single channel and any of its threads, eg. after its overwrites changed."""
+        for thread_id in self.threads.pop(channel_id, ()):
+            self._forget(thread_id)
+
+        self._forget(channel_id)
+
+    def _forget(self, channel_id: int) -> None:
+        entry = self.entries.pop(channel_id, None)
+
+        if entry is None:
+            return
+
+        self._discard(self.guilds, entry[2], channel_id)
+
+        if entry[3] is not None:
+            self._discard(self.threads, entry[3], channel_id)
+
+    def invalidate_guild(self, guild_id: int) -> None:
+        """Forgets every channel in a guild, eg. after a role or the bot's member changed."""
+        for channel_id in self.guilds.pop(guild_id, ()):
+            entry = self.entries.pop(channel_id, None)
+
+            if entry is not None and entry[3] is not None:
+                self.threads.pop(entry[3], None)
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.guilds.clear()
+        self.threads.clear()
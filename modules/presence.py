@@ -0,0 +1,57 @@
+"""
+Debounced presence publisher.
+Presence updates are heavily rate limited by the gateway, so instead of sending one for every game that starts or ends,
+requests are coalesced into at most one update per `interval` seconds, and nothing is sent if the status wouldn't change.
+"""
+
+import time
+import disnake as discord
+
+# Default minimum seconds between presence updates.
+PRESENCE_INTERVAL = 15
+
+
+def render_status(count: int) -> str:
+    game = "nothing yet!"
+
+    if count:
+        game = "{} game{}.".format(count, "s" if count > 1 else "")
+
+    return game + " | @xyzzy help"
+
+
+class PresencePublisher:
+    def __init__(self, xyzzy, interval: float = PRESENCE_INTERVAL):
+        self.xyzzy = xyzzy
+        self.interval = interval
+        self.shown = None
+        self.last = 0.0
+        self.timer = None
+        self.sent = 0
+        self.skipped = 0
+
+    def request(self) -> None:
+        """Asks for the presence to be brought up to date, as soon as the interval allows."""
+        if self.timer is not None:
+            return
+
+        wait = self.last + self.interval - time.monotonic()
+        self.timer = self.xyzzy.timers.schedule(max(0, wait), self._flush)
+
+    def _flush(self):
+        self.timer = None
+        return self.publish()
+
+    async def publish(self, force: bool = False) -> None:
+        """Sends the presence now if it differs from what is showing, or unconditionally with `force`."""
+        status = render_status(self.xyzzy.sessions.counted)
+
+        if status == self.shown and not force:
+            self.skipped += 1
+            return
+
+        self.shown = status
+        self.last = time.monotonic()
+        self.sent += 1
+
+        await self.xyzzy.change_presence(activity=discord.Game(name=status))
@@ -1,15 +1,41 @@
+"""
+Reading a game's output in turns. dfrotz shows a ">" prompt when it wants a line of input, so a turn ends there.
+Games that prompt some other way, or wait for a keypress, fall back to a turn ending after a quiet period.
+"""
+
 import asyncio
 
+# Seconds of silence after which a game's output is taken to be finished, if it hasn't shown a prompt.
+QUIET_PERIOD = 0.5
+
+
+def at_prompt(buffer: bytes) -> bool:
+    """Whether output ends with dfrotz's input prompt, a ">" on a line of its own."""
+    tail = buffer[-16:].rstrip(b" ")
+    return tail == b">" or tail.endswith(b"\n>")
+
 
-async def handle_process_output(process, looper, after):
+async def handle_process_output(process, looper, after, quiet=QUIET_PERIOD):
+    """
+    Hands a process's output to `looper(buffer, prompted)` as soon as it ends at a prompt, with `prompted` True,
+    or otherwise whenever it's been quiet for `quiet` seconds, which keeps happening while the process stays quiet.
+    `after` gets whatever is left once the process exits.
+    """
     buffer = b""
 
     while process.returncode is None:
         try:
-            output = await asyncio.wait_for(process.stdout.read(1), 0.5)
-            buffer += output
+            output = await asyncio.wait_for(process.stdout.read(4096), quiet)
         except asyncio.TimeoutError:
-            await looper(buffer)
+            await looper(buffer, False)
+
+            buffer = b""
+            continue
+
+        buffer += output
+
+        if at_prompt(buffer):
+            await looper(buffer, True)
 
             buffer = b""
 
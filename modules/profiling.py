@@ -0,0 +1,341 @@
+"""
+On-demand profiling for a live bot: a sampling profile of the event loop thread, a cProfile run, or a tracemalloc diff.
+Every run is bounded in time and stops by itself, only one can run at once, and the reports are gzipped into
+`PROFILE_DIR` off the event loop, ready to be attached.
+
+The stack sampler is the one to reach for first. It only looks at the loop thread's stack every `SAMPLE_INTERVAL` of CPU time,
+so its overhead stays a fraction of a percent however busy the bot is. cProfile sees every call,
+which slows Python-heavy code down a lot, so it gets a shorter limit.
+"""
+
+from collections import Counter
+from datetime import datetime
+from io import StringIO
+from typing import List, Optional
+
+import os
+import sys
+import gzip
+import marshal
+import time
+import pstats
+import signal
+import asyncio
+import cProfile
+import threading
+import tracemalloc
+
+PROFILE_DIR = "./profiles/"
+# Seconds between stack samples.
+SAMPLE_INTERVAL = 0.01
+# Longest runs allowed, in seconds.
+MAX_SAMPLE_TIME = 300
+MAX_CPROFILE_TIME = 60
+MAX_HEAP_TIME = 300
+# Frames kept per allocation by tracemalloc. More makes tracebacks more useful, and tracing slower.
+HEAP_FRAMES = 10
+# Lines shown in each section of a report.
+REPORT_LINES = 30
+
+
+class ProfileError(Exception):
+    pass
+
+
+def frame_name(frame) -> str:
+    code = frame.f_code
+    return "{} ({}:{})".format(
+        getattr(code, "co_qualname", code.co_name),
+        os.path.basename(code.co_filename),
+        code.co_firstlineno,
+    )
+
+
+class StackSampler:
+    """
+    Counts the stacks seen on the event loop thread, as `outermost;...;innermost` strings.
+    On the main thread it samples with a CPU-time interval timer, so every sample is taken while the loop is actually running
+    Python code, with no bias towards wherever it happens to let go of the GIL. Elsewhere it falls back to a thread
+    peeking at the loop's stack, which can only look while the loop isn't holding the GIL, so short bursts of work get missed.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        # Samples where the loop was waiting in `select` for something to do, only seen by the thread sampler.
+        self.idle = 0
+        self.thread = None
+        self.halt = threading.Event()
+        self.previous = None
+
+    @property
+    def uses_timer(self) -> bool:
+        return self.thread is None
+
+    def record(self, frame) -> None:
+        self.samples += 1
+
+        if frame.f_code.co_name == "select":
+            self.idle += 1
+            return
+
+        stack = []
+
+        while frame is not None:
+            stack.append(frame_name(frame))
+            frame = frame.f_back
+
+        stack.reverse()
+        self.stacks[";".join(stack)] += 1
+
+    def start(self) -> None:
+        if (
+            hasattr(signal, "setitimer")
+            and threading.current_thread() is threading.main_thread()
+        ):
+            self.previous = signal.signal(signal.SIGPROF, self._on_signal)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        else:
+            self.thread = threading.Thread(
+                target=self._watch,
+                args=(threading.get_ident(),),
+                name="xyzzy-profiler",
+                daemon=True,
+            )
+            self.thread.start()
+
+    def stop(self) -> None:
+        if self.thread is None:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, self.previous or signal.SIG_DFL)
+        else:
+            self.halt.set()
+            self.thread.join()
+
+    def _on_signal(self, signum, frame):
+        if frame is not None:
+            self.record(frame)
+
+    def _watch(self, thread_id):
+        while not self.halt.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+
+            if frame is not None:
+                self.record(frame)
+
+    def busy(self, duration: float) -> float:
+        """Roughly how much of `duration` the loop spent running code."""
+        if self.uses_timer:
+            return min(1, self.samples * self.interval / duration) if duration else 0
+
+        return (self.samples - self.idle) / self.samples if self.samples else 0
+
+    def report(self, duration: float) -> str:
+        busy = self.samples - self.idle
+        own = Counter()
+        total = Counter()
+
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+
+            for name in set(frames):
+                total[name] += count
+
+        out = "Sampled the event loop every {:g}ms of {} time for {:.1f}s: {} samples, {:.1%} busy.\n".format(
+            self.interval * 1000,
+            "CPU" if self.uses_timer else "wall",
+            duration,
+            self.samples,
+            self.busy(duration),
+        )
+
+        for title, counter in (("Self", own), ("Total", total)):
+            out += "\n{} samples, of busy samples:\n".format(title)
+
+            for name, count in counter.most_common(REPORT_LINES):
+                out += "{:>7.1%} {:>7}  {}\n".format(count / max(1, busy), count, name)
+
+        return out
+
+    def folded(self) -> str:
+        """The stacks in the folded format taken by flamegraph.pl, speedscope and friends."""
+        return "".join(
+            "{} {}\n".format(stack, count) for stack, count in self.stacks.items()
+        )
+
+
+def heap_report(before, after, duration: float) -> str:
+    ignore = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ]
+    before = before.filter_traces(ignore)
+    after = after.filter_traces(ignore)
+    lines = after.compare_to(before, "lineno")
+    growth = sum(x.size_diff for x in lines)
+
+    out = "Heap change over {:.1f}s: {:+,} bytes in {:,} traced blocks.\n".format(
+        duration, growth, sum(x.count for x in after.statistics("filename"))
+    )
+    out += "\nBiggest changes, by line:\n"
+
+    for stat in lines[:REPORT_LINES]:
+        out += "{}\n".format(stat)
+
+    out += "\nBiggest changes, by traceback:\n"
+
+    for stat in after.compare_to(before, "traceback")[:10]:
+        out += "\n{:+,} bytes, {:+,} blocks\n".format(stat.size_diff, stat.count_diff)
+        out += "\n".join(stat.traceback.format()) + "\n"
+
+    return out
+
+
+def cprofile_report(profile: cProfile.Profile, duration: float) -> dict:
+    out = StringIO()
+    out.write("cProfile of the event loop for {:.1f}s.\n\n".format(duration))
+    stats = pstats.Stats(profile, stream=out)
+    stats.sort_stats("cumulative").print_stats(REPORT_LINES)
+    stats.sort_stats("tottime").print_stats(REPORT_LINES)
+
+    # The raw stats are what `python -m pstats` and snakeviz open, once decompressed.
+    profile.create_stats()
+
+    return {"txt": out.getvalue(), "prof": marshal.dumps(profile.stats)}
+
+
+def write_reports(name: str, files: dict) -> List[str]:
+    """Gzips each `{suffix: text or bytes}` into `PROFILE_DIR`, returning the paths."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    paths = []
+
+    for suffix, data in files.items():
+        path = os.path.join(PROFILE_DIR, "{}.{}.gz".format(name, suffix))
+
+        with gzip.open(path, "wb") as f:
+            f.write(data.encode() if isinstance(data, str) else data)
+
+        paths.append(path)
+
+    return paths
+
+
+class Profiler:
+    """Runs one profile at a time. `stop` ends the current one early, and it still reports what it gathered."""
+
+    def __init__(self):
+        self.kind: Optional[str] = None
+        self.started = None
+        self.limit = None
+        self.stopping = None
+
+    @property
+    def running(self) -> bool:
+        return self.kind is not None
+
+    def stop(self) -> bool:
+        if not self.running:
+            return False
+
+        self.stopping.set()
+        return True
+
+    async def _wait(self, duration: float):
+        try:
+            await asyncio.wait_for(self.stopping.wait(), duration)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self, kind: str, duration: float):
+        """
+        Profiles for up to `duration` seconds (capped per kind), and returns a one line summary and the report files.
+        `kind` is "sample", "cprofile" or "heap".
+        """
+        if self.running:
+            raise ProfileError(
+                "A {} profile is already running, started {:.0f}s ago.".format(
+                    self.kind, time.monotonic() - self.started
+                )
+            )
+
+        limit = {
+            "sample": MAX_SAMPLE_TIME,
+            "cprofile": MAX_CPROFILE_TIME,
+            "heap": MAX_HEAP_TIME,
+        }.get(kind)
+
+        if limit is None:
+            raise ProfileError('Unknown profile "{}".'.format(kind))
+
+        self.kind = kind
+        self.started = time.monotonic()
+        self.limit = min(max(1, duration), limit)
+        self.stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        name = "{}-{:%Y%m%d-%H%M%S}".format(kind, datetime.utcnow())
+
+        try:
+            if kind == "sample":
+                files = await self._sample()
+            elif kind == "cprofile":
+                files = await self._cprofile()
+            else:
+                files = await self._heap()
+
+            paths = await loop.run_in_executor(None, write_reports, name, files)
+        finally:
+            self.kind = None
+
+        return files["txt"].split("\n", 1)[0], paths
+
+    async def _sample(self) -> dict:
+        sampler = StackSampler()
+        sampler.start()
+
+        try:
+            await self._wait(self.limit)
+        finally:
+            sampler.stop()
+
+        duration = time.monotonic() - self.started
+
+        return {"txt": sampler.report(duration), "folded": sampler.folded()}
+
+    async def _cprofile(self) -> dict:
+        profile = cProfile.Profile()
+        # Only the thread that enables it is profiled, which is the event loop's.
+        profile.enable()
+
+        try:
+            await self._wait(self.limit)
+        finally:
+            profile.disable()
+
+        duration = time.monotonic() - self.started
+
+        return await asyncio.get_running_loop().run_in_executor(
+            None, cprofile_report, profile, duration
+        )
+
+    async def _heap(self) -> dict:
+        started = not tracemalloc.is_tracing()
+
+        if started:
+            tracemalloc.start(HEAP_FRAMES)
+
+        try:
+            before = tracemalloc.take_snapshot()
+            await self._wait(self.limit)
+            after = tracemalloc.take_snapshot()
+        finally:
+            if started:
+                tracemalloc.stop()
+
+        duration = time.monotonic() - self.started
+        report = await asyncio.get_running_loop().run_in_executor(
+            None, heap_report, before, after, duration
+        )
+
+        return {"txt": report}
@@ -0,0 +1,142 @@
+"""
+Token bucket rate limiting for commands and game input.
+Each bucket is keyed by a user, channel or guild ID, and only refilled when it's checked.
+Buckets that have had time to fill back up are indistinguishable from new ones, so they're swept away lazily.
+Drop counts per key are halved on every sweep, so they show recent offenders without keeping every key that was ever limited.
+"""
+
+from typing import Dict, Optional, Tuple
+
+import time
+
+# Defaults for each limit, as (actions, per seconds).
+DEFAULT_LIMITS = {
+    "command_limit_user": (5, 10),
+    "command_limit_channel": (15, 10),
+    "command_limit_guild": (40, 10),
+    "input_limit_user": (10, 10),
+    "input_limit_channel": (30, 10),
+    "input_limit_guild": (100, 10),
+}
+SCOPES = ("user", "channel", "guild")
+# How many checks between sweeps of idle buckets.
+SWEEP_EVERY = 10000
+
+
+def parse_limit(value: str) -> Tuple[int, float]:
+    """Parses an "actions/seconds" option. A bare 0 disables the limit."""
+    if value.strip() == "0":
+        return (0, 0)
+
+    actions, _, seconds = value.partition("/")
+    actions, seconds = int(actions), float(seconds or 1)
+
+    if actions < 0 or seconds <= 0:
+        raise ValueError(
+            'Invalid rate limit "{}": actions can\'t be negative, and seconds must be more than 0.'.format(
+                value
+            )
+        )
+
+    return (actions, seconds)
+
+
+class TokenBuckets:
+    """A set of token buckets sharing the same rate, stored as `{key: (tokens, timestamp)}`."""
+
+    __slots__ = ("burst", "rate", "buckets", "dropped", "total_dropped")
+
+    def __init__(self, burst: int, per: float):
+        self.burst = burst
+        self.rate = burst / per
+        self.buckets: Dict[int, Tuple[float, float]] = {}
+        # Recent drops by key, decayed by `sweep`.
+        self.dropped: Dict[int, int] = {}
+        self.total_dropped = 0
+
+    def tokens(self, key: int, now: float) -> float:
+        """Returns how many tokens a bucket has right now."""
+        bucket = self.buckets.get(key)
+
+        if bucket is None:
+            return self.burst
+
+        return min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+
+    def take(self, key: int, tokens: float, now: float) -> None:
+        self.buckets[key] = (tokens - 1, now)
+
+    def drop(self, key: int) -> None:
+        self.dropped[key] = self.dropped.get(key, 0) + 1
+        self.total_dropped += 1
+
+    def sweep(self, now: float) -> None:
+        """Forgets every bucket that has refilled completely, and decays the drop counts."""
+        full = self.burst / self.rate
+
+        self.buckets = {k: v for k, v in self.buckets.items() if now - v[1] < full}
+        self.dropped = {k: v // 2 for k, v in self.dropped.items() if v > 1}
+
+
+class RateLimiter:
+    """Per-user, per-channel and per-guild limits for one kind of action (eg. "command" or "input")."""
+
+    def __init__(self, kind: str, config: dict):
+        self.kind = kind
+        self.checks = 0
+        self.scopes: Dict[str, TokenBuckets] = {}
+
+        for scope in SCOPES:
+            opt = "{}_limit_{}".format(kind, scope)
+            burst, per = (
+                parse_limit(config[opt]) if opt in config else DEFAULT_LIMITS[opt]
+            )
+
+            if burst:
+                self.scopes[scope] = TokenBuckets(burst, per)
+
+    def allow(self, user_id: int, channel_id: int, guild_id: Optional[int]) -> bool:
+        """Takes a token from each bucket the action falls under, or counts a drop if any is empty."""
+        now = time.monotonic()
+        keys = (
+            ("user", user_id),
+            ("channel", channel_id),
+            ("guild", guild_id),
+        )
+        taking = []
+
+        self.checks += 1
+
+        if self.checks % SWEEP_EVERY == 0:
+            for buckets in self.scopes.values():
+                buckets.sweep(now)
+
+        for scope, key in keys:
+            buckets = self.scopes.get(scope)
+
+            if buckets is None or key is None:
+                continue
+
+            tokens = buckets.tokens(key, now)
+
+            if tokens < 1:
+                buckets.drop(key)
+                return False
+
+            taking.append((buckets, key, tokens))
+
+        for buckets, key, tokens in taking:
+            buckets.take(key, tokens, now)
+
+        return True
+
+    def top_dropped(self, scope: str, amount: int = 5):
+        """Returns the keys with the most recently dropped actions in a scope, as (key, count) pairs."""
+        buckets = self.scopes.get(scope)
+
+        if buckets is None:
+            return []
+
+        return sorted(buckets.dropped.items(), key=lambda x: x[1], reverse=True)[
+            :amount
+        ]
@@ -0,0 +1,126 @@
+"""
+Ring buffer of a session's recent output frames and the input that led to them, for `recap`.
+Everything lives in one `bytearray` arena that grows up to a fixed size and then wraps around,
+with the position of each entry kept in fixed-size arrays, so a session's recap never costs more than its cap.
+"""
+
+from array import array
+from typing import List, Tuple
+
+# Default size of a session's recap arena, in bytes.
+RECAP_SIZE = 32 * 1024
+# Most entries (inputs and frames) a recap buffer keeps track of.
+RECAP_ENTRIES = 256
+
+INPUT = 0
+FRAME = 1
+
+
+class RecapBuffer:
+    __slots__ = (
+        "arena",
+        "size",
+        "starts",
+        "lengths",
+        "kinds",
+        "first",
+        "count",
+        "head",
+    )
+
+    def __init__(self, size: int = RECAP_SIZE, entries: int = RECAP_ENTRIES):
+        self.arena = bytearray()
+        self.size = size
+        self.starts = array("I", [0]) * entries
+        self.lengths = array("I", [0]) * entries
+        self.kinds = bytearray(entries)
+        self.first = 0  # Slot of the oldest entry.
+        self.count = 0
+        self.head = 0  # Arena offset the next entry gets written at.
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def memory(self) -> int:
+        """Bytes used by the arena and the entry arrays."""
+        return len(self.arena) + len(self.kinds) * (
+            1 + self.starts.itemsize + self.lengths.itemsize
+        )
+
+    @property
+    def capacity(self) -> int:
+        """Most bytes this buffer can ever use."""
+        return self.size + len(self.kinds) * (
+            1 + self.starts.itemsize + self.lengths.itemsize
+        )
+
+    def _evict(self) -> None:
+        self.first = (self.first + 1) % len(self.kinds)
+        self.count -= 1
+
+    def add(self, kind: int, text: str) -> None:
+        """Records an input or a frame, evicting the oldest entries to make room."""
+        data = text.encode("utf-8", "replace")
+
+        if not data or not self.size:
+            return
+
+        if len(data) > self.size:
+            data = data[-self.size :]
+
+        if self.head + len(data) > self.size:
+            # Wrap around. Anything still past the old head is the oldest data, and would be left stranded.
+            while self.count and self.starts[self.first] >= self.head:
+                self._evict()
+
+            self.head = 0
+
+        start = self.head
+        end = start + len(data)
+
+        while self.count and (
+            self.count == len(self.kinds)
+            or start < self.starts[self.first] + self.lengths[self.first]
+            and self.starts[self.first] < end
+        ):
+            self._evict()
+
+        slot = (self.first + self.count) % len(self.kinds)
+        self.arena[start:end] = data
+        self.starts[slot] = start
+        self.lengths[slot] = len(data)
+        self.kinds[slot] = kind
+        self.count += 1
+        self.head = end
+
+    def entries(self, frames: int) -> List[Tuple[int, str]]:
+        """Returns the entries making up the last `frames` frames, oldest first."""
+        out = []
+        seen = 0
+
+        for i in range(self.count - 1, -1, -1):
+            slot = (self.first + i) % len(self.kinds)
+            kind = self.kinds[slot]
+
+            if kind == FRAME:
+                if seen == frames:
+                    break
+
+                seen += 1
+
+            start = self.starts[slot]
+            text = self.arena[start : start + self.lengths[slot]].decode(
+                "utf-8", "replace"
+            )
+            out.append((kind, text))
+
+        out.reverse()
+        return out
+
+    def render(self, frames: int) -> str:
+        """The last `frames` frames as plain text, with input shown as "> input"."""
+        return "\n".join(
+            "> {}".format(text) if kind == INPUT else text + "\n"
+            for kind, text in self.entries(frames)
+        )
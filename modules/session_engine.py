@@ -0,0 +1,301 @@
+"""
+Headless game session: one dfrotz process, the input waiting for it, and the output coming back, with nothing tied to Discord.
+`GameChannel` wraps one of these per channel, and `headless.py` drives them directly from input scripts.
+"""
+
+from subprocess import PIPE
+from collections import deque
+from typing import Awaitable, Callable, Optional
+from modules.process_helpers import handle_process_output, QUIET_PERIOD
+from modules.input_queue import InputQueue
+from modules import metrics
+
+import re
+import shutil
+import os
+import time
+import asyncio
+
+SCRIPT_OR_RECORD = re.compile(r"(?i).*(?:\.rec|\.scr)$")
+UPLOADED_SAVE = "__UPLOADED__.qzl"
+# Once a game has shown a prompt, quiet periods no longer mean it wants input, as it may just be thinking.
+# Seconds of silence after which it's taken to want some anyway, eg. because it's waiting on a keypress.
+PROMPT_TIMEOUT = 3
+
+
+class SessionEngine:
+    """
+    Runs a game's interpreter, writing one line of input each time it goes quiet, and handing back its output.
+    `on_output(text, save)` gets each chunk of output, along with the path of a new save file if one was just made.
+    `on_input(line)`, if given, sees every line as it's written.
+    Input is written when the game shows its prompt, or after a quiet period for games that don't show one.
+    """
+
+    __slots__ = (
+        "game",
+        "save_path",
+        "inputs",
+        "on_output",
+        "on_input",
+        "quiet",
+        "process",
+        "save",
+        "last_save",
+        "indent",
+        "first_time",
+        "ready",
+        "writing",
+        "pipeline",
+        "batching",
+        "batch",
+        "sent_at",
+        "prompts",
+        "output_at",
+        "waiting",
+    )
+
+    def __init__(
+        self,
+        game,
+        save_path: str,
+        inputs: InputQueue,
+        on_output: Callable[[str, Optional[str]], Awaitable],
+        on_input: Optional[Callable[[str], None]] = None,
+        quiet: float = QUIET_PERIOD,
+    ):
+        self.game = game
+        self.save_path = save_path
+        self.inputs = inputs
+        self.on_output = on_output
+        self.on_input = on_input
+        self.quiet = quiet
+        self.process = None
+        self.save = None
+        self.last_save = None
+        self.indent = 0
+        self.first_time = True
+        self.ready = False
+        self.writing = False
+        self.pipeline = deque()
+        self.batching = False
+        self.batch = b""
+        # When the last line of input was written, until its output has been passed on.
+        self.sent_at = None
+        # Whether the game has ever shown a prompt, and when it last printed anything.
+        self.prompts = False
+        self.output_at = time.monotonic()
+        # Set whenever the game is waiting for input and there's none left to give it.
+        self.waiting = asyncio.Event()
+
+    async def start(self):
+        """Spawns the interpreter."""
+        if self.process:
+            raise Exception("Game already has a process.")
+
+        # Make directory for saving
+        if not os.path.exists(self.save_path):
+            os.makedirs(self.save_path)
+
+        start = time.perf_counter()
+
+        if self.save:
+            self.process = await asyncio.create_subprocess_shell(
+                "exec dfrotz -h 80 -w 5000 -m -R {} -L {} '{}'".format(
+                    self.save_path, self.save, self.game.path
+                ),
+                stdout=PIPE,
+                stdin=PIPE,
+            )
+        else:
+            self.process = await asyncio.create_subprocess_shell(
+                "exec dfrotz -h 80 -w 5000 -m -R {} '{}'".format(
+                    self.save_path, self.game.path
+                ),
+                stdout=PIPE,
+                stdin=PIPE,
+            )
+
+        metrics.SPAWN_LATENCY.observe(time.perf_counter() - start)
+
+    async def send(self, input) -> bool:
+        """
+        Queues text input for the game process. Returns False if the queue turned it away.
+        A list of commands is queued as a single pipeline, see `split_pipeline`.
+        """
+        if not self.process:
+            raise Exception("Channel does not have an attached process.")
+
+        if not self.inputs.push(input):
+            return False
+
+        self.waiting.clear()
+        await self._pump()
+        return True
+
+    async def _pump(self):
+        """Writes queued input to the game process, one line each time it's waiting for some."""
+        if self.writing:
+            return
+
+        self.writing = True
+
+        try:
+            while self.ready and self.process:
+                if self.pipeline:
+                    input = self.pipeline.popleft()
+                elif self.inputs:
+                    input = self.inputs.pop()
+
+                    if isinstance(input, list):
+                        # Hold back output until the last command in the pipeline has answered.
+                        self.pipeline = deque(input)
+                        self.batching = True
+                        input = self.pipeline.popleft()
+                else:
+                    self.waiting.set()
+                    break
+
+                if self.on_input:
+                    self.on_input(input)
+
+                if input == "ENTER":
+                    input = ""
+                elif input == "SPACE":
+                    input = " "
+
+                self.ready = False
+                self.sent_at = time.perf_counter()
+                self.process.stdin.write((input + "\n").encode("latin-1", "replace"))
+                await self.process.stdin.drain()
+        except ConnectionError:
+            # The process has gone away, `run` will notice and clean up.
+            self.inputs.clear()
+            self.pipeline.clear()
+        finally:
+            self.writing = False
+
+    async def _output(self, buffer):
+        if buffer == b"":
+            return
+
+        lines = buffer.decode("latin-1", "replace").splitlines()
+        text = "\n".join(
+            ("" if line.strip() == "." else line)[self.indent :] for line in lines
+        )
+
+        if not text.strip():
+            return
+
+        save = self.check_saves()
+
+        if self.first_time:
+            save = None
+            self.first_time = False
+
+        await self.on_output(text, save)
+
+    def _prune_saves(self):
+        """Deletes everything in the save directory but the newest save."""
+        if not os.path.exists(self.save_path):
+            return
+
+        latest = 0
+
+        for file in os.listdir(self.save_path):
+            mod_time = os.stat("{}/{}".format(self.save_path, file)).st_mtime_ns
+
+            if (
+                mod_time < latest
+                or SCRIPT_OR_RECORD.match(file)
+                or file == UPLOADED_SAVE
+            ):
+                os.unlink("{}/{}".format(self.save_path, file))
+            elif mod_time > latest and not SCRIPT_OR_RECORD.match(file):
+                latest = mod_time
+
+    async def run(self):
+        """Feeds the game input and passes on its output until the process exits."""
+        if not self.process:
+            await self.start()
+
+        self.first_time = True
+
+        async def looper(buffer, prompted):
+            if buffer:
+                self.output_at = time.monotonic()
+
+            if prompted:
+                self.prompts = True
+
+            # A game that prompts has only paused when it goes quiet without one,
+            # so it shouldn't have input written into the middle of its turn.
+            ready = (
+                prompted
+                or not self.prompts
+                or time.monotonic() - self.output_at >= PROMPT_TIMEOUT
+            )
+
+            if self.batching:
+                self.batch += buffer
+                buffer = b""
+
+                if ready and not self.pipeline:
+                    buffer, self.batch = self.batch, b""
+                    self.batching = False
+
+            await self._output(buffer)
+
+            if buffer and self.sent_at is not None:
+                metrics.OUTPUT_LATENCY.observe(time.perf_counter() - self.sent_at)
+                self.sent_at = None
+
+            self._prune_saves()
+
+            if ready:
+                self.ready = True
+                await self._pump()
+
+        await handle_process_output(self.process, looper, self._output, self.quiet)
+        self.waiting.set()
+
+    def terminate(self):
+        """Ends the game process, if it's still running."""
+        if self.process is not None and self.process.returncode is None:
+            try:
+                self.process.terminate()
+            except ProcessLookupError:
+                pass
+
+    def check_saves(self) -> Optional[str]:
+        """Returns the path of the newest save file, if it's one we haven't seen yet."""
+        if os.path.exists(self.save_path):
+            files = [
+                x
+                for x in os.listdir(self.save_path)
+                if not SCRIPT_OR_RECORD.match(x) and x != UPLOADED_SAVE
+            ]
+            latest = [0, None]
+
+            for file in files:
+                mod_time = os.stat("{}/{}".format(self.save_path, file)).st_mtime_ns
+
+                if mod_time > latest[0]:
+                    latest = [mod_time, file]
+
+            if latest[1] and latest[1] != self.last_save:
+                self.last_save = latest[1]
+                return "{}/{}".format(self.save_path, latest[1])
+            return None
+
+    def final_save(self) -> Optional[str]:
+        """The path of the last save made, if it's still there."""
+        if self.last_save:
+            path = "{}/{}".format(self.save_path, self.last_save)
+
+            if os.path.isfile(path):
+                return path
+
+    def cleanup(self):
+        # Check if cleanup has already been done.
+        if os.path.isdir(self.save_path):
+            shutil.rmtree(self.save_path)
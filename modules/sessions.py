@@ -0,0 +1,382 @@
+"""
+Session manager: the one registry of running games, keyed by channel ID.
+Each game runs in its own supervised task rather than inside the command that started it,
+so a session only holds on to what it actually needs, and stopping one (or all of them) happens in one place.
+
+The registry also keeps running counts (total, non-debug, per game, per guild), an index by guild,
+and an index by last activity, so presence, stats and owner commands never have to scan every session.
+Channels spectating another session are tracked here too, so a channel is never both playing and spectating.
+Idle sessions get a warning and are then quit, using a timer on the shared wheel rather than a scan.
+Estimates of what each session costs in memory are refreshed a few at a time in the background, and summed by game,
+so reading them never means walking every session's heap at once.
+"""
+
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from modules.game_channel import GameChannel
+from modules.memory import SessionMemory
+
+import math
+import time
+import asyncio
+import traceback
+import disnake as discord
+
+# Seconds to let a game end by itself after its process has been terminated, before it gets cancelled.
+STOP_TIMEOUT = 5
+# Seconds a session's memory estimate is good for. The background sweep gets round every session in about this long.
+MEMORY_TTL = 60
+# Seconds between memory sweeps, and the most sessions one sweep estimates, so it never holds up the loop for long.
+MEMORY_SWEEP_INTERVAL = 1
+MEMORY_SWEEP_BATCH = 20
+
+
+class SessionManager:
+    """Starts, supervises and stops every `GameChannel`."""
+
+    def __init__(self, xyzzy):
+        self.xyzzy = xyzzy
+        self.sessions: Dict[int, GameChannel] = {}
+        self.tasks: Dict[int, asyncio.Task] = {}
+
+        # Sessions that count towards stats (ie. not debug games).
+        self.counted = 0
+        self.per_game: Dict[str, int] = {}
+        self.by_guild: Dict[int, Dict[int, GameChannel]] = {}
+        # Least recently active first. Activity always moves a session to the end, so this stays sorted.
+        self.activity: "OrderedDict[int, GameChannel]" = OrderedDict()
+        # Spectating channel ID -> the session it's spectating.
+        self.spectating: Dict[int, GameChannel] = {}
+        # Channels a session is being loaded in, that haven't been started yet.
+        self.reserved: Set[int] = set()
+        # (game name, "heap" or "interpreter") -> bytes, summed over each session's latest memory estimate.
+        self.memory: Dict[Tuple[str, str], int] = {}
+        # Channel IDs still to be estimated in the current round of the memory sweep.
+        self.memory_pending: deque = deque()
+        self.memory_sweeper = None
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def __bool__(self):
+        return bool(self.sessions)
+
+    def __contains__(self, channel_id: int) -> bool:
+        return channel_id in self.sessions
+
+    def __getitem__(self, channel_id: int) -> GameChannel:
+        return self.sessions[channel_id]
+
+    def __iter__(self) -> Iterator[GameChannel]:
+        return iter(self.sessions.values())
+
+    def get(self, channel_id: int) -> Optional[GameChannel]:
+        return self.sessions.get(channel_id)
+
+    def values(self):
+        return self.sessions.values()
+
+    def in_guild(self, guild_id: int) -> List[GameChannel]:
+        return list(self.by_guild.get(guild_id, {}).values())
+
+    def guild_count(self, guild_id: int) -> int:
+        return len(self.by_guild.get(guild_id, ()))
+
+    def watch(self, chan: GameChannel, channel) -> None:
+        """Mirrors a session's output to another channel."""
+        chan.spectators.add(channel)
+        self.spectating[channel.id] = chan
+
+    def unwatch(self, channel_id: int) -> Optional[GameChannel]:
+        """Stops a channel from spectating, returning the session it was spectating."""
+        chan = self.spectating.pop(channel_id, None)
+
+        if chan is not None:
+            chan.spectators.remove(channel_id)
+
+        return chan
+
+    def reserve(self, channel_id: int) -> bool:
+        """
+        Claims a channel for a session that's about to be loaded, so nothing else can start one there in the meantime.
+        Returns False if the channel is already playing or being loaded. The claim lasts until `start` or `release`.
+        """
+        if channel_id in self.sessions or channel_id in self.reserved:
+            return False
+
+        self.reserved.add(channel_id)
+        return True
+
+    def release(self, channel_id: int) -> None:
+        """Gives up a claim on a channel, if a session didn't start there after all."""
+        self.reserved.discard(channel_id)
+
+    def touch(self, chan: GameChannel, when) -> None:
+        """Records activity in a session."""
+        chan.last = when
+        chan.idle_warned = False
+        channel_id = chan.channel.id
+
+        if channel_id in self.activity:
+            self.activity.move_to_end(channel_id)
+
+    def idle(self, start: int = 0, amount: int = 20) -> List[GameChannel]:
+        """Returns a page of sessions, most idle first."""
+        return list(islice(self.activity.values(), start, start + amount))
+
+    def memory_of(self, chan: GameChannel) -> SessionMemory:
+        """A session's latest memory estimate, estimating it again first if it's older than `MEMORY_TTL`."""
+        if chan.memory is None or time.monotonic() - chan.memory.when >= MEMORY_TTL:
+            self._estimate_memory(chan)
+
+        return chan.memory
+
+    def _estimate_memory(self, chan: GameChannel) -> None:
+        self._count_memory(chan, -1)
+        chan.memory = chan.estimate_memory()
+        self._count_memory(chan, 1)
+
+    def _count_memory(self, chan: GameChannel, sign: int) -> None:
+        """Adds a session's latest memory estimate to the running totals, or takes it off them."""
+        if chan.memory is None:
+            return
+
+        for kind, size in (
+            ("heap", chan.memory.heap),
+            ("interpreter", chan.memory.interpreter or 0),
+        ):
+            key = (chan.game.name, kind)
+            self.memory[key] = self.memory.get(key, 0) + sign * size
+
+            if sign < 0 and not self.memory[key]:
+                del self.memory[key]
+
+    def _sweep_memory(self) -> None:
+        """
+        Estimates the memory of the next few sessions in turn, spreading a full round over about `MEMORY_TTL` seconds.
+        Keeps rescheduling itself for as long as there are sessions.
+        """
+        self.memory_sweeper = None
+
+        if not self.sessions:
+            self.memory_pending.clear()
+            return
+
+        if not self.memory_pending:
+            self.memory_pending.extend(self.sessions)
+
+        amount = min(
+            MEMORY_SWEEP_BATCH,
+            math.ceil(len(self.sessions) * MEMORY_SWEEP_INTERVAL / MEMORY_TTL),
+        )
+
+        while amount and self.memory_pending:
+            chan = self.sessions.get(self.memory_pending.popleft())
+
+            if chan is not None:
+                self._estimate_memory(chan)
+                amount -= 1
+
+        self.memory_sweeper = self.xyzzy.timers.schedule(
+            MEMORY_SWEEP_INTERVAL, self._sweep_memory
+        )
+
+    def _add(self, chan: GameChannel) -> None:
+        channel_id = chan.channel.id
+        self.reserved.discard(channel_id)
+        self.sessions[channel_id] = chan
+        self.activity[channel_id] = chan
+        self.by_guild.setdefault(chan.channel.guild.id, {})[channel_id] = chan
+
+        if not chan.game.debug:
+            self.counted += 1
+            self.per_game[chan.game.name] = self.per_game.get(chan.game.name, 0) + 1
+
+        # Estimated on the next sweep, rather than waiting for the round to come back to it.
+        self.memory_pending.appendleft(channel_id)
+
+        if self.memory_sweeper is None:
+            self.memory_sweeper = self.xyzzy.timers.schedule(
+                MEMORY_SWEEP_INTERVAL, self._sweep_memory
+            )
+
+    def _remove(self, chan: GameChannel) -> None:
+        channel_id = chan.channel.id
+        guild_id = chan.channel.guild.id
+        del self.sessions[channel_id]
+        del self.activity[channel_id]
+        del self.by_guild[guild_id][channel_id]
+
+        if not self.by_guild[guild_id]:
+            del self.by_guild[guild_id]
+
+        for spectator in chan.spectators:
+            self.spectating.pop(spectator.id, None)
+
+        self._count_memory(chan, -1)
+
+        if not chan.game.debug:
+            self.counted -= 1
+            self.per_game[chan.game.name] -= 1
+
+            if not self.per_game[chan.game.name]:
+                del self.per_game[chan.game.name]
+
+    async def start(self, chan: GameChannel) -> None:
+        """Registers a session, spawns its interpreter, and runs it in the background."""
+        channel_id = chan.channel.id
+
+        if channel_id in self.sessions:
+            # Only its transcript: the cleanup would delete the saves of the session that's running.
+            chan.transcript.close()
+            raise Exception("Channel is already running a session.")
+
+        self._add(chan)
+
+        try:
+            await chan.init_process()
+        except BaseException:
+            self._forget(chan)
+            raise
+
+        self.tasks[channel_id] = self.xyzzy.loop.create_task(self._run(chan))
+
+        if self.xyzzy.idle_timeout:
+            self._schedule_idle(chan, self.xyzzy.idle_timeout - self.xyzzy.idle_warning)
+
+    def _schedule_idle(self, chan: GameChannel, delay: float) -> None:
+        chan.idle_timer = self.xyzzy.timers.schedule(delay, self._check_idle, chan)
+
+    def _check_idle(self, chan: GameChannel):
+        """
+        Warns a session that it's about to be quit for being idle, or quits it.
+        Activity doesn't touch the timer, so this just works out from `chan.last` when to look again.
+        """
+        chan.idle_timer = None
+
+        if self.sessions.get(chan.channel.id) is not chan or not chan.playing:
+            return
+
+        timeout = self.xyzzy.idle_timeout
+        warning = self.xyzzy.idle_warning
+        idle = (discord.utils.utcnow() - chan.last).total_seconds()
+
+        if idle >= timeout:
+            return self._quit_idle(chan)
+
+        if warning and not chan.idle_warned and idle >= timeout - warning:
+            chan.idle_warned = True
+            self._schedule_idle(chan, timeout - idle)
+
+            return chan.channel.send(
+                "```diff\n"
+                "!Nobody has played for a while, so this game will be quit in {} minute(s).\n"
+                "-Send some input to keep it going.\n"
+                "```".format(max(1, round((timeout - idle) / 60)))
+            )
+
+        self._schedule_idle(
+            chan, (timeout if chan.idle_warned else timeout - warning) - idle
+        )
+
+    async def _quit_idle(self, chan: GameChannel) -> None:
+        await chan.channel.send(
+            "```diff\n-This game has been quit for being idle.\n```"
+        )
+        await self.stop(chan.channel.id)
+
+    async def _run(self, chan: GameChannel) -> None:
+        try:
+            await chan.game_loop()
+        except asyncio.CancelledError:
+            if chan.engine.process and chan.engine.process.returncode is None:
+                chan.engine.process.kill()
+
+            raise
+        except Exception as e:
+            trace = "".join(traceback.format_exception(type(e), e, e.__traceback__))
+            print("Session in #{} crashed.\n{}".format(chan.channel.name, trace))
+
+            if self.xyzzy.home_channel:
+                await self.xyzzy.home_channel.send(
+                    "Session crashed in `#{}` (`{}`)\n```py\n{}\n```".format(
+                        chan.channel.name, chan.game.name, trace[-1800:]
+                    )
+                )
+        finally:
+            self._forget(chan)
+
+        self.xyzzy.update_game()
+
+    def _forget(self, chan: GameChannel) -> None:
+        """Removes a session from the registry and deletes its save directory."""
+        channel_id = chan.channel.id
+        chan.stop_timers()
+        chan.cleanup()
+
+        if self.sessions.get(channel_id) is chan:
+            self._remove(chan)
+            self.tasks.pop(channel_id, None)
+
+    async def stop(self, channel_id: int) -> None:
+        """Force quits a session and waits for it to finish ending."""
+        chan = self.sessions.get(channel_id)
+        task = self.tasks.get(channel_id)
+
+        if chan is None:
+            return
+
+        await chan.force_quit()
+
+        if task is None:
+            return self._forget(chan)
+
+        done, _ = await asyncio.wait({task}, timeout=STOP_TIMEOUT)
+
+        if not done:
+            task.cancel()
+            await asyncio.wait({task})
+
+    async def shutdown(self) -> None:
+        """Kills every session at once. Used when the bot is closing, so no end-of-game messages are sent."""
+        tasks = list(self.tasks.values())
+        processes = [
+            x.engine.process for x in self.sessions.values() if x.engine.process
+        ]
+
+        for chan in list(self.sessions.values()):
+            await chan.force_quit()
+
+        for task in tasks:
+            task.cancel()
+
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        for chan in list(self.sessions.values()):
+            self._forget(chan)
+
+        if self.memory_sweeper is not None:
+            self.memory_sweeper.cancel()
+            self.memory_sweeper = None
+
+        # Reap the interpreters and drain their pipes, so nothing outlives the event loop.
+        if processes:
+            _, pending = await asyncio.wait(
+                [asyncio.ensure_future(_reap(x)) for x in processes],
+                timeout=STOP_TIMEOUT,
+            )
+
+            for process in processes:
+                if process.returncode is None:
+                    process.kill()
+
+            if pending:
+                await asyncio.wait(pending)
+
+
+async def _reap(process) -> None:
+    process.stdin.close()
+    await process.stdout.read()
+    await process.wait()
@@ -0,0 +1,100 @@
+"""
+Spectator mirroring, so one game can be followed from several channels without running more interpreters.
+Each page of game output becomes a `Frame` that is rendered once, and the same frame (and the same embed)
+is handed to every spectating channel through a `Broadcast`, in order, without holding up the game itself.
+"""
+
+from collections import deque
+from typing import Dict
+
+import asyncio
+import disnake as discord
+
+from modules.broadcast import Broadcast
+
+# Most channels that can spectate one game.
+MAX_SPECTATORS = 25
+# Most frames waiting to go out to spectators before the oldest get dropped.
+MAX_BACKLOG = 20
+
+
+class Frame:
+    """One page of game output, escaped and paginated already."""
+
+    __slots__ = ("text", "colour", "_embed")
+
+    def __init__(self, text: str, colour: discord.Colour):
+        self.text = text
+        self.colour = colour
+        self._embed = None
+
+    @property
+    def embed(self) -> discord.Embed:
+        if self._embed is None:
+            self._embed = discord.Embed(description=self.text, colour=self.colour)
+
+        return self._embed
+
+    def kwargs(self, embed_links: bool) -> dict:
+        """Arguments for `send`, as an embed if the channel allows it, otherwise as a quote."""
+        if embed_links:
+            return {"embed": self.embed}
+
+        return {"content": ">>> {}".format(self.text)}
+
+
+class Spectators:
+    """The channels spectating one game, and the frames still to be sent to them."""
+
+    def __init__(self, perms):
+        self.perms = perms
+        self.channels: Dict[int, discord.TextChannel] = {}
+        self.frames = deque()
+        self.task = None
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.channels)
+
+    def __contains__(self, channel_id: int) -> bool:
+        return channel_id in self.channels
+
+    def __iter__(self):
+        return iter(self.channels.values())
+
+    def add(self, channel) -> None:
+        self.channels[channel.id] = channel
+
+    def remove(self, channel_id: int) -> None:
+        self.channels.pop(channel_id, None)
+
+    def push(self, frame) -> None:
+        """Queues a `Frame`, or a plain notice, for every spectator."""
+        if not self.channels:
+            return
+
+        if len(self.frames) >= MAX_BACKLOG:
+            self.frames.popleft()
+            self.dropped += 1
+
+        self.frames.append(frame)
+
+        if self.task is None:
+            self.task = asyncio.ensure_future(self._pump())
+
+    def _render(self, frame):
+        if isinstance(frame, Frame):
+            return lambda x: frame.kwargs(self.perms.permissions(x).embed_links)
+
+        return lambda x: {"content": frame}
+
+    async def _pump(self):
+        try:
+            while self.frames and self.channels:
+                frame = self.frames.popleft()
+                await Broadcast(
+                    list(self.channels.values()), render=self._render(frame)
+                ).run()
+        finally:
+            self.task = None
+            self.frames.clear()
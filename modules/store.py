@@ -0,0 +1,243 @@
+"""
+SQLite-backed key/value store for bot data, replacing the old whole-file JSON rewrites.
+Values are JSON, grouped into namespaces (eg. "blocked_users"), and keyed by a string such as a guild ID.
+
+Writes go straight into an in-memory cache and are queued for a background thread,
+which commits everything that has queued up in a single transaction (group commit).
+Reads are served from the cache, and only go to the database the first time a key is asked for.
+A batch that fails to commit is retried a write at a time, so one bad write only loses itself.
+"""
+
+from typing import Any
+
+import os
+import json
+import time
+import queue
+import sqlite3
+import threading
+import traceback
+
+# Most writes a single transaction will take before committing.
+MAX_BATCH = 4096
+# Longest `flush` and `close` wait for the writer thread, in seconds.
+FLUSH_TIMEOUT = 30
+
+_DELETE = object()
+_STOP = object()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID
+"""
+UPSERT = (
+    "INSERT INTO kv (namespace, key, value) VALUES (?, ?, ?) "
+    "ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value"
+)
+DELETE = "DELETE FROM kv WHERE namespace = ? AND key = ?"
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class Namespace:
+    """Dict-like view over one namespace of a `Store`."""
+
+    def __init__(self, store: "Store", name: str):
+        self.store = store
+        self.name = name
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self.store.get(self.name, key)
+        return default if value is None else value
+
+    def __contains__(self, key: str) -> bool:
+        return self.store.get(self.name, key) is not None
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.store.get(self.name, key)
+
+        if value is None:
+            raise KeyError(key)
+
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.store.put(self.name, key, value)
+
+    def __delitem__(self, key: str) -> None:
+        self.store.delete(self.name, key)
+
+
+class Store:
+    """Key/value store with lazy reads and batched writes from a background thread."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.reader = _connect(path)
+        self.reader.execute(SCHEMA)
+        self.reader.commit()
+
+        self.cache = {}
+        self.queue = queue.SimpleQueue()
+        # Writes that couldn't be committed, and were dropped.
+        self.failed = 0
+        self.thread = threading.Thread(
+            target=self._writer, name="xyzzy-store", daemon=True
+        )
+        self.thread.start()
+
+    def namespace(self, name: str) -> Namespace:
+        return Namespace(self, name)
+
+    def get(self, namespace: str, key: str) -> Any:
+        """Returns the value for a key, or None. Hits the database at most once per key."""
+        try:
+            return self.cache[namespace, key]
+        except KeyError:
+            pass
+
+        row = self.reader.execute(
+            "SELECT value FROM kv WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        value = json.loads(row[0]) if row else None
+
+        self.cache[namespace, key] = value
+        return value
+
+    def put(self, namespace: str, key: str, value: Any) -> None:
+        """Sets a key. The value is visible immediately and written to disk shortly after."""
+        self.cache[namespace, key] = value
+        self.queue.put((namespace, key, json.dumps(value)))
+
+    def delete(self, namespace: str, key: str) -> None:
+        self.cache[namespace, key] = None
+        self.queue.put((namespace, key, _DELETE))
+
+    def flush(self, timeout: float = FLUSH_TIMEOUT) -> bool:
+        """
+        Blocks until every write queued so far has been dealt with, or `timeout` seconds have passed.
+        Returns False if it gave up waiting, or the writer thread isn't running.
+        """
+        if not self.thread.is_alive():
+            return False
+
+        done = threading.Event()
+        self.queue.put(done)
+        deadline = time.monotonic() + timeout
+
+        # Checking in on the thread means a writer that's died can't leave us waiting forever.
+        while not done.wait(min(1, max(0, deadline - time.monotonic()))):
+            if not self.thread.is_alive() or time.monotonic() >= deadline:
+                return False
+
+        return True
+
+    def close(self, timeout: float = FLUSH_TIMEOUT) -> None:
+        """Commits any outstanding writes and stops the writer thread."""
+        if self.thread.is_alive():
+            self.queue.put(_STOP)
+            self.thread.join(timeout)
+
+        self.reader.close()
+
+    def _writer(self):
+        conn = _connect(self.path)
+
+        while True:
+            item = self.queue.get()
+            batch = {}
+            waiters = []
+            stop = False
+
+            while True:
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch[item[0], item[1]] = item[2]
+
+                if stop or len(batch) >= MAX_BATCH:
+                    break
+
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            try:
+                if batch:
+                    self._commit(conn, batch)
+            finally:
+                # Whatever happened to the batch, nobody should be left waiting on it.
+                for done in waiters:
+                    done.set()
+
+            if stop:
+                break
+
+        conn.close()
+
+    def _commit(self, conn: sqlite3.Connection, batch: dict) -> None:
+        try:
+            with conn:
+                _write(conn, batch.items())
+
+            return
+        except Exception:
+            pass
+
+        # Find the writes at fault, and keep the rest.
+        for (namespace, key), value in batch.items():
+            try:
+                with conn:
+                    _write(conn, [((namespace, key), value)])
+            except Exception:
+                self.failed += 1
+                print(
+                    'Failed to write "{}" in store namespace "{}".'.format(
+                        key, namespace
+                    )
+                )
+                traceback.print_exc()
+
+
+def _write(conn: sqlite3.Connection, items) -> None:
+    items = list(items)
+    conn.executemany(UPSERT, ((k[0], k[1], v) for k, v in items if v is not _DELETE))
+    conn.executemany(DELETE, (k for k, v in items if v is _DELETE))
+
+
+def migrate_json(store: Store, namespace: str, path: str) -> bool:
+    """
+    One-time import of an old JSON data file into a namespace.
+    The file is renamed to "*.migrated" afterwards so it won't be imported again,
+    unless some of it couldn't be written, in which case it's left for the next start.
+    """
+    if not os.path.isfile(path):
+        return False
+
+    with open(path) as f:
+        data = json.load(f)
+
+    failed = store.failed
+
+    for key, value in data.items():
+        store.put(namespace, str(key), value)
+
+    if not store.flush() or store.failed != failed:
+        print('Couldn\'t import all of "{}", leaving it to try again.'.format(path))
+        return False
+
+    os.replace(path, path + ".migrated")
+
+    return True
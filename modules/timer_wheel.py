@@ -0,0 +1,127 @@
+"""
+Hashed timer wheel shared by every session, for democracy windows, tally edits and idle checks.
+Timers are dropped into one of a fixed number of slots by their deadline, and a single task turns the wheel.
+Each tick only looks at one slot, so the cost of a tick doesn't grow with the number of sessions,
+and cancelling a timer is just a flag that gets swept up the next time its slot comes around.
+"""
+
+from typing import Callable
+
+import math
+import time
+import asyncio
+import inspect
+import traceback
+
+
+class Timer:
+    __slots__ = ("callback", "args", "rounds", "cancelled")
+
+    def __init__(self, callback: Callable, args: tuple, rounds: int):
+        self.callback = callback
+        self.args = args
+        self.rounds = rounds
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class TimerWheel:
+    def __init__(self, tick: float = 0.5, size: int = 512, clock=time.monotonic):
+        self.tick = tick
+        self.size = size
+        self.clock = clock
+        self.origin = clock()
+        self.current = 0
+        self.pending = 0
+        self.slots = [[] for _ in range(size)]
+        self.task = None
+
+    def __len__(self):
+        return self.pending
+
+    def _now_tick(self) -> int:
+        return int((self.clock() - self.origin) / self.tick)
+
+    def schedule(self, delay: float, callback: Callable, *args) -> Timer:
+        """
+        Calls `callback(*args)` once `delay` seconds have passed, rounded up to the next tick.
+        If the callback returns an awaitable, it gets run as a task.
+        """
+        deadline = max(self.current, self._now_tick()) + max(
+            1, math.ceil(delay / self.tick)
+        )
+        timer = Timer(callback, args, (deadline - self.current - 1) // self.size)
+
+        self.slots[deadline % self.size].append(timer)
+        self.pending += 1
+
+        if self.task is None:
+            try:
+                self.task = asyncio.get_running_loop().create_task(self._run())
+            except RuntimeError:
+                # No running loop, whoever owns the wheel is turning it with `advance`.
+                pass
+
+        return timer
+
+    def advance(self) -> int:
+        """Processes every tick up until now, firing due timers. Returns how many fired."""
+        target = self._now_tick()
+        due = []
+
+        while self.current < target and self.pending:
+            self.current += 1
+            index = self.current % self.size
+            slot = self.slots[index]
+
+            if not slot:
+                continue
+
+            keep = []
+
+            for timer in slot:
+                if timer.cancelled:
+                    self.pending -= 1
+                elif timer.rounds:
+                    timer.rounds -= 1
+                    keep.append(timer)
+                else:
+                    self.pending -= 1
+                    due.append(timer)
+
+            self.slots[index] = keep
+
+        # Nothing left to wait for, so skip straight to now.
+        if not self.pending:
+            self.current = max(self.current, target)
+
+        for timer in due:
+            self._fire(timer)
+
+        return len(due)
+
+    def _fire(self, timer: Timer) -> None:
+        try:
+            res = timer.callback(*timer.args)
+
+            if inspect.isawaitable(res):
+                task = asyncio.ensure_future(res)
+                task.add_done_callback(_report)
+        except Exception:
+            traceback.print_exc()
+
+    async def _run(self):
+        try:
+            while self.pending:
+                await asyncio.sleep(self.tick)
+                self.advance()
+        finally:
+            self.task = None
+
+
+def _report(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception():
+        exc = task.exception()
+        traceback.print_exception(type(exc), exc, exc.__traceback__)
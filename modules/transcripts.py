@@ -0,0 +1,389 @@
+"""
+Compressed, append-only transcripts of every session's input and output.
+Sessions only put records on a queue. A background thread gathers them per session and writes them out in blocks,
+each one a separate gzip member, so the event loop never waits on disk and the file as a whole is still valid gzip.
+Every block gets an entry in a sidecar index (byte offset, compressed length, first record, record count),
+which lets `read_transcript` pull out a slice of records by decompressing only the blocks it needs.
+As each block's length is recorded, a block that failed partway through writing leaves bytes that are skipped
+when reading, though the file then stops being valid gzip as a whole.
+Files are rotated into numbered parts once they pass a set size, and deleted once they've gone unwritten for a set age.
+A part's files are only opened, in append mode, while a block is being written, so open sessions don't hold file handles.
+"""
+
+from typing import Callable, List, Optional, Tuple
+from modules.recap import INPUT, FRAME
+
+import os
+import gzip
+import itertools
+import time
+import queue
+import struct
+import threading
+import traceback
+
+# Record kind besides the recap's INPUT and FRAME, saying which game a transcript is of. Every part starts with one.
+META = 2
+
+# Uncompressed bytes a session can have waiting before they're written as a block.
+BLOCK_SIZE = 64 * 1024
+# Most seconds a record waits in memory before being written.
+FLUSH_INTERVAL = 5
+# Most records the writer takes off the queue at once.
+MAX_BATCH = 4096
+# Default compressed size a part can reach before the transcript moves onto the next part.
+ROTATE_SIZE = 1024 * 1024
+# Minimum seconds between reports of failed writes. Failures in between are counted and mentioned in the next one.
+ERROR_INTERVAL = 300
+# Most seconds `flush` and `close` wait on the writer thread.
+FLUSH_TIMEOUT = 30
+# Default seconds a transcript file is kept after it was last written to. 0 keeps them forever.
+MAX_AGE = 30 * 24 * 60 * 60
+# Seconds between looks for transcript files old enough to delete.
+PRUNE_INTERVAL = 60 * 60
+
+RECORD = struct.Struct("<BI")  # kind, length
+INDEX = struct.Struct(
+    "<QIII"
+)  # byte offset, compressed length, first record, record count
+
+_CLOSE = object()
+_STOP = object()
+
+
+class Transcript:
+    """Handle for one session's transcript. Recording is just a queue put."""
+
+    __slots__ = ("writer", "key", "closed")
+
+    def __init__(self, writer: "TranscriptWriter", key: str, game: str):
+        self.writer = writer
+        self.key = key
+        self.closed = False
+
+        writer.queue.put((key, META, game))
+
+    def record(self, kind: int, text: str) -> None:
+        if not self.closed:
+            self.writer.queue.put((self.key, kind, text))
+
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self.writer.queue.put((self.key, _CLOSE, None))
+
+
+class _Part:
+    """Writer thread state for a transcript that's open."""
+
+    __slots__ = (
+        "key",
+        "game",
+        "number",
+        "path",
+        "size",
+        "records",
+        "pending",
+        "pending_size",
+        "since",
+    )
+
+    def __init__(self, directory: str, key: str, game: str, number: int = 0):
+        self.key = key
+        self.game = game
+        self.number = number
+        self.path = os.path.join(directory, "{}.{}.xtr.gz".format(key, number))
+        self.size = 0
+        self.records = 0
+
+        # Carry on from where an existing part left off.
+        if os.path.exists(self.path + ".idx"):
+            self.size = os.path.getsize(self.path)
+
+            with open(self.path + ".idx", "rb") as f:
+                if f.seek(0, os.SEEK_END) >= INDEX.size:
+                    f.seek(-INDEX.size, os.SEEK_END)
+                    _, _, first, count = INDEX.unpack(f.read(INDEX.size))
+                    self.records = first + count
+
+        self.pending = []
+        self.pending_size = 0
+        self.since = None
+
+    def add(self, kind: int, text: str) -> None:
+        data = text.encode("utf-8", "replace")
+
+        if not self.pending:
+            self.since = time.monotonic()
+
+        self.pending.append(RECORD.pack(kind, len(data)) + data)
+        self.pending_size += RECORD.size + len(data)
+
+    def flush(self) -> None:
+        """Writes out what's pending as a block. If that fails, the block is dropped and the error raised."""
+        if not self.pending:
+            return
+
+        block = gzip.compress(b"".join(self.pending), mtime=0)
+        count = len(self.pending)
+        self.pending = []
+        self.pending_size = 0
+
+        with open(self.path, "ab") as f:
+            # Whatever is really at the end of the file, in case an earlier block only got partly written.
+            offset = f.tell()
+            f.write(block)
+
+        with open(self.path + ".idx", "ab") as f:
+            end = f.tell()
+
+            # Drop an entry that only got partly written.
+            if end % INDEX.size:
+                f.truncate(end - end % INDEX.size)
+
+            f.write(INDEX.pack(offset, len(block), self.records, count))
+
+        self.size = offset + len(block)
+        self.records += count
+
+
+class TranscriptWriter:
+    """Owns the transcript directory and the thread writing to it."""
+
+    def __init__(
+        self,
+        directory: str,
+        rotate_size: int = ROTATE_SIZE,
+        on_error: Optional[Callable[[str], None]] = None,
+        max_age: float = MAX_AGE,
+    ):
+        self.directory = directory
+        self.rotate_size = rotate_size
+        self.max_age = max_age
+        # Called from the writer thread with a report of failed writes, at most every `ERROR_INTERVAL` seconds.
+        # Without one, they're printed.
+        self.on_error = on_error
+        self.errors = 0
+        self.unreported = 0
+        self.last_error = None
+        # Tells apart transcripts of sessions started in the same channel in the same second.
+        self.count = itertools.count(1)
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(
+            target=self._writer, name="xyzzy-transcripts", daemon=True
+        )
+        self.thread.start()
+
+    def open(self, channel_id: int, game: str) -> Transcript:
+        """Starts a transcript for a new session."""
+        key = "{}-{}-{}".format(
+            channel_id,
+            time.strftime("%Y%m%d-%H%M%S", time.gmtime()),
+            next(self.count),
+        )
+        return Transcript(self, key, game)
+
+    def flush(self, timeout: float = FLUSH_TIMEOUT) -> bool:
+        """
+        Blocks until everything recorded so far is on disk, or `timeout` seconds have passed.
+        Returns False if it gave up waiting, or the writer thread isn't running.
+        """
+        if not self.thread.is_alive():
+            return False
+
+        done = threading.Event()
+        self.queue.put(done)
+        deadline = time.monotonic() + timeout
+
+        # Checking in on the thread means a writer that's died can't leave us waiting forever.
+        while not done.wait(min(1, max(0, deadline - time.monotonic()))):
+            if not self.thread.is_alive() or time.monotonic() >= deadline:
+                return False
+
+        return True
+
+    def close(self, timeout: float = FLUSH_TIMEOUT) -> None:
+        """Writes out whatever is pending, closes every transcript, and stops the thread."""
+        if self.thread.is_alive():
+            self.queue.put(_STOP)
+            self.thread.join(timeout)
+
+    def _failed(self, key: str, what: str) -> None:
+        """Reports the exception being handled, unless there's been a report too recently."""
+        self.errors += 1
+        now = time.monotonic()
+
+        if self.last_error is not None and now - self.last_error < ERROR_INTERVAL:
+            self.unreported += 1
+            return
+
+        msg = "Failed to {} transcript {}".format(what, key)
+
+        if self.unreported:
+            msg += " ({} more failures since the last report)".format(self.unreported)
+
+        msg += "\n" + traceback.format_exc()
+        self.last_error = now
+        self.unreported = 0
+
+        if self.on_error is None:
+            print(msg)
+            return
+
+        try:
+            self.on_error(msg)
+        except Exception:
+            traceback.print_exc()
+
+    def _write(self, parts, part: _Part) -> None:
+        try:
+            part.flush()
+        except (OSError, ValueError):
+            # Only this block is lost, and the transcript carries on with the next one.
+            self._failed(part.key, "write to")
+            return
+
+        # Transcripts that are closing don't need a next part.
+        if part.size < self.rotate_size or parts.get(part.key) is not part:
+            return
+
+        try:
+            parts[part.key] = _Part(
+                self.directory, part.key, part.game, part.number + 1
+            )
+            parts[part.key].add(META, part.game)
+        except (OSError, ValueError):
+            # Stays on the current part, and tries again after its next block.
+            self._failed(part.key, "rotate")
+
+    def _prune(self, parts) -> None:
+        """Deletes transcript files that haven't been written to for `max_age` seconds, besides those still open."""
+        cutoff = time.time() - self.max_age
+
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return self._failed("directory " + self.directory, "look through the")
+
+        for entry in entries:
+            key = entry.name.split(".", 1)[0]
+
+            if key in parts or not entry.name.endswith((".xtr.gz", ".xtr.gz.idx")):
+                continue
+
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                self._failed(entry.name, "delete")
+
+    def _writer(self):
+        parts = {}
+        stop = False
+        pruned = None
+
+        while not stop:
+            try:
+                item = self.queue.get(timeout=FLUSH_INTERVAL)
+            except queue.Empty:
+                item = None
+
+            waiters = []
+
+            for _ in range(MAX_BATCH):
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                elif item is not None:
+                    key, kind, text = item
+                    part = parts.get(key)
+
+                    if kind is _CLOSE:
+                        if part is not None:
+                            del parts[key]
+                            self._write(parts, part)
+                    elif part is None and kind == META:
+                        try:
+                            parts[key] = _Part(self.directory, key, text)
+                            parts[key].add(META, text)
+                        except OSError:
+                            self._failed(key, "start")
+                    elif part is not None:
+                        part.add(kind, text)
+
+                        if part.pending_size >= BLOCK_SIZE:
+                            self._write(parts, part)
+
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            now = time.monotonic()
+
+            try:
+                for part in list(parts.values()):
+                    if (
+                        stop
+                        or waiters
+                        or part.pending
+                        and now - part.since >= FLUSH_INTERVAL
+                    ):
+                        self._write(parts, part)
+            finally:
+                # Whatever happened to the writes, nobody should be left waiting on them.
+                for done in waiters:
+                    done.set()
+
+            if self.max_age and (pruned is None or now - pruned >= PRUNE_INTERVAL):
+                pruned = now
+                self._prune(parts)
+
+        remaining = list(parts.values())
+        parts.clear()
+
+        for part in remaining:
+            self._write(parts, part)
+
+
+def read_transcript(
+    path: str, start: int = 0, stop: int = None
+) -> List[Tuple[int, str]]:
+    """
+    Reads records `start` to `stop` (exclusive) of a transcript part, as (kind, text) pairs.
+    Only the blocks holding those records are decompressed.
+    """
+    with open(path + ".idx", "rb") as f:
+        index = f.read()
+
+    # Leaving off an entry that's still being written, or was only partly written.
+    index = INDEX.iter_unpack(index[: len(index) - len(index) % INDEX.size])
+    out = []
+
+    with open(path, "rb") as f:
+        for offset, length, first, count in index:
+            if first + count <= start:
+                continue
+
+            if stop is not None and first >= stop:
+                break
+
+            f.seek(offset)
+            data = gzip.decompress(f.read(length))
+            pos = 0
+
+            for number in range(first, first + count):
+                kind, length = RECORD.unpack_from(data, pos)
+                pos += RECORD.size
+
+                if number >= start and (stop is None or number < stop):
+                    out.append(
+                        (kind, data[pos : pos + length].decode("utf-8", "replace"))
+                    )
+
+                pos += length
+
+    return out
@@ -12,8 +12,21 @@ if not shutil.which("dfrotz"):
         'dfrotz not detected to be in PATH. If you do not have frotz in dumb mode, refer to "https://github.com/DavidGriffith/frotz/blob/master/INSTALL#L78", and then move the dfrotz executable to somewhere that is in PATH, for example /usr/bin.'
     )
 
-from modules.command_sys import Context, Holder
+from modules.command_sys import ArgumentParseError, Context, Envelope, Holder
 from modules.game import Game
+from modules.perm_cache import PermissionCache
+from modules.block_index import BlockIndex
+from modules.store import Store, migrate_json
+from modules.rate_limit import RateLimiter
+from modules.input_queue import QueuePolicy
+from modules.sessions import SessionManager
+from modules.timer_wheel import TimerWheel
+from modules.presence import PresencePublisher, PRESENCE_INTERVAL
+from modules.recap import RECAP_SIZE
+from modules.transcripts import TranscriptWriter, ROTATE_SIZE, MAX_AGE
+from modules.loop_monitor import LoopMonitor, LAG_INTERVAL
+from modules.metrics import MetricsServer
+from modules.command_stats import CommandStats
 from datetime import datetime
 from glob import glob
 from random import randint
@@ -59,7 +72,7 @@ class ConsoleColours:
 
 class Xyzzy(discord.Client):
     home_channel: discord.TextChannel
-    prefix: re.Pattern
+    prefix: typing.Optional[re.Pattern]
 
     def __init__(self):
         print(ConsoleColours.HEADER + "Welcome to Xyzzy, v2.0." + ConsoleColours.END)
@@ -70,6 +83,7 @@ class Xyzzy(discord.Client):
 
         self.config = {}
         self.timestamp = 0
+        self.prefix = None
 
         print('Reading "options.cfg".')
 
@@ -120,45 +134,82 @@ class Xyzzy(discord.Client):
             print('Creating save cache directory at "./save-cache/"')
             os.makedirs("./save-cache/")
 
-        try:
-            print("Loading blocked user list...")
+        transcript_dir = self.config.get("transcript_dir", "./transcripts/")
 
-            with open("./bot-data/blocked_users.json") as blk:
-                self.blocked_users = json.load(blk)
-        except FileNotFoundError:
-            print(
-                ConsoleColours.WARNING
-                + "Blocked user list not found. Creating new blocked user list..."
-                + ConsoleColours.END
-            )
+        if not os.path.exists(transcript_dir):
+            print('Creating transcript directory at "{}"'.format(transcript_dir))
+            os.makedirs(transcript_dir)
 
-            with open("./bot-data/blocked_users.json", "w") as blk:
-                blk.write("{}")
-                self.blocked_users = {}
+        print("Opening bot data store...")
 
-        try:
-            print("Loading server settings...")
+        self.store = Store("./bot-data/xyzzy.db")
 
-            with open("./bot-data/server_settings.json") as srv:
-                self.server_settings = json.load(srv)
-        except FileNotFoundError:
-            print(
-                ConsoleColours.WARNING
-                + "Server settings not found. Creating new server settings file.."
-                + ConsoleColours.END
-            )
+        for name in ("blocked_users", "server_settings"):
+            if migrate_json(self.store, name, "./bot-data/{}.json".format(name)):
+                print(
+                    ConsoleColours.WARNING
+                    + 'Migrated "{}.json" into the data store.'.format(name)
+                    + ConsoleColours.END
+                )
 
-            with open("./bot-data/server_settings.json", "w") as srv:
-                srv.write("{}")
-                self.server_settings = {}
+        self.blocked_users = BlockIndex(self.store.namespace("blocked_users"))
+        self.server_settings = self.store.namespace("server_settings")
 
         self.process = None
         self.thread = None
         self.queue = None
-        self.channels = {}
+        self.timers = TimerWheel()
+        self.transcripts = TranscriptWriter(
+            transcript_dir,
+            int(
+                float(self.config.get("transcript_rotate_size", ROTATE_SIZE / 1024))
+                * 1024
+            ),
+            self.on_transcript_error,
+            float(self.config.get("transcript_keep_days", MAX_AGE / 86400)) * 86400,
+        )
+        self.sessions = SessionManager(self)
+        self.presence = PresencePublisher(
+            self, float(self.config.get("presence_interval", PRESENCE_INTERVAL))
+        )
+        # The stall threshold is in milliseconds, and 0 leaves the detector off.
+        self.loop_monitor = LoopMonitor(
+            self,
+            float(self.config.get("loop_lag_interval", LAG_INTERVAL)),
+            float(self.config.get("slow_callback_threshold", 0)) / 1000,
+        )
+        self.metrics = None
+
+        if self.config.get("metrics_port"):
+            self.metrics = MetricsServer(
+                self,
+                self.config.get("metrics_host", "127.0.0.1"),
+                int(self.config["metrics_port"]),
+            )
+
+        self.perms = PermissionCache()
+        self.command_limits = RateLimiter("command", self.config)
+        self.input_limits = RateLimiter("input", self.config)
+        self.input_queue_size = max(1, int(self.config.get("input_queue_size", 10)))
+        self.input_queue_policy = QueuePolicy[
+            self.config.get("input_queue_policy", "drop_oldest").strip().upper()
+        ]
+
+        # KiB, converted to bytes.
+        self.recap_size = int(
+            float(self.config.get("recap_size", RECAP_SIZE / 1024)) * 1024
+        )
+
+        # Minutes, converted to seconds. A timeout of 0 never quits idle games.
+        self.idle_timeout = float(self.config.get("idle_timeout", 60)) * 60
+        self.idle_warning = min(
+            float(self.config.get("idle_warning", 5)) * 60, self.idle_timeout
+        )
 
         self.session = aiohttp.ClientSession()
         self.commands = Holder(self)
+        self.command_stats = CommandStats(self)
+        self.commands.middleware.append(self.command_stats)
 
         if os.listdir("./saves"):
             print("Cleaning out saves directory after reboot.")
@@ -174,20 +225,22 @@ class Xyzzy(discord.Client):
 
         super().__init__()
 
-    def game_count(self):
-        return sum(1 for i in self.channels.values() if i.game and not i.game.debug)
+    async def close(self):
+        self.loop_monitor.stop()
 
-    async def update_game(self):
-        game = "nothing yet!"
+        if self.metrics:
+            await self.metrics.stop()
 
-        if self.game_count():
-            game = "{} game{}.".format(
-                self.game_count(), "s" if len(self.channels) > 1 else ""
-            )
+        await self.sessions.shutdown()
+        await super().close()
+        self.transcripts.close()
+        self.store.close()
 
-        game += " | @xyzzy help"
+    def game_count(self):
+        return self.sessions.counted
 
-        await self.change_presence(activity=discord.Game(name=game))
+    def update_game(self):
+        self.presence.request()
 
     async def handle_error(self, ctx, exc):
         trace = "".join(traceback.format_tb(exc.__traceback__))
@@ -247,7 +300,13 @@ class Xyzzy(discord.Client):
                     + ConsoleColours.END
                 )
 
-        await self.update_game()
+        self.loop_monitor.start()
+
+        if self.metrics:
+            await self.metrics.start()
+
+        # The presence doesn't survive a reconnect, so always send it here.
+        await self.presence.publish(force=True)
 
         if not self.timestamp:
             self.timestamp = datetime.utcnow().timestamp()
@@ -292,6 +351,15 @@ class Xyzzy(discord.Client):
 
             self.post_loop = await posts.task_loop(self)
 
+    def on_transcript_error(self, msg: str):
+        """Called from the transcript writer's thread when it fails to write."""
+        print(msg)
+
+        if getattr(self, "home_channel", None):
+            asyncio.run_coroutine_threadsafe(
+                self.home_channel.send("```py\n{}\n```".format(msg[-1900:])), self.loop
+            )
+
     async def on_guild_join(self, guild: discord.Guild):
         print('I have been added to "{}".'.format(guild.name))
 
@@ -302,71 +370,83 @@ class Xyzzy(discord.Client):
 
     async def on_guild_remove(self, guild: discord.Guild):
         print('I have been removed from "{}".'.format(guild.name))
+        self.perms.invalidate_guild(guild.id)
 
         if self.home_channel:
             await self.home_channel.send(
                 'I have been removed from "{0.name}" (ID: {0.id}).'.format(guild)
             )
 
+    async def on_guild_update(self, before: discord.Guild, after: discord.Guild):
+        self.perms.invalidate_guild(after.id)
+
+    async def on_guild_role_create(self, role: discord.Role):
+        self.perms.invalidate_guild(role.guild.id)
+
+    async def on_guild_role_delete(self, role: discord.Role):
+        self.perms.invalidate_guild(role.guild.id)
+
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role):
+        self.perms.invalidate_guild(after.guild.id)
+
+    async def on_guild_channel_update(self, before, after):
+        # Categories can sync their overwrites down to every child channel.
+        if isinstance(after, discord.CategoryChannel):
+            self.perms.invalidate_guild(after.guild.id)
+        else:
+            self.perms.invalidate_channel(after.id)
+
+    async def on_guild_channel_delete(self, channel):
+        self.perms.invalidate_channel(channel.id)
+
+    async def on_thread_delete(self, thread):
+        self.perms.invalidate_channel(thread.id)
+
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        if after.id == self.user.id:
+            self.perms.invalidate_guild(after.guild.id)
+
     async def on_message(self, msg: discord.Message):
         # don't check message if no prefix
-        if 'prefix' not in dir(self): return
+        if self.prefix is None or msg.author.bot or msg.author.id == self.user.id:
+            return
 
-        is_reply_to_me = (
-            msg.reference
-            and isinstance(msg.reference.resolved, discord.Message)
-            and msg.reference.resolved.author.id == self.user.id
-        )
+        env = Envelope.parse(msg, self)
 
-        if (
-            msg.author.bot
-            or msg.author.id == self.user.id
-            or (
-                msg.guild
-                and not msg.channel.permissions_for(msg.guild.me).send_messages
-            )
-            or (not self.prefix.match(msg.content) and not is_reply_to_me)
+        if env is None or (
+            msg.guild and not self.perms.permissions(msg.channel).send_messages
         ):
             return
 
-        if msg.guild and (
-            (
-                str(msg.guild.id) in self.blocked_users
-                and str(msg.author.id) in self.blocked_users[str(msg.guild.id)]
-            )
-            or (
-                "global" in self.blocked_users
-                and str(msg.author.id) in self.blocked_users["global"]
-            )
-        ):
+        if msg.guild and self.blocked_users.is_blocked(msg.guild.id, msg.author.id):
+            if not self.blocked_users.should_notify(msg.author.id):
+                return
+
             return await msg.author.send(
                 "```diff\n"
                 '!An administrator has disabled your ability to submit commands in "{}"\n'
                 "```".format(msg.guild.name)
             )
 
-        # Take plain message content if it's a reply to us, otherwise force prefix match
-        clean = (
-            msg.content
-            if is_reply_to_me
-            else typing.cast(re.Match, self.prefix.match(msg.content))[1].strip()
-        )
-        is_game_cmd = clean.startswith(">")
+        clean = env.clean
 
         # Without this, an error is thrown below due to only one character.
         if len(clean) == 0:
             return
 
         # Send game input if a game is running.
-        if (
-            is_game_cmd
-            and msg.channel.id in self.channels
-            and self.channels[msg.channel.id].playing
-        ):
-            channel = self.channels[msg.channel.id]
-            channel.last = msg.created_at
+        if clean[0] == ">":
+            channel = self.sessions.get(msg.channel.id)
 
-            return await channel.handle_input(msg, clean[1:].strip())
+            if channel is not None and channel.playing:
+                if not self.input_limits.allow(
+                    msg.author.id, msg.channel.id, msg.guild and msg.guild.id
+                ):
+                    return
+
+                self.sessions.touch(channel, msg.created_at)
+
+                return await channel.handle_input(msg, clean[1:].strip())
 
         if clean == "get ye flask":
             return await msg.channel.send("You can't get ye flask!")
@@ -374,16 +454,20 @@ class Xyzzy(discord.Client):
         if CAH_REGEX.match(clean):
             return await msg.channel.send("no")
 
-        if not self.commands.get_command(clean.split(" ")[0]):
+        if not self.commands.get_command(env.cmd):
             return
 
-        try:
-            ctx = Context(msg, self)
-        except ValueError:
-            return await msg.channel.send("Shlex error.")
+        if not self.command_limits.allow(
+            msg.author.id, msg.channel.id, msg.guild and msg.guild.id
+        ):
+            return
+
+        ctx = Context(msg, self, env)
 
         try:
             await self.commands.run(ctx)
+        except ArgumentParseError:
+            await msg.channel.send("Shlex error.")
         except Exception as e:
             await self.handle_error(ctx, e)
 